@@ -0,0 +1,316 @@
+"""
+预约分析 - 列式存储的预约事实表，按 天/周/月 × 诊所 × 服务 分组计数
+
+每个预约是一行：日期（1970-01-01 起的天数）、诊所、服务、状态。诊所、服务和状态
+做字典编码，各列保存在紧凑的数组中（array 模块，每行 13 字节）。
+安装了 NumPy 时查询直接在数组缓冲区上向量化计算（零拷贝）；否则用查找表把日期
+映射到分组，在 C 实现的 Counter 中一次计数。NumPy 在第一次查询时才导入（导入
+需要上百毫秒，不计入冷启动）。
+
+写入和查询共用一把锁（查询期间数组缓冲区被 NumPy 引用，不能扩容）。
+"""
+
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from memory_usage import cache_sizeof, deep_sizeof, sampled_sizeof
+
+np = None  # NumPy 是可选依赖，由 _numpy() 在第一次查询时导入
+_numpy_checked = False
+
+EPOCH = date(1970, 1, 1)
+BUCKETS = ("day", "week", "month", "none")
+DIMENSIONS = ("clinic", "service")
+
+Group = Tuple[int, int, int, int]  # (时间分组, 诊所编码, 服务编码, 数量)
+
+
+@lru_cache(maxsize=65536)
+def day_number(value: str) -> int:
+    """YYYY-MM-DD -> 1970-01-01 起的天数"""
+    return (date.fromisoformat(value) - EPOCH).days
+
+
+def _numpy():
+    """导入 NumPy（只尝试一次）；没有安装时返回 None"""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+        _numpy_checked = True
+    return np
+
+
+def day_label(day: int) -> str:
+    return (EPOCH + timedelta(days=day)).isoformat()
+
+
+def bucket_of(day: int, bucket: str) -> int:
+    """天数 -> 分组编号：天、周（周一开始，用周一的天数表示）、月（年 * 12 + 月 - 1）"""
+    if bucket == "day":
+        return day
+    if bucket == "week":
+        return day - (day + 3) % 7  # 1970-01-01 是星期四
+    if bucket == "month":
+        d = EPOCH + timedelta(days=day)
+        return d.year * 12 + d.month - 1
+    return 0
+
+
+def bucket_label(key: int, bucket: str) -> Optional[str]:
+    if bucket in ("day", "week"):
+        return day_label(key)
+    if bucket == "month":
+        return f"{key // 12:04d}-{key % 12 + 1:02d}"
+    return None
+
+
+class Dictionary:
+    """字典编码：值 <-> 整数编码"""
+
+    __slots__ = ("codes", "values")
+
+    def __init__(self):
+        self.codes: Dict[Any, int] = {}
+        self.values: List[Any] = []
+
+    def encode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class AppointmentFacts:
+    """预约事实表（列式）"""
+
+    def __init__(self):
+        self.day = array("i")
+        self.clinic = array("i")
+        self.service = array("i")
+        self.status = array("b")
+        self.clinics = Dictionary()
+        self.services = Dictionary()
+        self.statuses = Dictionary()
+        self._rows: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    @property
+    def backend(self) -> str:
+        return "numpy" if _numpy() is not None else "python"
+
+    def load(self, appointments: Iterable[dict]):
+        for appointment in appointments:
+            self.apply(appointment)
+        return self
+
+    def apply(self, appointment: dict):
+        """新增或更新一行（取消改状态，改约改日期）"""
+        try:
+            day = day_number(appointment["date"])
+        except (KeyError, TypeError, ValueError):
+            return
+        with self._lock:
+            status = self.statuses.encode(appointment.get("status"))
+            row = self._rows.get(appointment["id"])
+            if row is not None:
+                self.day[row] = day
+                self.status[row] = status
+                return
+            self._rows[appointment["id"]] = len(self.day)
+            self._append(day, appointment["clinic_id"], appointment.get("service"), appointment.get("status"))
+
+    def append(self, day: int, clinic_id: str, service: str, status: str):
+        """追加一行（不按预约 ID 索引，用于导入历史数据）"""
+        with self._lock:
+            self._append(day, clinic_id, service, status)
+
+    def _append(self, day: int, clinic_id: str, service: str, status: str):
+        self.day.append(day)
+        self.clinic.append(self.clinics.encode(clinic_id))
+        self.service.append(self.services.encode(service))
+        self.status.append(self.statuses.encode(status))
+
+    def extend_encoded(self, days: Sequence[int], clinics: Sequence[int], services: Sequence[int],
+                       statuses: Sequence[int]):
+        """批量追加已编码的列（编码需来自本表的字典）"""
+        with self._lock:
+            self.day.extend(days)
+            self.clinic.extend(clinics)
+            self.service.extend(services)
+            self.status.extend(statuses)
+
+    def nbytes(self) -> int:
+        return sum(col.itemsize * len(col) for col in (self.day, self.clinic, self.service, self.status))
+
+    def query(
+        self,
+        group_by: Sequence[str] = DIMENSIONS,
+        bucket: str = "day",
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        status: Optional[str] = None,
+        clinic_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """分组计数；start/end 为日期（含），status/clinic_id 为过滤条件"""
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket 必须是 {', '.join(BUCKETS)} 之一")
+        dims = [d for d in DIMENSIONS if d in group_by]
+        unknown = set(group_by) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"不支持的分组维度: {', '.join(sorted(unknown))}")
+        started = time.perf_counter()
+        filters = {
+            "start": day_number(start) if start else None,
+            "end": day_number(end) if end else None,
+            "status": self.statuses.codes.get(status, -1) if status else None,
+            "clinic": self.clinics.codes.get(clinic_id, -1) if clinic_id else None
+        }
+        with self._lock:
+            if _numpy() is not None:
+                groups = self._query_numpy(dims, bucket, filters)
+            else:
+                groups = self._query_python(dims, bucket, filters)
+        labels = {p: bucket_label(p, bucket) for p in {g[0] for g in groups}}
+        clinics, services = self.clinics.values, self.services.values
+        rows = []
+        for period, clinic, service, count in groups:
+            row: Dict[str, Any] = {}
+            if bucket != "none":
+                row["period"] = labels[period]
+            if "clinic" in dims:
+                row["clinic_id"] = clinics[clinic]
+            if "service" in dims:
+                row["service"] = services[service]
+            row["count"] = count
+            rows.append(row)
+        return {
+            "bucket": bucket,
+            "group_by": dims,
+            "rows": rows,
+            "total": sum(g[3] for g in groups),
+            "scanned_rows": len(self),
+            "backend": self.backend,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+
+    def _query_numpy(self, dims: List[str], bucket: str, filters: dict) -> List[Group]:
+        n = len(self.day)
+        if n == 0:
+            return []
+        day = np.frombuffer(self.day, dtype=np.int32, count=n)
+        mask = None
+
+        def restrict(condition):
+            nonlocal mask
+            mask = condition if mask is None else mask & condition
+
+        if filters["start"] is not None:
+            restrict(day >= filters["start"])
+        if filters["end"] is not None:
+            restrict(day <= filters["end"])
+        if filters["status"] is not None:
+            restrict(np.frombuffer(self.status, dtype=np.int8, count=n) == filters["status"])
+        if filters["clinic"] is not None:
+            restrict(np.frombuffer(self.clinic, dtype=np.int32, count=n) == filters["clinic"])
+        if mask is not None:
+            day = day[mask]
+        if day.size == 0:
+            return []
+
+        # 时间分组：周直接计算，月通过覆盖数据范围的天 -> 月查找表
+        if bucket == "day":
+            period = day.astype(np.int64)
+        elif bucket == "week":
+            period = (day - (day + 3) % 7).astype(np.int64)
+        elif bucket == "month":
+            low, high = int(day.min()), int(day.max())
+            table = np.array([bucket_of(d, "month") for d in range(low, high + 1)], dtype=np.int64)
+            period = table[day - low]
+        else:
+            period = np.zeros(day.size, dtype=np.int64)
+
+        # 把 (时间, 诊所, 服务) 合成一个整数键
+        n_clinics = len(self.clinics) if "clinic" in dims else 1
+        n_services = len(self.services) if "service" in dims else 1
+        base = int(period.min())
+        key = period - base
+        for name, size in (("clinic", n_clinics), ("service", n_services)):
+            if name in dims:
+                column = np.frombuffer(getattr(self, name), dtype=np.int32, count=n)
+                key = key * size + (column[mask] if mask is not None else column)
+            else:
+                key = key * size
+        # 键空间不大时用 bincount（O(n)），否则排序去重
+        span = int(key.max()) + 1
+        if span <= 8 * key.size + (1 << 20):
+            counts = np.bincount(key, minlength=span)
+            keys = np.flatnonzero(counts)
+            counts = counts[keys]
+        else:
+            keys, counts = np.unique(key, return_counts=True)
+        services = keys % n_services
+        clinics = (keys // n_services) % n_clinics
+        periods = keys // (n_services * n_clinics) + base
+        return list(zip(periods.tolist(), clinics.tolist(), services.tolist(), counts.tolist()))
+
+    def _query_python(self, dims: List[str], bucket: str, filters: dict) -> List[Group]:
+        start, end, status, clinic = filters["start"], filters["end"], filters["status"], filters["clinic"]
+        n = len(self.day)
+        if n == 0:
+            return []
+        # 天 -> 分组的查找表
+        if bucket == "day":
+            table = None
+        else:
+            low, high = min(self.day), max(self.day)
+            table = {d: bucket_of(d, bucket) for d in range(low, high + 1)}
+        clinics = self.clinic if "clinic" in dims else bytes(n)
+        services = self.service if "service" in dims else bytes(n)
+        if start is None and end is None and status is None and clinic is None:
+            # 无过滤条件：map 和 zip 都在 C 层逐行处理
+            periods = self.day if table is None else map(table.__getitem__, self.day)
+            groups = Counter(zip(periods, clinics, services))
+        else:
+            groups = Counter(
+                (d if table is None else table[d], c, s)
+                for d, c, s, st, cl in zip(self.day, clinics, services, self.status, self.clinic)
+                if (start is None or d >= start) and (end is None or d <= end)
+                and (status is None or st == status) and (clinic is None or cl == clinic)
+            )
+        return sorted(key + (count,) for key, count in groups.items())
+
+    def memory_usage(self) -> Dict[str, int]:
+        """各部分的大致内存占用（字节）"""
+        with self._lock:
+            return {
+                "columns": self.nbytes(),
+                "dictionaries": sum(deep_sizeof(d.codes) + deep_sizeof(d.values)
+                                    for d in (self.clinics, self.services, self.statuses)),
+                "row_index": sampled_sizeof(self._rows),
+                "day_cache": cache_sizeof(day_number)
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows": len(self),
+            "bytes": self.nbytes(),
+            "clinics": len(self.clinics),
+            "services": len(self.services),
+            "backend": self.backend
+        }
@@ -0,0 +1,457 @@
+"""
+预约存储 - 按 ID 索引预约，并维护 (诊所, 日期, 时间) 时段占用索引
+
+所有写入都经过事务：在锁内校验时段、写入存储后端（一次存储事务），
+成功后再更新内存索引，因此批量预约要么全部生效，要么全部不生效。
+按状态、按日期的统计计数随每次写入增量更新。
+
+每次变更给记录分配一个全局递增的序号（保存在记录的 seq 字段），并写入有界的
+变更日志，客户端可以只拉取某个序号之后的变更（增量同步）。
+
+内存中每个预约是一个 AppointmentRecord（__slots__，不带每条记录的字典）：
+诊所、服务、状态、日期等重复率高的字符串驻留后所有记录共享，时间戳存为整数。
+记录按只读映射的方式读取（["id"]、.get），到响应、事件和存储边界才用 to_dict()
+转换回原来的字典形状。
+"""
+
+import bisect
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from memory_usage import deep_sizeof, sampled_sizeof, shell_sizeof
+from storage import MemoryBackend, put_ops
+
+APPOINTMENTS_KIND = "appointments"
+
+# 占用时段的预约状态
+ACTIVE_STATUSES = ("confirmed",)
+
+SlotKey = Tuple[str, str, str]
+
+# 变更日志条目: (序号, 操作, 预约 ID, 诊所 ID)
+Change = Tuple[int, str, str, str]
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+
+
+# 常驻字段（__slots__）；少见的字段（取消原因、改约信息等）放在 extra 字典中
+RECORD_FIELDS = (
+    "id", "clinic_id", "clinic_name", "date", "time", "service", "patient_name",
+    "patient_email", "patient_phone", "virtual_phone", "status", "notes", "created_at", "seq"
+)
+_SLOT_FIELDS = frozenset(RECORD_FIELDS)
+# 重复率高的字符串字段：驻留后所有记录共享同一个字符串对象（同一患者的多个预约也共享）
+INTERNED_FIELDS = frozenset((
+    "clinic_id", "clinic_name", "date", "time", "service", "status", "cancel_reason",
+    "patient_name", "patient_email", "patient_phone"
+))
+# 时间戳字段：本地时间的 ISO 字符串存为 1970-01-01 起的微秒数
+TIMESTAMP_FIELDS = frozenset(("created_at", "cancelled_at", "updated_at"))
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_MISSING = object()
+
+
+def pack_timestamp(value: Any) -> Any:
+    """ISO 时间字符串 -> 整数微秒；带时区或无法原样还原的值保持不变"""
+    if not isinstance(value, str):
+        return value
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    # 只转换 isoformat() 的标准输出（19 位，或带微秒的 26 位），保证能原样还原
+    if parsed.tzinfo is not None or len(value) != (26 if parsed.microsecond else 19) or value[10] != "T":
+        return value
+    return (parsed - _EPOCH) // _MICROSECOND
+
+
+def unpack_timestamp(value: Any) -> Any:
+    if type(value) is int:
+        return (_EPOCH + timedelta(microseconds=value)).isoformat()
+    return value
+
+
+class AppointmentRecord(Mapping):
+    """紧凑的预约记录，按只读映射读取，to_dict() 还原为原来的字典"""
+
+    __slots__ = RECORD_FIELDS + ("extra",)
+
+    def __init__(self, data: Mapping):
+        self.extra: Optional[Dict[str, Any]] = None
+        intern = sys.intern
+        for key, value in data.items():
+            if key in TIMESTAMP_FIELDS:
+                value = pack_timestamp(value)
+            elif key in INTERNED_FIELDS and type(value) is str:
+                value = intern(value)
+            if key in _SLOT_FIELDS:
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def __setitem__(self, key: str, value: Any):
+        if key in TIMESTAMP_FIELDS:
+            value = pack_timestamp(value)
+        elif key in INTERNED_FIELDS and type(value) is str:
+            value = sys.intern(value)
+        if key in _SLOT_FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _SLOT_FIELDS:
+            try:
+                value = getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self.extra is not None and key in self.extra:
+            value = self.extra[key]
+        else:
+            raise KeyError(key)
+        return unpack_timestamp(value) if key in TIMESTAMP_FIELDS else value
+
+    def __iter__(self) -> Iterator[str]:
+        for key in RECORD_FIELDS:
+            if getattr(self, key, _MISSING) is not _MISSING:
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"AppointmentRecord({self.to_dict()!r})"
+
+    def update(self, changes: Mapping):
+        for key, value in changes.items():
+            self[key] = value
+
+    def to_dict(self) -> dict:
+        data = {}
+        for key in RECORD_FIELDS:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                data[key] = value
+        if self.extra:
+            data.update(self.extra)
+        for key in TIMESTAMP_FIELDS:
+            value = data.get(key)
+            if type(value) is int:
+                data[key] = unpack_timestamp(value)
+        return data
+
+
+class AppointmentNotFound(KeyError):
+    """预约不存在"""
+
+
+class AppointmentNotActive(ValueError):
+    """预约已取消，不能再修改"""
+
+
+class SlotTaken(Exception):
+    """时段已被预约"""
+
+    def __init__(self, slot: SlotKey, appointment_id: str):
+        super().__init__(f"时段已被预约: {slot}")
+        self.slot = slot
+        self.appointment_id = appointment_id
+
+
+def slot_key(appointment: dict) -> SlotKey:
+    """预约占用的时段"""
+    return (appointment["clinic_id"], appointment["date"], appointment["time"])
+
+
+class Transaction:
+    """存储事务 - 暂存写入，提交时一次性写入后端并更新索引"""
+
+    def __init__(self, store: "AppointmentStore"):
+        self._store = store
+        self._inserts: List[dict] = []
+        self._slots: Dict[SlotKey, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._inserts)
+
+    def check_slot(self, slot: SlotKey):
+        """检查时段是否可用（包括本事务中已暂存的预约）"""
+        taken_by = self._store._slots.get(slot) or self._slots.get(slot)
+        if taken_by:
+            raise SlotTaken(slot, taken_by)
+
+    def insert(self, appointment: dict):
+        """暂存新预约并占用其时段"""
+        if appointment.get("status") in ACTIVE_STATUSES:
+            slot = slot_key(appointment)
+            self.check_slot(slot)
+            self._slots[slot] = appointment["id"]
+        self._inserts.append(appointment)
+
+
+class AppointmentStore:
+    """
+    预约存储
+
+    对外兼容原来 ``appointments_data`` 列表的读取方式（迭代、``len``），
+    另外提供按 ID 的 O(1) 查找和时段占用检查。
+    """
+
+    def __init__(self, backend=None, change_log_size: int = 100000):
+        self.backend = backend or MemoryBackend()
+        self.change_log_size = change_log_size
+        self._lock = threading.RLock()
+        self._items: List[AppointmentRecord] = []
+        self._by_id: Dict[str, AppointmentRecord] = {}
+        self._by_clinic: Dict[str, Set[str]] = {}
+        self._slots: Dict[SlotKey, str] = {}
+        self._status_counts: Counter = Counter()
+        self._date_counts: Counter = Counter()
+        self._last_id_ts = 0.0
+        self._seq = 0
+        self._changes: List[Change] = []
+        self._change_seqs: List[int] = []
+        self._changes_floor = 0  # 变更日志只包含此序号之后的变更
+
+    def load(self):
+        """从存储后端加载预约，并按记录中的序号重建变更日志"""
+        with self._lock:
+            legacy = []
+            for record in self.backend.load(APPOINTMENTS_KIND):
+                appointment = self._apply_insert(record)
+                if appointment.get("seq"):
+                    self._seq = max(self._seq, appointment["seq"])
+                else:
+                    legacy.append(appointment)
+            # 没有序号的旧记录在内存中补上序号（下次更新时写入存储）
+            for appointment in legacy:
+                appointment["seq"] = self._next_seq()
+            latest = sorted(self._items, key=lambda a: a["seq"])[-self.change_log_size:]
+            self._changes = [(a["seq"], UPDATE, a["id"], a["clinic_id"]) for a in latest]
+            self._change_seqs = [c[0] for c in self._changes]
+            if len(latest) < len(self._items):
+                self._changes_floor = self._change_seqs[0] - 1
+        return self
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[AppointmentRecord]:
+        return iter(self.list())
+
+    def list(self) -> List[AppointmentRecord]:
+        """所有预约（快照）"""
+        with self._lock:
+            return list(self._items)
+
+    def get(self, appointment_id: str) -> Optional[AppointmentRecord]:
+        return self._by_id.get(appointment_id)
+
+    def for_clinic(self, clinic_id: str) -> List[AppointmentRecord]:
+        """某个诊所的所有预约"""
+        with self._lock:
+            return [self._by_id[i] for i in self._by_clinic.get(clinic_id, ())]
+
+    def slot_owner(self, slot: SlotKey) -> Optional[str]:
+        """占用该时段的预约 ID"""
+        return self._slots.get(slot)
+
+    def count_status(self, status: str) -> int:
+        """某个状态的预约数量"""
+        return self._status_counts[status]
+
+    def count_date(self, date: str) -> int:
+        """某天的预约数量（所有状态）"""
+        return self._date_counts[date]
+
+    def memory_usage(self) -> Dict[str, int]:
+        """各部分的大致内存占用（字节）；索引只统计容器本身，记录算在 records 中"""
+        with self._lock:
+            return {
+                "records": sampled_sizeof(self._items),
+                "by_id": shell_sizeof(self._by_id),
+                "by_clinic": shell_sizeof(self._by_clinic),
+                "slots": shell_sizeof(self._slots),
+                "counters": deep_sizeof(self._status_counts) + deep_sizeof(self._date_counts),
+                "change_log": shell_sizeof(self._changes) + shell_sizeof(self._change_seqs)
+            }
+
+    @property
+    def seq(self) -> int:
+        """最近一次变更的序号"""
+        return self._seq
+
+    def snapshot(self) -> Tuple[int, List[AppointmentRecord]]:
+        """所有预约和对应的序号（一致的快照，作为增量同步的起点）"""
+        with self._lock:
+            return self._seq, list(self._items)
+
+    def changes_since(self, since: int, clinic_id: Optional[str] = None, limit: int = 1000) -> Dict[str, Any]:
+        """
+        序号 since 之后的变更（同一预约只返回最新状态）
+
+        since 早于变更日志的起点（日志已截断）或晚于当前序号（服务端已重置）时，
+        返回 resync=True，客户端需要重新拉取全部数据。
+        """
+        with self._lock:
+            if since < self._changes_floor or since > self._seq:
+                return {"resync": True, "latest": self._seq}
+            start = bisect.bisect_right(self._change_seqs, since)
+            changed: Dict[str, Tuple[int, str]] = {}
+            last = self._seq
+            for index in range(start, len(self._changes)):
+                seq, op, appointment_id, change_clinic = self._changes[index]
+                if clinic_id is not None and change_clinic != clinic_id:
+                    continue
+                previous = changed.get(appointment_id)
+                if previous is None and len(changed) >= limit:
+                    # 本页已满：下一页从这条变更之前开始
+                    last = self._changes[index - 1][0] if index > 0 else since
+                    break
+                changed[appointment_id] = (seq, INSERT if previous and previous[1] == INSERT else op)
+            changes = []
+            for appointment_id, (seq, op) in sorted(changed.items(), key=lambda item: item[1][0]):
+                appointment = self._by_id.get(appointment_id)
+                if appointment is None:
+                    changes.append({"seq": seq, "op": DELETE, "id": appointment_id})
+                else:
+                    changes.append({"seq": seq, "op": op, "id": appointment_id, "appointment": appointment.to_dict()})
+            return {
+                "resync": False,
+                "latest": self._seq,
+                "next_since": last,
+                "has_more": last < self._seq,
+                "changes": changes
+            }
+
+    def _next_seq(self) -> int:
+        self._seq += 1
+        return self._seq
+
+    def _record_change(self, op: str, appointment: AppointmentRecord):
+        self._changes.append((appointment["seq"], op, appointment["id"], appointment["clinic_id"]))
+        self._change_seqs.append(appointment["seq"])
+        if len(self._changes) > 2 * self.change_log_size:
+            # 截断旧的变更（摊销 O(1)）
+            drop = len(self._changes) - self.change_log_size
+            del self._changes[:drop]
+            del self._change_seqs[:drop]
+            self._changes_floor = self._change_seqs[0] - 1
+
+    def new_id(self) -> str:
+        """生成预约 ID（保持原来的 appt_<时间戳> 格式，并保证单调不重复）"""
+        with self._lock:
+            ts = max(round(time.time(), 6), round(self._last_id_ts + 0.000001, 6))
+            self._last_id_ts = ts
+            return f"appt_{ts:.6f}"
+
+    @contextmanager
+    def transaction(self):
+        """
+        开启事务
+
+        事务期间持有存储锁；with 块正常结束时提交，抛出异常时丢弃暂存内容。
+        """
+        with self._lock:
+            tx = Transaction(self)
+            yield tx
+            if tx._inserts:
+                for appointment in tx._inserts:
+                    appointment["seq"] = self._next_seq()
+                self.backend.write_batch(put_ops(APPOINTMENTS_KIND, tx._inserts))
+                for appointment in tx._inserts:
+                    self._record_change(INSERT, self._apply_insert(appointment))
+
+    def add(self, appointment: dict) -> dict:
+        """添加单个预约（存储的是紧凑记录，传入的字典不再被引用）"""
+        with self.transaction() as tx:
+            tx.insert(appointment)
+        return appointment
+
+    def cancel_many(self, appointment_ids: Iterable[str], reason: str) -> List[AppointmentRecord]:
+        """在一个存储事务中取消多个预约并释放时段，返回实际被取消的预约"""
+        with self._lock:
+            targets = [self._by_id[i] for i in appointment_ids
+                       if i in self._by_id and self._by_id[i].get("status") in ACTIVE_STATUSES]
+            if not targets:
+                return []
+            changes = {"status": "cancelled", "cancel_reason": reason, "cancelled_at": datetime.now().isoformat()}
+            updated = [dict(a, **changes, seq=self._next_seq()) for a in targets]
+            self.backend.write_batch(put_ops(APPOINTMENTS_KIND, updated))
+            for appointment, record in zip(targets, updated):
+                self._apply_update(appointment, dict(changes, seq=record["seq"]))
+            return targets
+
+    def cancel(self, appointment_id: str, reason: Optional[str] = None) -> AppointmentRecord:
+        """取消预约并释放时段（按 ID 索引查找，O(1)）"""
+        with self._lock:
+            appointment = self._active(appointment_id)
+            self.cancel_many([appointment_id], reason or "patient_request")
+            return appointment
+
+    def reschedule(self, appointment_id: str, date: str, time_: str) -> AppointmentRecord:
+        """改约：原子地把预约从原时段移到新时段"""
+        with self._lock:
+            appointment = self._active(appointment_id)
+            new_slot = (appointment["clinic_id"], date, time_)
+            owner = self._slots.get(new_slot)
+            if owner and owner != appointment_id:
+                raise SlotTaken(new_slot, owner)
+            changes = {
+                "date": date,
+                "time": time_,
+                "rescheduled_from": f"{appointment['date']} {appointment['time']}",
+                "updated_at": datetime.now().isoformat(),
+                "seq": self._next_seq()
+            }
+            self.backend.write_batch(put_ops(APPOINTMENTS_KIND, [dict(appointment, **changes)]))
+            self._apply_update(appointment, changes)
+            return appointment
+
+    def _active(self, appointment_id: str) -> AppointmentRecord:
+        appointment = self._by_id.get(appointment_id)
+        if appointment is None:
+            raise AppointmentNotFound(appointment_id)
+        if appointment.get("status") not in ACTIVE_STATUSES:
+            raise AppointmentNotActive(appointment_id)
+        return appointment
+
+    def _apply_insert(self, data: Mapping) -> AppointmentRecord:
+        appointment = AppointmentRecord(data)
+        self._items.append(appointment)
+        self._by_id[appointment["id"]] = appointment
+        self._by_clinic.setdefault(appointment["clinic_id"], set()).add(appointment["id"])
+        self._count(appointment, 1)
+        if appointment.get("status") in ACTIVE_STATUSES:
+            self._slots[slot_key(appointment)] = appointment["id"]
+        return appointment
+
+    def _apply_update(self, appointment: AppointmentRecord, changes: dict):
+        """原地更新记录，同时维护时段索引和统计计数"""
+        self._count(appointment, -1)
+        slot = slot_key(appointment)
+        if self._slots.get(slot) == appointment["id"]:
+            del self._slots[slot]
+        appointment.update(changes)
+        self._count(appointment, 1)
+        if appointment.get("status") in ACTIVE_STATUSES:
+            self._slots[slot_key(appointment)] = appointment["id"]
+        self._record_change(UPDATE, appointment)
+
+    def _count(self, appointment: Mapping, delta: int):
+        self._status_counts[appointment.get("status")] += delta
+        self._date_counts[appointment.get("date")] += delta
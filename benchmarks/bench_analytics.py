@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+预约分析基准测试 - 1000 万行列式事实表上的分组计数
+
+对比：列式 + NumPy（如已安装）、列式 + 纯 Python 回退，以及原来的字典列表逐条聚合
+（字典列表只构造 100 万行，按行数线性外推）。
+
+运行: python benchmarks/bench_analytics.py [行数]
+"""
+
+import random
+import sys
+import time
+from array import array
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import analytics  # noqa: E402
+from analytics import AppointmentFacts, day_label, day_number  # noqa: E402
+
+CLINICS = 500
+SERVICES = ["洗牙", "补牙", "拔牙", "根管治疗", "牙齿美白", "种植牙", "正畸", "儿童牙科"]
+QUERIES = [
+    ("月 × 诊所 × 服务（两年）", dict(group_by=["clinic", "service"], bucket="month")),
+    ("天 × 诊所 × 服务（一个月）", dict(group_by=["clinic", "service"], bucket="day", start="2026-03-01", end="2026-03-31")),
+    ("天 × 服务（一个季度，已确认）", dict(group_by=["service"], bucket="day", status="confirmed",
+                                   start="2026-01-01", end="2026-03-31")),
+    ("周（单个诊所，一个季度）", dict(group_by=[], bucket="week", clinic_id="42", start="2026-01-01", end="2026-03-31")),
+]
+
+
+def build(n: int) -> AppointmentFacts:
+    facts = AppointmentFacts()
+    for i in range(CLINICS):
+        facts.clinics.encode(str(i))
+    for service in SERVICES:
+        facts.services.encode(service)
+    for status in ("confirmed", "cancelled"):
+        facts.statuses.encode(status)
+    first = day_number("2025-01-01")
+    rng = random.Random(42)
+    chunk = 1_000_000
+    for offset in range(0, n, chunk):
+        size = min(chunk, n - offset)
+        facts.extend_encoded(
+            array("i", (first + d for d in rng.choices(range(730), k=size))),
+            array("i", rng.choices(range(CLINICS), k=size)),
+            array("i", rng.choices(range(len(SERVICES)), weights=[8, 5, 2, 1, 2, 1, 1, 2], k=size)),
+            array("b", rng.choices((0, 1), weights=(9, 1), k=size))
+        )
+    return facts
+
+
+def timed(facts: AppointmentFacts, query: dict):
+    t = time.perf_counter()
+    result = facts.query(**query)
+    return time.perf_counter() - t, len(result["rows"])
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    print("=" * 70)
+    print(f"📊 预约分析基准测试 - {n:,} 行")
+    print("=" * 70)
+
+    t = time.perf_counter()
+    facts = build(n)
+    print(f"  构造列式事实表               {time.perf_counter() - t:>12.2f} 秒")
+    print(f"  列存储大小                   {facts.nbytes() / 1024 / 1024:>12.1f} MB  ({facts.nbytes() / n:.0f} 字节/行)")
+
+    numpy = analytics._numpy()
+    backends = [("numpy", numpy)] if numpy is not None else []
+    backends.append(("python", None))
+    for name, module in backends:
+        analytics.np = module
+        print(f"\n  列式查询（{name}）")
+        for label, query in QUERIES:
+            elapsed, groups = timed(facts, query)
+            print(f"    {label:<22} {elapsed * 1000:>10.1f} ms  ({groups:,} 组)")
+    analytics.np = numpy
+
+    # 原来的方式：字典列表逐条聚合
+    sample = min(n, 1_000_000)
+    statuses = facts.statuses.values
+    rows = [
+        {"clinic_id": facts.clinics.values[facts.clinic[i]], "service": facts.services.values[facts.service[i]],
+         "date": day_label(facts.day[i]), "status": statuses[facts.status[i]]}
+        for i in range(sample)
+    ]
+    t = time.perf_counter()
+    Counter((r["date"][:7], r["clinic_id"], r["service"]) for r in rows)
+    elapsed = (time.perf_counter() - t) * n / sample
+    print(f"\n  字典列表逐条聚合（月 × 诊所 × 服务，外推到 {n:,} 行） {elapsed * 1000:>8.1f} ms")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
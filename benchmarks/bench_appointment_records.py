@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+预约记录内存基准测试 - 每个预约占用的字节数（原来的 14 键字典 vs AppointmentRecord）
+
+每种表示在单独的子进程中构造 N 条预约，用构造前后的 RSS 差值计算每条的字节数
+（包括分配器开销；子进程避免上一轮释放的内存被下一轮复用）。字段值和接口收到的
+一样是新建的字符串：患者按 N/4 人重复预约，日期、时间、服务来自表单。
+字典在 N 超过 100 万时只构造 100 万条，按条数线性外推。
+
+运行: python benchmarks/bench_appointment_records.py [条数 ...]
+"""
+
+import gc
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from appointment_store import AppointmentRecord  # noqa: E402
+from health import memory_rss  # noqa: E402
+
+CLINICS = [(str(i), f"Clinic {i} Dental") for i in range(1, 501)]
+SERVICES = ["洗牙", "补牙", "拔牙", "根管治疗", "牙齿美白", "种植牙", "正畸", "儿童牙科"]
+DICT_LIMIT = 1_000_000
+
+
+def appointments(n: int):
+    """和 build_appointment 生成的字典形状相同"""
+    rng = random.Random(42)
+    patients = max(1, n // 4)
+    days = [(d.month, d.day) for d in (datetime(2026, 1, 1) + timedelta(days=k) for k in range(365))]
+    created = datetime(2025, 12, 1)
+    for i in range(n):
+        clinic_id, clinic_name = rng.choice(CLINICS)
+        patient = rng.randrange(patients)
+        month, day = rng.choice(days)
+        yield {
+            "id": f"appt_{1764547200 + i * 0.001:.6f}",
+            "clinic_id": clinic_id,
+            "clinic_name": clinic_name,
+            "date": f"2026-{month:02d}-{day:02d}",
+            "time": f"{rng.randrange(9, 18)}:{rng.choice((0, 30)):02d}",
+            "service": "".join(rng.choice(SERVICES)),
+            "patient_name": f"患者{patient}",
+            "patient_email": f"patient{patient}@example.com",
+            "patient_phone": f"+1 (416) {patient % 1000:03d}-{patient % 10000:04d}",
+            "virtual_phone": f"+1 (416) 555-{1000 + i % 9000}",
+            "status": "confirmed" if rng.random() < 0.9 else "cancelled",
+            "notes": None,
+            "created_at": (created + timedelta(microseconds=i * 1000 + 1)).isoformat(),
+            "seq": i + 1
+        }
+
+
+def measure(kind: str, n: int):
+    """子进程：构造 n 条记录，输出 RSS 增量（字节）和耗时（秒）"""
+    gc.collect()
+    before = memory_rss()
+    t = time.perf_counter()
+    if kind == "dict":
+        records = list(appointments(n))
+    else:
+        records = [AppointmentRecord(a) for a in appointments(n)]
+    elapsed = time.perf_counter() - t
+    gc.collect()
+    print(memory_rss() - before, elapsed, len(records))
+
+
+def run(kind: str, n: int):
+    out = subprocess.run([sys.executable, __file__, "--measure", kind, str(n)],
+                         capture_output=True, text=True, check=True).stdout.split()
+    return int(out[0]), float(out[1])
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+        measure(sys.argv[2], int(sys.argv[3]))
+        return
+    sizes = [int(a) for a in sys.argv[1:]] or [1_000_000, 10_000_000]
+    print("=" * 70)
+    print("🧮 预约记录内存基准测试")
+    print("=" * 70)
+    for n in sizes:
+        sample = min(n, DICT_LIMIT)
+        dict_bytes, dict_time = run("dict", sample)
+        record_bytes, record_time = run("record", n)
+        dict_per = dict_bytes / sample
+        record_per = record_bytes / n
+        note = "" if sample == n else f"（{sample:,} 条外推）"
+        print(f"\n  {n:,} 条预约")
+        print(f"    字典            {dict_per:>8.0f} 字节/条   合计 {dict_per * n / 1024 ** 3:>6.2f} GB{note}")
+        print(f"    AppointmentRecord {record_per:>6.0f} 字节/条   合计 {record_bytes / 1024 ** 3:>6.2f} GB"
+              f"   生成并构造 {record_time:.1f} 秒")
+        print(f"    节省            {1 - record_per / dict_per:>8.0%}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
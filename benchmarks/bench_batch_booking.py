@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+批量预约基准测试 - 对比逐条 POST /api/appointments 与一次 POST /api/appointments/batch
+
+运行: python benchmarks/bench_batch_booking.py [预约数量]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import dental_now  # noqa: E402
+from appointment_store import AppointmentStore  # noqa: E402
+from storage import SQLiteBackend  # noqa: E402
+
+
+def make_items(n: int, day_offset: int = 0):
+    items = []
+    for i in range(n):
+        day, minute = divmod(i, 12 * 60)
+        items.append({
+            "clinic_id": str(i % 4 + 1),
+            "date": f"2027-{(day + day_offset) // 28 % 12 + 1:02d}-{(day + day_offset) % 28 + 1:02d}",
+            "time": f"{8 + minute // 60:02d}:{minute % 60:02d}",
+            "service": "洗牙",
+            "patient_name": f"Patient {i}",
+            "patient_email": f"p{i}@example.com",
+            "patient_phone": "+1 416 555 0000",
+        })
+    return items
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    client = TestClient(dental_now.app)
+    print("=" * 70)
+    print(f"📦 批量预约基准测试 - {n:,} 个预约")
+    print("=" * 70)
+
+    single = make_items(min(n, 1000), day_offset=0)
+    start = time.perf_counter()
+    for item in single:
+        client.post("/api/appointments", data=item)
+    elapsed = time.perf_counter() - start
+    print(f"  逐条 POST ({len(single)} 个)          {len(single) / elapsed:12,.0f} 个/秒")
+
+    for backend_name in ("memory", "sqlite"):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = AppointmentStore(SQLiteBackend(Path(tmp) / "bench.db") if backend_name == "sqlite" else None)
+            dental_now.appointments_data = store
+            items = make_items(n, day_offset=100)
+            start = time.perf_counter()
+            result = client.post("/api/appointments/batch", json=items).json()
+            elapsed = time.perf_counter() - start
+            print(f"  批量 POST [{backend_name:<6}]              {result['created'] / elapsed:12,.0f} 个/秒"
+                  f"  ({elapsed * 1000:.1f} ms)")
+            store.backend.close()
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+WebSocket 推送基准测试 - 单进程 1 万个空闲连接的内存占用和广播延迟
+
+使用内存中的模拟 WebSocket（不经过网络栈），测量的是 ClinicFeedHub 本身的开销：
+每个连接的内存、一次发布到全部订阅者收到消息的延迟，以及慢消费者被断开的情况。
+
+运行: python benchmarks/bench_clinic_feed.py [连接数]
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from realtime import ClinicFeedHub  # noqa: E402
+
+
+class FakeWebSocket:
+    """模拟的空闲客户端：从不发送消息，记录收到消息的时间"""
+
+    def __init__(self, bench, stall: bool = False):
+        self.bench = bench
+        self.stall = stall
+        self._idle = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.stall:
+            await asyncio.sleep(3600)
+        self.bench.delivered(text)
+
+    async def receive_text(self):
+        await self._idle.wait()
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+class Bench:
+    def __init__(self):
+        self.started = 0.0
+        self.latencies = []
+        self.expected = 0
+        self.done = asyncio.Event()
+
+    def delivered(self, text: str):
+        if '"bench"' not in text:
+            return
+        self.latencies.append(time.perf_counter() - self.started)
+        if len(self.latencies) >= self.expected:
+            self.done.set()
+
+
+async def run(n: int):
+    hub = ClinicFeedHub(queue_size=64, heartbeat_interval=3600, idle_timeout=7200)
+    heartbeat = hub.start()
+    bench = Bench()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = [asyncio.create_task(hub.serve(FakeWebSocket(bench), "1")) for _ in range(n)]
+    await asyncio.sleep(0.5)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"  空闲连接数                   {hub.stats()['connections']:>12,}")
+    print(f"  每连接内存（hub + 任务）     {(after - before) / n:>12,.0f} 字节")
+
+    for round_ in range(5):
+        bench.latencies, bench.expected, bench.done = [], n, asyncio.Event()
+        bench.started = time.perf_counter()
+        hub.publish("1", {"type": "bench", "round": round_})
+        await asyncio.wait_for(bench.done.wait(), 60)
+    ms = sorted(x * 1000 for x in bench.latencies)
+    print(f"  广播延迟 p50                 {statistics.median(ms):>12.2f} ms")
+    print(f"  广播延迟 p99                 {ms[int(len(ms) * 0.99) - 1]:>12.2f} ms")
+    print(f"  广播延迟 max                 {ms[-1]:>12.2f} ms")
+
+    slow = asyncio.create_task(hub.serve(FakeWebSocket(bench, stall=True), "1"))
+    await asyncio.sleep(0.1)
+    bench.expected = 10 ** 9
+    for i in range(hub.queue_size + 2):
+        hub.publish("1", {"type": "bench", "seq": i})
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.1)
+    print(f"  慢消费者被断开               {hub.stats()['slow_consumers_dropped']:>12,}")
+
+    heartbeat.cancel()
+    for task in tasks + [slow]:
+        task.cancel()
+    await asyncio.gather(*tasks, slow, return_exceptions=True)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    print("=" * 70)
+    print(f"📡 WebSocket 推送基准测试 - {n:,} 个连接")
+    print("=" * 70)
+    asyncio.run(run(n))
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
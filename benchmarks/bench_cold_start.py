@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+冷启动基准测试 - 从启动 uvicorn 进程到第一个请求返回的时间
+
+每轮启动一个新的 uvicorn 进程（和 Render 的启动命令相同），不断请求首页直到
+返回 200，计时包括解释器启动、导入、加载数据、预热和第一个请求本身。然后从
+/api/admin/startup 读取进程内记录的各阶段时刻和导入最慢的模块。
+
+中位数超过预算时以非零状态退出，可以在 CI 中作为冷启动的回归检查。
+预算默认 1.5 秒，可以用第二个参数或 COLD_START_BUDGET 环境变量修改。
+
+运行: python benchmarks/bench_cold_start.py [轮数] [预算秒数]
+"""
+
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BUDGET = 1.5
+TIMEOUT = 30.0
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(url: str, timeout: float = 5.0) -> bytes:
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+def cold_start():
+    """启动一个进程，返回 (到第一个响应的秒数, /api/admin/startup 的结果)"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, STORAGE_BACKEND=os.environ.get("STORAGE_BACKEND", "memory"))
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "dental_now:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            try:
+                get(base + "/")
+                break
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn 退出，状态码 {process.returncode}")
+                if time.perf_counter() - started > TIMEOUT:
+                    raise RuntimeError(f"{TIMEOUT:.0f} 秒内没有响应")
+                time.sleep(0.005)
+        elapsed = time.perf_counter() - started
+        timings = json.loads(get(base + "/api/admin/startup?top=10"))
+        return elapsed, timings
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else float(os.environ.get("COLD_START_BUDGET", DEFAULT_BUDGET))
+    print("=" * 70)
+    print(f"🧊 冷启动基准测试 - {runs} 轮，预算 {budget:.2f} 秒")
+    print("=" * 70)
+
+    results = []
+    for i in range(runs):
+        elapsed, timings = cold_start()
+        results.append(elapsed)
+        phases = timings["phases"]
+        first = timings["first_request"] or {}
+        print(f"  第 {i + 1} 轮  首个响应 {elapsed:>6.3f} 秒   "
+              f"解释器 {phases.get('interpreter', 0):.3f}  导入 {phases.get('imported', 0):.3f}  "
+              f"预热 {phases.get('warmed', 0):.3f}  首个请求 {first.get('duration_ms', 0):.1f} ms")
+
+    print("\n  导入最慢的模块（最后一轮，自身耗时）")
+    for module in timings["imports"]:
+        print(f"    {module['module']:<40} {module['self_ms']:>8.1f} ms  (累计 {module['cumulative_ms']:.1f} ms)")
+    print("\n  预热步骤")
+    for step, seconds in timings["warmup"].items():
+        print(f"    {step:<40} {seconds * 1000:>8.1f} ms")
+
+    median = statistics.median(results)
+    print(f"\n  中位数 {median:.3f} 秒   最快 {min(results):.3f} 秒   最慢 {max(results):.3f} 秒")
+    print("=" * 70)
+    if median > budget:
+        print(f"❌ 冷启动超出预算: {median:.3f} 秒 > {budget:.2f} 秒")
+        sys.exit(1)
+    print(f"✅ 冷启动在预算内: {median:.3f} 秒 <= {budget:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
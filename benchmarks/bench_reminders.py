@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+预约提醒调度基准测试 - 启动重建、取消/改约调整和批量弹出到期提醒
+
+运行: python benchmarks/bench_reminders.py [预约数]
+"""
+
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from appointment_store import AppointmentStore  # noqa: E402
+from reminder_scheduler import ReminderScheduler  # noqa: E402
+from storage import MemoryBackend  # noqa: E402
+from synthetic_data import generate_appointments, generate_clinics  # noqa: E402
+
+CLINICS = 500
+
+
+def future_days(n: int) -> int:
+    """未来的天数：有效预约约占全部可预约时段的三成"""
+    return max(30, n // (CLINICS * 5))
+
+
+def build_store(n: int) -> AppointmentStore:
+    """500 家诊所从明天开始的合成预约（全部在未来，不含已取消的）"""
+    store = AppointmentStore(MemoryBackend())
+    clinics = list(generate_clinics(CLINICS))
+    with store.transaction() as tx:
+        for appointment in generate_appointments(n, clinics, start=date.today() + timedelta(days=1),
+                                                 past_days=0, future_days=future_days(n), cancel_rate=0):
+            tx.insert(appointment)
+    return store
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print("=" * 70)
+    print(f"⏰ 预约提醒调度基准测试 - {n:,} 个未来预约")
+    print("=" * 70)
+
+    store = build_store(n)
+    scheduler = ReminderScheduler(store, store.backend)
+    t = time.perf_counter()
+    scheduler.load()
+    elapsed = time.perf_counter() - t
+    print(f"  启动重建（heapify）           {elapsed:>12.2f} 秒  ({len(scheduler):,} 条提醒)")
+
+    ids = random.sample([a["id"] for a in store.list()], min(n, 100_000))
+    t = time.perf_counter()
+    for appointment_id in ids:
+        scheduler.unschedule(appointment_id)
+    per_op = (time.perf_counter() - t) / len(ids)
+    print(f"  取消（标记失效）              {per_op * 1e6:>12.2f} µs/次")
+
+    t = time.perf_counter()
+    for appointment_id in ids:
+        scheduler.schedule(store.get(appointment_id))
+    per_op = (time.perf_counter() - t) / len(ids)
+    print(f"  改约（失效 + 压入）           {per_op * 1e6:>12.2f} µs/次")
+
+    # 把时间拨到最后一个预约之前，测批量弹出
+    horizon = time.time() + (future_days(n) + 2) * 86400
+    popped, t = 0, time.perf_counter()
+    while True:
+        batch = scheduler.pop_due(horizon, 500)
+        if not batch:
+            break
+        popped += len(batch)
+    elapsed = time.perf_counter() - t
+    print(f"  批量弹出到期提醒（每批 500）  {popped / elapsed:>12,.0f} 条/秒")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+诊所搜索基准测试 - 容错搜索的召回率和延迟，以及综合得分排序时堆取前 k 个 vs 全部排序
+
+诊所和预约来自 synthetic_data 生成器。
+
+召回率: 对城市名和名称用词随机制造拼写错误（相邻字母对调、漏字、错字、多字），
+用多个词的地址片段（街道名、城市加省份）查询城市，对每种服务用生成器里的各种写法（中文、英文、旧版本的叫法）查询；应当找到的诊所
+按生成器的数据直接判断（与搜索索引无关），和只做子串匹配（原来的行为）对比。
+准确率是找到的诊所中应当找到的比例（容错不应当把别的城市、别的服务也找出来）。
+
+排序: "全部排序" 是 limit 不限时的结果（对所有匹配打分并排序，相当于原来把全部
+匹配返回给前端再排序），"前 k 个" 只维护大小为 k 的堆。两者打分的开销相同，
+差别在排序和构造结果副本。
+
+运行: python benchmarks/bench_search.py [诊所数量] [预约数量]
+"""
+
+import random
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from clinic_catalog import ClinicCatalog  # noqa: E402
+from clinic_dashboard import ClinicDashboards  # noqa: E402
+from clinic_search import ClinicRanker  # noqa: E402
+from synthetic_data import BRANDS, CITIES, SERVICES, generate_appointments, generate_clinics  # noqa: E402
+
+TODAY = date(2026, 3, 2)
+TORONTO = (43.6532, -79.3832)
+
+
+def timed(label: str, fn, repeat: int = 5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<40} {elapsed * 1000:10.2f} ms")
+    return elapsed, result
+
+
+def typos(word: str, rng: random.Random, count: int = 4):
+    """word 的 count 种拼写错误（不改首字母）"""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    results = set()
+    while len(results) < count:
+        i = rng.randrange(1, len(word) - 1)
+        op = rng.randrange(4)
+        if op == 0:
+            typo = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        elif op == 1:
+            typo = word[:i] + word[i + 1:]
+        elif op == 2:
+            typo = word[:i] + rng.choice(letters) + word[i + 1:]
+        else:
+            typo = word[:i] + word[i] + word[i:]
+        if typo.casefold() != word.casefold():
+            results.add(typo)
+    return sorted(results)
+
+
+def recall(catalog: ClinicCatalog, cases):
+    """
+    cases: [(查询参数, 应当找到的诊所 ID, 子串匹配找到的诊所 ID)]
+    -> (召回率, 准确率, 子串匹配的召回率, 平均延迟秒数)
+    """
+    found = returned = expected = baseline = 0
+    elapsed = 0.0
+    for query, truth, substring in cases:
+        start = time.perf_counter()
+        ids = {c["id"] for _, c in catalog.matches(**query)}
+        elapsed += time.perf_counter() - start
+        found += len(ids & truth)
+        returned += len(ids)
+        baseline += len(substring & truth)
+        expected += len(truth)
+    return found / expected, found / max(1, returned), baseline / expected, elapsed / len(cases)
+
+
+def fuzzy_cases(clinics):
+    rng = random.Random(7)
+    cases = []
+    for city, *_ in CITIES:
+        truth = {c["id"] for c in clinics if c["city"] == city}
+        for typo in typos(city, rng):
+            substring = {c["id"] for c in clinics if typo.casefold() in c["address"].casefold()}
+            cases.append(("城市拼写错误", {"city": typo}, truth, substring))
+    # 多词地址: 应当找到的就是地址中含有这个片段的诊所（原来的行为）
+    for clinic in rng.sample(clinics, min(32, len(clinics))):
+        street = clinic["address"].split(",")[0].split(" ", 1)[1]
+        for phrase in (street, f"{clinic['city']}, {clinic['address'].split(', ')[-1][:2]}"):
+            truth = {c["id"] for c in clinics if phrase.casefold() in c["address"].casefold()}
+            cases.append(("多词地址", {"city": phrase}, truth, truth))
+    for brand in BRANDS:
+        truth = {c["id"] for c in clinics if brand in c["name"].split()}
+        for typo in typos(brand, rng):
+            substring = {c["id"] for c in clinics if typo.casefold() in c["name"].casefold()}
+            cases.append(("名称拼写错误", {"name": typo}, truth, substring))
+    for zh, en, variants, _ in SERVICES:
+        names = {zh, en, *variants}
+        truth = {c["id"] for c in clinics if any(part.strip() in names for s in c["services"] for part in s.split("/"))}
+        for name in sorted(names):
+            substring = {c["id"] for c in clinics if any(name.casefold() in s.casefold() for s in c["services"])}
+            cases.append(("服务的不同写法", {"service": name}, truth, substring))
+    return cases
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    appointments = int(sys.argv[2]) if len(sys.argv) > 2 else n * 2
+    print("=" * 70)
+    print(f"🔎 诊所搜索基准测试 - {n:,} 诊所，{appointments:,} 预约")
+    print("=" * 70)
+
+    clinics = list(generate_clinics(n))
+    catalog = ClinicCatalog().load(clinics)
+    dashboards = ClinicDashboards().load(generate_appointments(appointments, clinics, start=TODAY))
+    ranker = ClinicRanker(catalog, dashboards)
+
+    print("\n容错搜索召回率（子串匹配 = 原来的行为）:")
+    cases = fuzzy_cases(clinics)
+    for kind in dict.fromkeys(kind for kind, *_ in cases):
+        group = [case[1:] for case in cases if case[0] == kind]
+        rate, precision, baseline, latency = recall(catalog, group)
+        print(f"  {kind:<12} {len(group):>3} 个查询  召回率 {rate:>6.1%}  准确率 {precision:>6.1%}"
+              f"  子串匹配 {baseline:>6.1%}  平均 {latency * 1000:.2f} ms")
+
+    print("\n查询延迟:")
+    for label, query in (("city=Toronto（精确）", {"city": "Toronto"}),
+                         ("city=Torotno（拼写容错）", {"city": "Torotno"}),
+                         ("name=Lakeshroe（拼写容错）", {"name": "Lakeshroe"}),
+                         ("service=洗牙", {"service": "洗牙"}),
+                         ("service=牙齿清洁（同义写法）", {"service": "牙齿清洁"}),
+                         ("service=Cleanig（拼写容错）", {"service": "Cleanig"})):
+        timed(label, lambda: catalog.matches(**query), repeat=20)
+
+    queries = [
+        ("全部诊所", {}),
+        ("city=Toronto", {"city": "Toronto"}),
+        ("service=洗牙", {"service": "洗牙"}),
+        ("city=Toronto service=Cleaning", {"city": "Toronto", "service": "Cleaning"}),
+    ]
+    for label, query in queries:
+        _, (_, total) = timed(f"{label} 匹配", lambda: ranker.rank(**query, limit=0), repeat=1)
+        print(f"\n{label}（{total:,} 个匹配）:")
+        for sort, located in (("score", False), ("score", True), ("rating", False)):
+            where = dict(latitude=TORONTO[0], longitude=TORONTO[1]) if located else {}
+            name = f"sort={sort}" + (" 带位置" if located else "")
+            full, (everything, _) = timed(f"{name} 全部排序", lambda: ranker.rank(
+                **query, sort=sort, today=TODAY, **where))
+            top, (first, _) = timed(f"{name} 前 10 个", lambda: ranker.rank(
+                **query, sort=sort, limit=10, today=TODAY, **where))
+            assert [c["id"] for c in first] == [c["id"] for c in everything[:10]]
+            print(f"  {'加速':<40} {full / top:10.1f}x")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+用户目录基准测试 - 100 万用户下的角色筛选、前缀搜索和游标分页
+
+运行: python benchmarks/bench_user_directory.py [用户数量]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from synthetic_data import generate_users  # noqa: E402
+from user_directory import UserDirectory  # noqa: E402
+
+
+def make_users(n: int, seed: int = 42):
+    for user in generate_users(n, seed):
+        email = user.pop("email")
+        yield email, user
+
+
+def timed(label: str, fn, repeat: int = 20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<36} {elapsed * 1000:10.3f} ms")
+    return result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print("=" * 70)
+    print(f"👥 用户目录基准测试 - {n:,} 用户")
+    print("=" * 70)
+
+    users = list(make_users(n))
+    start = time.perf_counter()
+    directory = UserDirectory()
+    directory.bulk_load(users)
+    print(f"  {'批量加载并建立索引':<36} {(time.perf_counter() - start) * 1000:10.1f} ms")
+    flat = dict(users)
+
+    print("\n索引查询:")
+    timed("首页 (limit=50)", lambda: directory.page(limit=50))
+    timed("角色筛选 admin (limit=50)", lambda: directory.page(role="admin", limit=50))
+    timed("名称前缀 'emily tremblay' (limit=50)", lambda: directory.page(prefix="emily tremblay", limit=50))
+    timed("邮箱前缀 'olivia.' (limit=50)", lambda: directory.page(prefix="olivia.", limit=50))
+
+    _, cursor = directory.page(role="doctor", limit=50)
+    timed("角色筛选翻页 doctor", lambda: directory.page(role="doctor", cursor=cursor, limit=50))
+
+    start = time.perf_counter()
+    pages, cursor = 0, None
+    while pages < 1000:
+        _, cursor = directory.page(role="patient", cursor=cursor, limit=100)
+        pages += 1
+        if not cursor:
+            break
+    print(f"  {'连续翻 1000 页 (limit=100)':<36} {(time.perf_counter() - start) * 1000:10.1f} ms")
+
+    print("\n全量扫描对照:")
+    timed("扫描筛选 admin", lambda: [e for e, u in flat.items() if u["role"] == "admin"][:50], repeat=3)
+    timed("扫描名称前缀 'emily tremblay'",
+          lambda: [e for e, u in flat.items() if u["name"].casefold().startswith("emily tremblay")][:50], repeat=3)
+
+    start = time.perf_counter()
+    for i in range(1000):
+        directory.add(f"new{i}@example.com", {"password": "x", "name": f"New {i}", "role": "patient"})
+    print(f"\n  {'单条插入 (平均)':<36} {(time.perf_counter() - start):10.3f} ms")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+通话记录 - 每个诊所最近通话的环形缓冲区，按预约索引通话，追加写入日志文件
+
+每条通话（以及之后的状态变化）作为一行 JSON 追加到 CALL_LOGS_FILE 并 fsync；
+启动时按顺序重放文件重建内存索引。最近通话列表从环形缓冲区尾部读取 k 条，
+与历史通话总数无关。
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from memory_usage import sampled_sizeof, shell_sizeof
+
+CALL_DIRECTIONS = ("patient_to_clinic", "clinic_to_patient")
+
+
+class CallNotFound(KeyError):
+    """通话不存在"""
+
+
+class CallLog:
+    """通话记录存储"""
+
+    def __init__(self, path: Optional[Path] = None, recent_size: int = 200, fsync: bool = True):
+        self.path = Path(path) if path else None
+        self.recent_size = recent_size
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._by_id: Dict[str, dict] = {}
+        self._by_appointment: Dict[str, List[dict]] = {}
+        self._recent: Dict[str, Deque[dict]] = {}
+        self._totals: Dict[str, List[int]] = {}  # 诊所 -> [通话数, 总时长（秒）]
+        self._seq = itertools.count(1)
+        self._file = None
+
+    def load(self):
+        """重放日志文件，然后以追加方式打开"""
+        if self.path is None:
+            return self
+        with self._lock:
+            if self.path.exists():
+                with open(self.path, encoding="utf-8") as f:
+                    for line_no, line in enumerate(f, 1):
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # 进程崩溃时最后一行可能只写了一半
+                            print(f"⚠️ 跳过损坏的通话记录: 第 {line_no} 行")
+                            continue
+                        self._apply(record)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def record(self, appointment: dict, direction: str, clinic_phone: Optional[str] = None) -> dict:
+        """记录一次发起的通话"""
+        patient_phone = appointment.get("patient_phone")
+        call = {
+            "id": f"call_{int(time.time() * 1000)}_{next(self._seq)}",
+            "appointment_id": appointment["id"],
+            "clinic_id": appointment["clinic_id"],
+            "direction": direction,
+            "virtual_phone": appointment.get("virtual_phone"),
+            "from": patient_phone if direction == "patient_to_clinic" else clinic_phone,
+            "to": clinic_phone if direction == "patient_to_clinic" else patient_phone,
+            "status": "connecting",
+            "started_at": datetime.now().isoformat()
+        }
+        with self._lock:
+            self._append(call)
+            self._apply(dict(call))
+            return self._by_id[call["id"]]
+
+    def update(self, call_id: str, **changes) -> dict:
+        """更新通话状态（如 completed / failed、通话时长），追加一条变更记录"""
+        with self._lock:
+            call = self._by_id.get(call_id)
+            if call is None:
+                raise CallNotFound(call_id)
+            record = {"id": call_id, **changes, "updated_at": datetime.now().isoformat()}
+            self._append(record)
+            self._apply(record)
+            return call
+
+    def _append(self, record: dict):
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _apply(self, record: dict):
+        call = self._by_id.get(record["id"])
+        if call is not None:
+            # 变更记录：原地更新，环形缓冲区和预约索引引用的是同一个对象
+            if "duration" in record:
+                self._totals[call["clinic_id"]][1] += (record["duration"] or 0) - (call.get("duration") or 0)
+            call.update(record)
+            return
+        if "clinic_id" not in record:
+            return
+        self._by_id[record["id"]] = record
+        totals = self._totals.setdefault(record["clinic_id"], [0, 0])
+        totals[0] += 1
+        totals[1] += record.get("duration") or 0
+        self._by_appointment.setdefault(record["appointment_id"], []).append(record)
+        recent = self._recent.get(record["clinic_id"])
+        if recent is None:
+            recent = self._recent[record["clinic_id"]] = deque(maxlen=self.recent_size)
+        recent.append(record)
+
+    def recent(self, clinic_id: str, limit: int = 20) -> List[dict]:
+        """某个诊所最近的 limit 条通话（新的在前），O(limit)"""
+        with self._lock:
+            buffer = self._recent.get(clinic_id)
+            if not buffer:
+                return []
+            return [dict(call) for call in itertools.islice(reversed(buffer), max(0, limit))]
+
+    def clinic_totals(self, clinic_id: str) -> Tuple[int, int]:
+        """诊所的通话总数和总时长（秒）"""
+        calls, duration = self._totals.get(clinic_id, (0, 0))
+        return calls, duration
+
+    def for_appointment(self, appointment_id: str) -> List[dict]:
+        """某个预约的所有通话"""
+        with self._lock:
+            return [dict(call) for call in self._by_appointment.get(appointment_id, ())]
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def memory_usage(self) -> Dict[str, int]:
+        """各部分的大致内存占用（字节）"""
+        with self._lock:
+            return {
+                "calls": sampled_sizeof(self._by_id),
+                "indexes": shell_sizeof(self._by_appointment) + shell_sizeof(self._recent) + shell_sizeof(self._totals)
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": len(self._by_id),
+            "clinics": len(self._recent),
+            "appointments": len(self._by_appointment),
+            "recent_buffered": sum(len(b) for b in self._recent.values())
+        }
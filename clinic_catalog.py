@@ -0,0 +1,515 @@
+"""
+诊所目录 - 按 ID 存储诊所，并维护搜索索引（城市/地址词、名称词、服务）和地理网格索引
+
+单条添加会增量更新索引；批量导入先写入数据，最后统一重建一次索引。
+删除只记录墓碑（O(1)），读取时通过墓碑过滤；后台压缩再统一清除墓碑。
+
+容错搜索:
+  - 服务名称在不同版本的应用中写法不同（洗牙 / 牙齿清洁 / Cleaning），建索引时
+    按 SERVICE_SYNONYMS 额外登记规范名称，查询先换算成规范名称再查索引。
+  - 城市/地址词和名称词的词表另外维护一个三元组索引；精确和子串都匹配不到时
+    （如 Torotno），用三元组找出候选词，再取编辑距离（相邻字母对调算一次）最小且
+    在容许范围内的词（拼写容错）。只索引词表而不是每个诊所，所以查询开销取决于
+    词表规模（城市、街道、名称用词），与诊所数量无关。
+"""
+
+import itertools
+import math
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from memory_usage import sampled_sizeof, shell_sizeof
+from storage import MemoryBackend, put_ops
+
+CLINICS_KIND = "clinics"
+
+# 地理网格大小（度），约 25 公里
+GEO_CELL_DEGREES = 0.25
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+# 拼写容错: 查询词的最小长度（更短的词容易误配）；三元组相似度（Dice 系数）不低于
+# FUZZY_CANDIDATE_SIMILARITY 的词中，最多检查 FUZZY_CANDIDATES 个的编辑距离
+FUZZY_MIN_LENGTH = 4
+FUZZY_CANDIDATE_SIMILARITY = 0.2
+FUZZY_CANDIDATES = 32
+
+# 服务的规范名称 -> 同义写法（英文名、旧版本的叫法、常见的说法）
+SERVICE_SYNONYMS: Dict[str, Tuple[str, ...]] = {
+    "洗牙": ("Cleaning", "牙齿清洁", "洁牙", "Teeth Cleaning", "Dental Cleaning", "Scaling"),
+    "补牙": ("Fillings", "Filling", "牙齿填充"),
+    "根管治疗": ("Root Canal", "Root Canal Treatment", "Endodontics"),
+    "拔牙": ("Extraction", "Tooth Extraction", "牙齿拔除"),
+    "牙齿美白": ("Whitening", "Teeth Whitening", "美白"),
+    "种植牙": ("Implants", "Dental Implants", "牙齿种植"),
+    "牙齿矫正": ("Orthodontics", "Braces", "正畸"),
+    "儿童牙科": ("Pediatric Dentistry", "Paediatric Dentistry", "Kids Dentistry"),
+    "牙周治疗": ("Periodontal Treatment", "Periodontics", "Gum Treatment"),
+    "美容牙科": ("Cosmetic Dentistry",),
+    "急诊": ("Emergency Care", "Emergency", "牙科急诊")
+}
+# 折叠后的写法 -> 规范名称
+_SERVICE_CANONICAL: Dict[str, str] = {
+    name.casefold(): canonical
+    for canonical, names in SERVICE_SYNONYMS.items()
+    for name in (canonical,) + names
+}
+
+
+def tokenize(text: str) -> Set[str]:
+    return {t.casefold() for t in _TOKEN_RE.findall(text or "")}
+
+
+def trigrams(text: str) -> Set[str]:
+    """词的三元组（前面补两个空格、后面补一个，词首的字母权重更高）"""
+    padded = f"  {text.casefold()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(query: str) -> int:
+    """查询词容许的编辑次数: 6 个字符以内 1 次，更长 2 次"""
+    return 1 if len(query) <= 6 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """编辑距离（增、删、改、相邻字符对调各算一次）；超过 limit 时返回 limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before: Optional[List[int]] = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if before is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def fuzzy_similarity(query: str, value: str) -> float:
+    """拼写容错的相似度: 1 - 编辑距离 / 较长的长度；超出容许的编辑次数时为 0"""
+    query, value = query.casefold(), value.casefold()
+    if len(query) < FUZZY_MIN_LENGTH:
+        return 0.0
+    distance = edit_distance(query, value, max_edits(query))
+    return 0.0 if distance > max_edits(query) else 1 - distance / max(len(query), len(value))
+
+
+def service_keys(label: str) -> Set[str]:
+    """
+    一个服务名称的索引键: 折叠后的原文，以及认识的写法对应的规范名称
+    （中英双语的名称如 洗牙 / Cleaning 按 / 拆开分别换算）
+    """
+    label = label.casefold().strip()
+    keys = {label}
+    for part in label.split("/"):
+        canonical = _SERVICE_CANONICAL.get(part.strip())
+        if canonical is not None:
+            keys.add(canonical)
+    return keys
+
+
+@lru_cache(maxsize=1024)
+def canonical_services(query: str) -> Tuple[str, ...]:
+    """
+    查询词对应的规范服务名称: 与某个写法相同或是其子串（clean -> 洗牙）；
+    都没有时按拼写容错找最相似的写法（Cleanig -> 洗牙）
+    """
+    query = query.casefold().strip()
+    if not query:
+        return ()
+    exact = _SERVICE_CANONICAL.get(query)
+    if exact is not None:
+        return (exact,)
+    found = {canonical for name, canonical in _SERVICE_CANONICAL.items() if query in name}
+    if not found and len(query) >= FUZZY_MIN_LENGTH:
+        # 写法一共几十个，直接逐个算编辑距离
+        limit = max_edits(query)
+        scored = [(edit_distance(query, name, limit), canonical) for name, canonical in _SERVICE_CANONICAL.items()]
+        best = min(scored)[0]
+        if best <= limit:
+            found = {canonical for distance, canonical in scored if distance == best}
+    return tuple(sorted(found))
+
+
+class TrigramIndex:
+    """词表的三元组倒排索引: 三元组 -> 含有它的词，用于查找拼写相近的词"""
+
+    def __init__(self):
+        self._terms: Dict[str, Set[str]] = {}
+        self._sizes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._sizes)
+
+    def add(self, term: str):
+        # 门牌号、邮编之类含数字的词不做拼写容错
+        if term in self._sizes or len(term) < 2 or any(ch.isdigit() for ch in term):
+            return
+        grams = trigrams(term)
+        self._sizes[term] = len(grams)
+        for gram in grams:
+            self._terms.setdefault(gram, set()).add(term)
+
+    def discard(self, term: str):
+        if self._sizes.pop(term, None) is None:
+            return
+        for gram in trigrams(term):
+            terms = self._terms.get(gram)
+            if terms is not None:
+                terms.discard(term)
+                if not terms:
+                    del self._terms[gram]
+
+    def similar(self, query: str, min_similarity: float = FUZZY_CANDIDATE_SIMILARITY) -> List[Tuple[float, str]]:
+        """与查询词三元组相似度不低于 min_similarity 的词，按相似度从高到低"""
+        grams = trigrams(query)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._terms.get(gram, ()))
+        results = []
+        for term, count in shared.items():
+            score = 2 * count / (len(grams) + self._sizes[term])
+            if score >= min_similarity:
+                results.append((score, term))
+        results.sort(key=lambda r: (-r[0], r[1]))
+        return results
+
+    def closest(self, query: str) -> List[str]:
+        """编辑距离在容许范围内且最小的词（并列时都返回）；查询词太短时不做容错"""
+        query = query.casefold()
+        if len(query) < FUZZY_MIN_LENGTH:
+            return []
+        limit = max_edits(query)
+        best, terms = limit + 1, []
+        for _, term in self.similar(query)[:FUZZY_CANDIDATES]:
+            distance = edit_distance(query, term, limit)
+            if distance < best:
+                best, terms = distance, [term]
+            elif distance == best:
+                terms.append(term)
+        return terms if best <= limit else []
+
+    def memory_usage(self) -> int:
+        return shell_sizeof(self._terms) + shell_sizeof(self._sizes)
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """两点间的球面距离（公里）"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def _geo_cell(lat: float, lng: float) -> Tuple[int, int]:
+    return (math.floor(lat / GEO_CELL_DEGREES), math.floor(lng / GEO_CELL_DEGREES))
+
+
+class ClinicCatalog:
+    """
+    诊所目录
+
+    对外兼容原来 ``clinics_data`` 列表的读取方式（迭代、``len``），
+    另外提供按 ID 的 O(1) 查找、索引搜索和附近诊所查询。
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self._lock = threading.RLock()
+        self._items: List[dict] = []
+        self._by_id: Dict[str, dict] = {}
+        self._order: Dict[str, int] = {}
+        self._sequence = itertools.count()
+        self._by_place: Dict[str, Set[str]] = {}
+        self._by_name: Dict[str, Set[str]] = {}
+        self._by_service: Dict[str, Set[str]] = {}
+        # 城市/地址词和名称词的三元组索引（拼写容错）
+        self._place_grams = TrigramIndex()
+        self._name_grams = TrigramIndex()
+        self._geo: Dict[Tuple[int, int], Set[str]] = {}
+        # 已删除但尚未压缩的诊所: ID -> 删除时间
+        self._tombstones: Dict[str, str] = {}
+        self._max_numeric_id = 0
+
+    def load(self, seed: Iterable[dict] = ()):
+        """加载内置诊所，再用存储后端中的记录覆盖/补充"""
+        with self._lock:
+            for clinic in seed:
+                self._put(clinic)
+            purged = []
+            for clinic in self.backend.load(CLINICS_KIND):
+                if "name" not in clinic:
+                    # 已压缩的墓碑，只保留 ID 防止内置诊所重新出现，ID 也不再分配
+                    purged.append(clinic["id"])
+                    self._reserve_id(clinic["id"])
+                    continue
+                self._put(clinic)
+                if clinic.get("deleted_at"):
+                    self._tombstones[clinic["id"]] = clinic["deleted_at"]
+            self._drop(purged)
+            self.rebuild_indexes()
+        return self
+
+    def __len__(self) -> int:
+        return len(self._by_id) - len(self._tombstones)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.list())
+
+    def list(self) -> List[dict]:
+        """所有诊所（快照，不含已删除）"""
+        with self._lock:
+            if not self._tombstones:
+                return list(self._items)
+            return [c for c in self._items if c["id"] not in self._tombstones]
+
+    def get(self, clinic_id: str) -> Optional[dict]:
+        if clinic_id in self._tombstones:
+            return None
+        return self._by_id.get(clinic_id)
+
+    def next_id(self) -> str:
+        """下一个诊所 ID（删除后也不会重复）"""
+        with self._lock:
+            self._max_numeric_id += 1
+            return str(self._max_numeric_id)
+
+    # 写入
+    def add(self, clinic: dict) -> dict:
+        """添加单个诊所并增量更新索引"""
+        with self._lock:
+            self.backend.write_batch(put_ops(CLINICS_KIND, [clinic]))
+            self._put(clinic)
+            self._index(clinic)
+        return clinic
+
+    def bulk_insert(self, clinics: List[dict]):
+        """批量写入诊所（一次存储事务），索引需在全部批次结束后调用 rebuild_indexes 重建"""
+        with self._lock:
+            self.backend.write_batch(put_ops(CLINICS_KIND, clinics))
+            for clinic in clinics:
+                self._put(clinic)
+
+    def delete(self, clinic_id: str) -> Optional[dict]:
+        """删除诊所 - 只记录墓碑，索引和列表留给后台压缩处理"""
+        with self._lock:
+            clinic = self.get(clinic_id)
+            if clinic is None:
+                return None
+            deleted_at = datetime.now().isoformat()
+            self.backend.write_batch(put_ops(CLINICS_KIND, [dict(clinic, deleted_at=deleted_at)]))
+            self._tombstones[clinic_id] = deleted_at
+            return clinic
+
+    def tombstones(self) -> Dict[str, str]:
+        """已删除、等待压缩的诊所"""
+        with self._lock:
+            return dict(self._tombstones)
+
+    def purge(self, clinic_ids: Iterable[str]) -> List[str]:
+        """压缩：从列表和索引中清除墓碑，存储中只保留最小墓碑记录"""
+        with self._lock:
+            clinic_ids = [i for i in clinic_ids if i in self._tombstones]
+            if not clinic_ids:
+                return []
+            self.backend.write_batch(put_ops(
+                CLINICS_KIND, [{"id": i, "deleted_at": self._tombstones[i]} for i in clinic_ids]
+            ))
+            self._drop(clinic_ids)
+            return clinic_ids
+
+    def _drop(self, clinic_ids: List[str]):
+        if not clinic_ids:
+            return
+        dropped = set()
+        for clinic_id in clinic_ids:
+            self._tombstones.pop(clinic_id, None)
+            clinic = self._by_id.pop(clinic_id, None)
+            if clinic is not None:
+                self._order.pop(clinic_id, None)
+                self._unindex(clinic)
+                dropped.add(clinic_id)
+        if dropped:
+            # 新列表构建完成后整体替换，读者拿到的快照不受影响
+            self._items = [c for c in self._items if c["id"] not in dropped]
+
+    def _put(self, clinic: dict):
+        old = self._by_id.get(clinic["id"])
+        if old is not None:
+            self._unindex(old)
+            self._items[self._items.index(old)] = clinic
+        else:
+            self._items.append(clinic)
+            self._order[clinic["id"]] = next(self._sequence)
+        self._by_id[clinic["id"]] = clinic
+        self._reserve_id(clinic["id"])
+
+    def _reserve_id(self, clinic_id: str):
+        if clinic_id.isdigit():
+            self._max_numeric_id = max(self._max_numeric_id, int(clinic_id))
+
+    # 索引
+    def rebuild_indexes(self):
+        """全量重建搜索和地理索引"""
+        with self._lock:
+            self._by_place, self._by_name, self._by_service, self._geo = {}, {}, {}, {}
+            self._place_grams, self._name_grams = TrigramIndex(), TrigramIndex()
+            for clinic in self._items:
+                self._index(clinic)
+
+    def _index_keys(self, clinic: dict):
+        places = tokenize(clinic.get("address", "")) | {(clinic.get("city") or "").casefold()}
+        names = tokenize(clinic.get("name", ""))
+        services = set()
+        for service in clinic.get("services", []):
+            services |= service_keys(service)
+        cell = None
+        if clinic.get("latitude") is not None and clinic.get("longitude") is not None:
+            cell = _geo_cell(clinic["latitude"], clinic["longitude"])
+        return places, names, services, cell
+
+    def _index(self, clinic: dict):
+        places, names, services, cell = self._index_keys(clinic)
+        for index, grams, keys in ((self._by_place, self._place_grams, places),
+                                   (self._by_name, self._name_grams, names)):
+            for key in keys:
+                ids = index.get(key)
+                if ids is None:
+                    ids = index[key] = set()
+                    grams.add(key)
+                ids.add(clinic["id"])
+        for key in services:
+            self._by_service.setdefault(key, set()).add(clinic["id"])
+        if cell is not None:
+            self._geo.setdefault(cell, set()).add(clinic["id"])
+
+    def _unindex(self, clinic: dict):
+        places, names, services, cell = self._index_keys(clinic)
+        for index, grams, keys in ((self._by_place, self._place_grams, places),
+                                   (self._by_name, self._name_grams, names),
+                                   (self._by_service, None, services)):
+            for key in keys:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(clinic["id"])
+                    if not ids:
+                        del index[key]
+                        if grams is not None:
+                            grams.discard(key)
+        if cell is not None and cell in self._geo:
+            self._geo[cell].discard(clinic["id"])
+
+    # 查询
+    @staticmethod
+    def _match_vocabulary(index: Dict[str, Set[str]], query: str) -> Set[str]:
+        """在索引词表（而不是全部诊所）中做子串匹配"""
+        query = query.casefold()
+        exact = index.get(query)
+        matched = set(exact) if exact else set()
+        for key, ids in index.items():
+            if query in key and key != query:
+                matched |= ids
+        return matched
+
+    @staticmethod
+    def _match_fuzzy(index: Dict[str, Set[str]], grams: TrigramIndex, query: str) -> Set[str]:
+        """先按子串匹配，匹配不到时取词表中拼写最接近的词"""
+        matched = ClinicCatalog._match_vocabulary(index, query)
+        if not matched:
+            for term in grams.closest(query):
+                matched |= index.get(term, set())
+        return matched
+
+    def _match_services(self, query: str) -> Set[str]:
+        """按服务名称的原文子串，以及查询词对应的规范名称匹配"""
+        matched = self._match_vocabulary(self._by_service, query)
+        for canonical in canonical_services(query):
+            matched |= self._by_service.get(canonical, set())
+        return matched
+
+    def _candidates(self, city: Optional[str], service: Optional[str],
+                    name: Optional[str] = None) -> Optional[Set[str]]:
+        """匹配的诊所 ID；没有查询条件时返回 None"""
+        candidates: Optional[Set[str]] = None
+        # 城市/地址和名称中的每个词都要匹配（如 Bay Street、Toronto, ON）
+        if city:
+            for word in tokenize(city) or {city.casefold()}:
+                by_place = self._match_fuzzy(self._by_place, self._place_grams, word)
+                candidates = by_place if candidates is None else candidates & by_place
+        if name:
+            for word in tokenize(name):
+                by_name = self._match_fuzzy(self._by_name, self._name_grams, word)
+                candidates = by_name if candidates is None else candidates & by_name
+        if service:
+            by_service = self._match_services(service)
+            candidates = by_service if candidates is None else candidates & by_service
+        return candidates
+
+    def search(self, city: Optional[str] = None, service: Optional[str] = None,
+               name: Optional[str] = None) -> List[dict]:
+        """按城市/地址词、名称和服务搜索诊所"""
+        with self._lock:
+            candidates = self._candidates(city, service, name)
+            if candidates is None:
+                return self.list()
+            # 按加入顺序返回，与原来遍历列表的结果顺序一致
+            return sorted(
+                (self._by_id[i] for i in candidates if i in self._by_id and i not in self._tombstones),
+                key=lambda c: self._order[c["id"]]
+            )
+
+    def matches(self, city: Optional[str] = None, service: Optional[str] = None,
+                name: Optional[str] = None, within: Optional[Iterable[str]] = None) -> List[Tuple[int, dict]]:
+        """
+        与 search 相同的匹配条件，返回 [(加入顺序, 诊所)]，不排序（由调用方只取前 k 个）
+
+        within: 只在这些诊所 ID 中匹配（如 nearby 预筛的结果），不再遍历全部诊所
+        """
+        with self._lock:
+            candidates = self._candidates(city, service, name)
+            if within is not None:
+                candidates = set(within) if candidates is None else candidates.intersection(within)
+            if candidates is None:
+                return [(self._order[c["id"]], c) for c in self._items if c["id"] not in self._tombstones]
+            return [(self._order[i], self._by_id[i]) for i in candidates
+                    if i in self._by_id and i not in self._tombstones]
+
+    def nearby(self, latitude: float, longitude: float, radius_km: float) -> List[Tuple[float, dict]]:
+        """查询半径范围内的诊所，返回 [(距离公里, 诊所)]，按距离排序"""
+        lat_span = radius_km / 111.0
+        lng_span = radius_km / max(1e-6, 111.0 * math.cos(math.radians(latitude)))
+        min_cell = _geo_cell(latitude - lat_span, longitude - lng_span)
+        max_cell = _geo_cell(latitude + lat_span, longitude + lng_span)
+        results = []
+        with self._lock:
+            for x in range(min_cell[0], max_cell[0] + 1):
+                for y in range(min_cell[1], max_cell[1] + 1):
+                    for clinic_id in self._geo.get((x, y), ()):
+                        clinic = self.get(clinic_id)
+                        if clinic is None:
+                            continue
+                        distance = haversine_km(latitude, longitude, clinic["latitude"], clinic["longitude"])
+                        if distance <= radius_km:
+                            results.append((distance, clinic))
+        results.sort(key=lambda r: r[0])
+        return results
+
+    def memory_usage(self) -> Dict[str, int]:
+        """各部分的大致内存占用（字节）"""
+        with self._lock:
+            return {
+                "records": sampled_sizeof(self._items),
+                "by_id": shell_sizeof(self._by_id) + shell_sizeof(self._order),
+                "indexes": sum(shell_sizeof(index) for index in
+                               (self._by_place, self._by_name, self._by_service, self._geo)),
+                "trigrams": self._place_grams.memory_usage() + self._name_grams.memory_usage(),
+                "tombstones": shell_sizeof(self._tombstones)
+            }
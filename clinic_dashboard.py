@@ -0,0 +1,150 @@
+"""
+诊所后台仪表盘 - 按诊所物化的预约统计视图
+
+每个诊所维护有效预约的有序时段列表（按日期、时间）以及按日期、按服务的计数，
+随预约事件增量更新。生成的视图缓存到下一个预约开始或当天结束为止
+（这两个时刻"今天"/"即将到来"的统计才会变化），期间读取是 O(1)；
+有变更或缓存过期时重新生成，O(log n + N)。
+"""
+
+import bisect
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from appointment_store import ACTIVE_STATUSES
+from memory_usage import sampled_sizeof
+
+SlotEntry = Tuple[str, str, str]  # (日期, 时间, 预约 ID)
+
+# 视图中保留的预约字段
+SUMMARY_FIELDS = ("id", "date", "time", "service", "patient_name", "patient_phone", "virtual_phone", "status")
+
+
+def normalize_time(value: str) -> str:
+    """9:00 -> 09:00，保证按字符串排序即按时间排序"""
+    hour, _, minute = value.partition(":")
+    return f"{int(hour):02d}:{minute}" if hour.isdigit() else value
+
+
+class ClinicView:
+    """一个诊所的增量统计"""
+
+    __slots__ = ("slots", "entries", "by_date", "by_service", "cached", "valid_until")
+
+    def __init__(self):
+        self.slots: List[SlotEntry] = []
+        self.entries: Dict[str, Tuple[SlotEntry, dict]] = {}
+        self.by_date: Counter = Counter()
+        self.by_service: Counter = Counter()
+        self.cached: Optional[Dict[str, Any]] = None
+        self.valid_until = 0.0
+
+    def add(self, appointment: dict):
+        entry = (appointment["date"], normalize_time(appointment["time"]), appointment["id"])
+        summary = {k: appointment.get(k) for k in SUMMARY_FIELDS}
+        bisect.insort(self.slots, entry)
+        self.entries[appointment["id"]] = (entry, summary)
+        self.by_date[entry[0]] += 1
+        self.by_service[summary["service"]] += 1
+        self.cached = None
+
+    def remove(self, appointment_id: str):
+        found = self.entries.pop(appointment_id, None)
+        if found is None:
+            return
+        entry, summary = found
+        index = bisect.bisect_left(self.slots, entry)
+        if index < len(self.slots) and self.slots[index] == entry:
+            del self.slots[index]
+        for counter, key in ((self.by_date, entry[0]), (self.by_service, summary["service"])):
+            counter[key] -= 1
+            if counter[key] <= 0:
+                del counter[key]
+        self.cached = None
+
+
+class ClinicDashboards:
+    """所有诊所的仪表盘视图"""
+
+    def __init__(self, next_size: int = 10):
+        self.next_size = next_size
+        self._lock = threading.RLock()
+        self._views: Dict[str, ClinicView] = {}
+        self.rebuilds = 0
+
+    def load(self, appointments):
+        with self._lock:
+            for appointment in appointments:
+                self.apply(appointment)
+        return self
+
+    def apply(self, appointment: dict):
+        """按预约的当前状态更新视图（新建、取消、改约都走这里）"""
+        with self._lock:
+            view = self._views.get(appointment["clinic_id"])
+            if view is None:
+                view = self._views[appointment["clinic_id"]] = ClinicView()
+            view.remove(appointment["id"])
+            if appointment.get("status") in ACTIVE_STATUSES:
+                view.add(appointment)
+
+    def drop(self, clinic_id: str):
+        with self._lock:
+            self._views.pop(clinic_id, None)
+
+    def get(self, clinic_id: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """诊所仪表盘；缓存有效时直接返回"""
+        now = now or datetime.now()
+        with self._lock:
+            view = self._views.get(clinic_id)
+            if view is None:
+                view = self._views[clinic_id] = ClinicView()
+            if view.cached is None or now.timestamp() >= view.valid_until:
+                view.cached, view.valid_until = self._render(view, now)
+                self.rebuilds += 1
+            return view.cached
+
+    def booked(self, clinic_ids: Iterable[str], dates: Iterable[str]) -> Dict[str, int]:
+        """各诊所在给定日期内的有效预约数（按日期计数求和，不遍历预约）"""
+        dates = list(dates)
+        with self._lock:
+            counts = {}
+            for clinic_id in clinic_ids:
+                view = self._views.get(clinic_id)
+                counts[clinic_id] = sum(view.by_date.get(d, 0) for d in dates) if view is not None else 0
+            return counts
+
+    def _render(self, view: ClinicView, now: datetime) -> Tuple[Dict[str, Any], float]:
+        today = now.strftime("%Y-%m-%d")
+        current = (today, now.strftime("%H:%M"), "")
+        start = bisect.bisect_left(view.slots, current)
+        upcoming = view.slots[start:start + self.next_size]
+        tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        valid_until = tomorrow.timestamp()
+        if upcoming:
+            date, time_, _ = upcoming[0]
+            try:
+                starts_at = datetime.strptime(f"{date} {time_}", "%Y-%m-%d %H:%M")
+                # 下一个预约开始后"即将到来"的统计会变化
+                valid_until = min(valid_until, (starts_at + timedelta(minutes=1)).timestamp())
+            except ValueError:
+                pass
+        rendered = {
+            "today_appointments": view.by_date.get(today, 0),
+            "upcoming_appointments": len(view.slots) - start,
+            "active_appointments": len(view.slots),
+            "service_breakdown": dict(view.by_service.most_common()),
+            "next_appointments": [dict(view.entries[entry[2]][1]) for entry in upcoming],
+            "generated_at": now.isoformat()
+        }
+        return rendered, valid_until
+
+    def memory_usage(self) -> Dict[str, int]:
+        """视图（含缓存的渲染结果）的大致内存占用（字节）"""
+        with self._lock:
+            return {"views": sampled_sizeof(self._views)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"clinics": len(self._views), "rebuilds": self.rebuilds}
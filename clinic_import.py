@@ -0,0 +1,222 @@
+"""
+诊所批量导入 - 流式解析 CSV / NDJSON 上传内容
+
+请求体按块读取、逐行解析，不会把整个上传内容读入内存；
+校验通过的行按批写入诊所目录（每批一次存储事务），全部导入结束后只重建一次索引。
+"""
+
+import codecs
+import csv
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+# 每批写入的行数
+IMPORT_CHUNK_SIZE = 1000
+
+# 报告中最多返回的错误行数
+MAX_REPORTED_ERRORS = 1000
+
+DEFAULT_HOURS = "周一至周五: 9:00 AM - 6:00 PM"
+DEFAULT_RATING = 4.5
+
+REQUIRED_FIELDS = ("name", "address", "phone", "email", "city", "services")
+
+# 服务列表分隔符
+_SERVICE_SEPARATORS = (";", "|", "、", "，")
+
+# (行号, 原始记录或解析错误信息)
+Row = Tuple[int, Any]
+
+
+def detect_format(content_type: Optional[str], explicit: Optional[str] = None) -> str:
+    """根据 format 参数或 Content-Type 判断上传格式"""
+    if explicit:
+        return "ndjson" if explicit.lower() in ("ndjson", "jsonl", "json") else "csv"
+    content_type = (content_type or "").lower()
+    if "ndjson" in content_type or "jsonl" in content_type or "json" in content_type:
+        return "ndjson"
+    return "csv"
+
+
+def _optional_float(value: Any, field: str, low: float, high: float) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} 必须是数字")
+    if not low <= number <= high:
+        raise ValueError(f"{field} 超出范围 [{low}, {high}]")
+    return number
+
+
+def normalize_clinic_row(raw: Any) -> Dict[str, Any]:
+    """校验并规范化一行诊所数据（不含 ID），不合法时抛出 ValueError"""
+    if not isinstance(raw, dict):
+        raise ValueError("每行必须是一个对象")
+    row = {str(k).strip().lower(): v for k, v in raw.items() if k is not None}
+
+    missing = [f for f in REQUIRED_FIELDS if not row.get(f)]
+    if missing:
+        raise ValueError(f"缺少字段: {', '.join(missing)}")
+
+    services = row["services"]
+    if isinstance(services, str):
+        for separator in _SERVICE_SEPARATORS:
+            services = services.replace(separator, ",")
+        services = services.split(",")
+    if not isinstance(services, list):
+        raise ValueError("services 必须是字符串或列表")
+    services = [str(s).strip() for s in services if str(s).strip()]
+    if not services:
+        raise ValueError("services 不能为空")
+
+    if "@" not in str(row["email"]):
+        raise ValueError("email 格式错误")
+
+    rating = _optional_float(row.get("rating"), "rating", 0, 5)
+    latitude = _optional_float(row.get("latitude", row.get("lat")), "latitude", -90, 90)
+    longitude = _optional_float(row.get("longitude", row.get("lng")), "longitude", -180, 180)
+    if (latitude is None) != (longitude is None):
+        raise ValueError("latitude 和 longitude 必须同时提供")
+
+    clinic = {
+        "name": str(row["name"]).strip(),
+        "address": str(row["address"]).strip(),
+        "phone": str(row["phone"]).strip(),
+        "email": str(row["email"]).strip(),
+        "rating": DEFAULT_RATING if rating is None else rating,
+        "services": services,
+        "hours": str(row.get("hours") or DEFAULT_HOURS).strip(),
+        "city": str(row["city"]).strip()
+    }
+    if latitude is not None:
+        clinic["latitude"] = latitude
+        clinic["longitude"] = longitude
+    return clinic
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """把字节块流解码并拆分为行（保留不完整的末行直到下一块到达）"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_rows(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Row]:
+    """逐行产出 (行号, 记录)；无法解析的行产出错误信息字符串"""
+    row_number = 0
+    if fmt == "ndjson":
+        async for line in _iter_lines(chunks):
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                yield row_number, json.loads(line)
+            except ValueError as e:
+                yield row_number, f"JSON 解析失败: {e}"
+        return
+
+    header: Optional[List[str]] = None
+    record = ""
+    async for line in _iter_lines(chunks):
+        # 引号内的换行：继续拼接直到引号配对
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            row_number += 1
+            yield row_number, f"CSV 解析失败: {e}"
+            continue
+        if header is None:
+            header = [h.strip().lower() for h in values]
+            continue
+        row_number += 1
+        if len(values) != len(header):
+            yield row_number, f"列数不匹配: 期望 {len(header)} 列，实际 {len(values)} 列"
+            continue
+        yield row_number, dict(zip(header, values))
+    if record:
+        row_number += 1
+        yield row_number, "CSV 解析失败: 引号未闭合"
+
+
+async def iter_row_chunks(chunks: AsyncIterator[bytes], fmt: str, size: int = IMPORT_CHUNK_SIZE) -> AsyncIterator[List[Row]]:
+    """按 size 行一批产出"""
+    batch: List[Row] = []
+    async for row in iter_rows(chunks, fmt):
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ClinicImporter:
+    """一次批量导入的状态：分批写入诊所目录并统计结果"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.clinic_ids: List[str] = []
+        self.started = time.perf_counter()
+
+    def _error(self, row_number: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
+
+    def import_chunk(self, rows: List[Row]):
+        """校验一批行并一次性写入"""
+        clinics = []
+        for row_number, raw in rows:
+            if isinstance(raw, str):
+                self._error(row_number, raw)
+                continue
+            try:
+                clinic = normalize_clinic_row(raw)
+            except ValueError as e:
+                self._error(row_number, str(e))
+                continue
+            clinic = {"id": self.catalog.next_id(), **clinic}
+            clinics.append(clinic)
+        if clinics:
+            self.catalog.bulk_insert(clinics)
+            self.imported += len(clinics)
+            self.clinic_ids.extend(c["id"] for c in clinics)
+
+    def finish(self):
+        """全部批次写入后统一重建索引"""
+        if self.imported:
+            self.catalog.rebuild_indexes()
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        total = self.imported + self.failed
+        return {
+            "success": self.failed == 0,
+            "message": f"导入 {self.imported} 个诊所，失败 {self.failed} 行",
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(total / elapsed, 1) if elapsed > 0 else None
+        }
@@ -0,0 +1,216 @@
+"""
+诊所搜索排序 - 按文本相关度、评分、距离和近期可预约程度的综合得分取前 k 个
+
+每个分量归一化到 [0, 1]：
+  - relevance: 查询词与城市/地址词、名称词、服务名称的匹配程度（相同 1.0，前缀 0.8，
+    包含 0.5；服务的同义写法 0.9；只能靠拼写容错匹配时为 0.5 x (1 - 编辑距离 / 长度)）
+  - rating: 评分 / 5
+  - distance: 1 / (1 + 距离 / DISTANCE_SCALE_KM)，请求没有带位置时不参与
+  - availability: 未来 availability_days 天营业时段中尚未被预约的比例
+    （预约数来自诊所仪表盘按日期的计数，营业时段从 hours 文本解析）
+综合得分是参与的分量的加权平均。只需要前 k 个结果，所以用大小为 k 的堆
+（heapq.nlargest，O(n log k)）而不是对全部候选排序；得分相同时按诊所加入顺序。
+"""
+
+import heapq
+import re
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from clinic_catalog import (
+    canonical_services, fuzzy_similarity, haversine_km, service_keys, tokenize
+)
+
+SORTS = ("score", "rating", "distance", "availability")
+DEFAULT_WEIGHTS = {"relevance": 0.4, "rating": 0.3, "distance": 0.2, "availability": 0.1}
+DISTANCE_SCALE_KM = 5.0
+SLOT_MINUTES = 30
+
+WEEKDAY_NAMES = "一二三四五六日"
+# (营业日, 开门分钟, 关门分钟)；hours 解析不了时按周一至周五 9:00-18:00
+Hours = Tuple[Tuple[int, ...], int, int]
+DEFAULT_HOURS: Hours = ((0, 1, 2, 3, 4), 9 * 60, 18 * 60)
+
+_HOURS_RE = re.compile(
+    r"周([一二三四五六日])(?:至周([一二三四五六日]))?\s*[:：]\s*"
+    r"(\d{1,2}):(\d{2})\s*(AM|PM)\s*-\s*(\d{1,2}):(\d{2})\s*(AM|PM)",
+    re.IGNORECASE
+)
+
+
+def parse_weights(text: str) -> Dict[str, float]:
+    """解析 "relevance=0.5,rating=0.5" 格式的权重，未列出的分量保持默认值"""
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        name, _, value = item.partition("=")
+        if name.strip() not in DEFAULT_WEIGHTS:
+            raise ValueError(f"未知的排序分量: {name.strip()}")
+        weights[name.strip()] = float(value)
+    return weights
+
+
+def _minutes(hour: str, minute: str, meridiem: str) -> int:
+    return (int(hour) % 12 + (12 if meridiem.upper() == "PM" else 0)) * 60 + int(minute)
+
+
+@lru_cache(maxsize=1024)
+def parse_hours(text: Optional[str]) -> Hours:
+    """营业时间文本（如 周一至周五: 9:00 AM - 6:00 PM）-> (营业日, 开门分钟, 关门分钟)"""
+    match = _HOURS_RE.search(text or "")
+    if match is None:
+        return DEFAULT_HOURS
+    first = WEEKDAY_NAMES.index(match.group(1))
+    last = WEEKDAY_NAMES.index(match.group(2) or match.group(1))
+    days = tuple(range(first, last + 1)) if first <= last else tuple(range(first, 7)) + tuple(range(0, last + 1))
+    return days, _minutes(*match.group(3, 4, 5)), _minutes(*match.group(6, 7, 8))
+
+
+def _match_strength(query: str, value: str) -> float:
+    """查询词（已折叠）与一个值的匹配程度"""
+    value = value.casefold().strip()
+    if value == query:
+        return 1.0
+    if value.startswith(query):
+        return 0.8
+    return 0.5 if query in value else 0.0
+
+
+def _fuzzy_strength(query: str, values: Iterable[str]) -> float:
+    """拼写容错的匹配程度: 最接近的值的相似度减半"""
+    return 0.5 * max((fuzzy_similarity(query, value) for value in values), default=0.0)
+
+
+def relevance(clinic: dict, city: Optional[str], service: Optional[str], name: Optional[str] = None) -> float:
+    """查询词与诊所的匹配程度；没有查询词时为 1"""
+    parts = []
+    if city:
+        query = city.casefold().strip()
+        if query == (clinic.get("city") or "").casefold():
+            parts.append(1.0)
+        else:
+            # 逐词匹配（如 Bay Street）；地址中的词比城市字段低一档
+            city_words = tokenize(clinic.get("city"))
+            address_words = tokenize(clinic.get("address", ""))
+            for word in tokenize(query) or {query}:
+                place = max([0.0] + [_match_strength(word, w) for w in city_words]
+                            + [0.8 * _match_strength(word, w) for w in address_words])
+                parts.append(place or _fuzzy_strength(word, city_words | address_words))
+    if name:
+        words = tokenize(clinic.get("name", ""))
+        for query in tokenize(name):
+            strength = max((_match_strength(query, word) for word in words), default=0.0)
+            parts.append(strength or _fuzzy_strength(query, words))
+    if service:
+        query = service.casefold()
+        canonical = set(canonical_services(query))
+        strength = 0.0
+        for label in clinic.get("services", []):
+            # 中英双语的服务名称（洗牙 / Cleaning）分别匹配；同义写法比原文匹配低一档
+            strength = max([strength] + [_match_strength(query, part) for part in label.split("/")])
+            if canonical & service_keys(label):
+                strength = max(strength, 0.9)
+        parts.append(strength)
+    return sum(parts) / len(parts) if parts else 1.0
+
+
+class ClinicRanker:
+    """在诊所目录的匹配结果中按得分取前 k 个"""
+
+    def __init__(self, catalog, dashboards, weights: Optional[Dict[str, float]] = None, availability_days: int = 7):
+        self.catalog = catalog
+        self.dashboards = dashboards
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.availability_days = availability_days
+
+    def availability(self, clinics: Iterable[dict], today: Optional[date] = None) -> Dict[str, float]:
+        """各诊所未来 availability_days 天的空闲时段比例"""
+        today = today or date.today()
+        days = [today + timedelta(days=i) for i in range(self.availability_days)]
+        clinics = list(clinics)
+        booked = self.dashboards.booked((c["id"] for c in clinics), [d.isoformat() for d in days])
+        weekdays = [d.weekday() for d in days]
+        capacities: Dict[Optional[str], int] = {}  # 营业时间文本 -> 这几天的时段数，大部分诊所共用几种写法
+        result = {}
+        for clinic in clinics:
+            hours = clinic.get("hours")
+            capacity = capacities.get(hours)
+            if capacity is None:
+                open_days, opens, closes = parse_hours(hours)
+                capacity = capacities[hours] = (
+                    max(0, closes - opens) // SLOT_MINUTES * sum(1 for day in weekdays if day in open_days)
+                )
+            result[clinic["id"]] = max(0.0, 1 - booked[clinic["id"]] / capacity) if capacity else 0.0
+        return result
+
+    def rank(
+        self,
+        city: Optional[str] = None,
+        service: Optional[str] = None,
+        sort: Optional[str] = None,
+        limit: Optional[int] = None,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        today: Optional[date] = None,
+        name: Optional[str] = None,
+        radius_km: Optional[float] = None
+    ) -> Tuple[List[dict], int]:
+        """
+        返回 (前 limit 个诊所, 匹配总数)
+
+        sort 为 None 时保持诊所加入顺序（原来的顺序），返回原记录；否则按 sort 指定
+        的得分从高到低，返回带 score / score_details（带位置时还有 distance_km）的副本。
+        radius_km 只在该半径内的诊所中匹配（从诊所目录的地理网格索引取候选，距离不再重算）。
+        """
+        if sort is not None and sort not in SORTS:
+            raise ValueError(f"sort 必须是 {', '.join(SORTS)} 之一")
+        located = latitude is not None and longitude is not None
+        if sort == "distance" and not located:
+            raise ValueError("按距离排序需要 latitude 和 longitude")
+        if radius_km is not None and (not located or radius_km <= 0):
+            raise ValueError("按半径筛选需要 latitude、longitude 和大于 0 的 radius_km")
+        near: Dict[str, float] = {}
+        if radius_km is not None:
+            near = {clinic["id"]: distance for distance, clinic in self.catalog.nearby(latitude, longitude, radius_km)}
+        matches = self.catalog.matches(city, service, name, within=near if radius_km is not None else None)
+        total = len(matches)
+        k = total if limit is None else max(0, min(limit, total))
+        if sort is None:
+            return [clinic for _, clinic in heapq.nsmallest(k, matches, key=lambda m: m[0])], total
+        if k == 0:
+            return [], total
+
+        weights = {name: weight for name, weight in self.weights.items() if weight > 0 and (located or name != "distance")}
+        total_weight = sum(weights.values()) or 1.0
+        parts_needed = set(weights) if sort == "score" else {sort}
+        free = self.availability((c for _, c in matches), today) if "availability" in parts_needed else {}
+
+        def scored():
+            for position, clinic in matches:
+                parts = {}
+                distance = near.get(clinic["id"])
+                has_location = clinic.get("latitude") is not None and clinic.get("longitude") is not None
+                if distance is None and located and has_location:
+                    distance = haversine_km(latitude, longitude, clinic["latitude"], clinic["longitude"])
+                if "distance" in parts_needed:
+                    parts["distance"] = 1 / (1 + distance / DISTANCE_SCALE_KM) if distance is not None else 0.0
+                if "relevance" in parts_needed:
+                    parts["relevance"] = relevance(clinic, city, service, name)
+                if "rating" in parts_needed:
+                    parts["rating"] = min(max(float(clinic.get("rating") or 0) / 5, 0.0), 1.0)
+                if "availability" in parts_needed:
+                    parts["availability"] = free[clinic["id"]]
+                if sort == "score":
+                    score = sum(weights[name] * value for name, value in parts.items()) / total_weight
+                else:
+                    score = parts[sort]
+                yield score, -position, clinic, parts, distance
+
+        results = []
+        for score, _, clinic, parts, distance in heapq.nlargest(k, scored(), key=lambda s: (s[0], s[1])):
+            result = dict(clinic, score=round(score, 4),
+                          score_details={name: round(value, 4) for name, value in parts.items()})
+            if distance is not None:
+                result["distance_km"] = round(distance, 2)
+            results.append(result)
+        return results, total
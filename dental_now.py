@@ -1,20 +1,74 @@
-from fastapi import FastAPI, Request, Form, Cookie, Response
+# 最先导入：开始记录启动耗时和之后每个模块的导入耗时
+from startup import PageCache, StartupMiddleware, startup_timer
+
+from fastapi import FastAPI, Request, Form, Cookie, Query, Response, WebSocket
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-import uvicorn
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional
 import sys
 import os
 from pathlib import Path
 
+from analytics import AppointmentFacts
+from appointment_store import AppointmentNotActive, AppointmentNotFound, AppointmentStore, SlotTaken
+from call_log import CALL_DIRECTIONS, CallLog, CallNotFound
+from clinic_catalog import ClinicCatalog
+from clinic_dashboard import ClinicDashboards
+from clinic_import import ClinicImporter, detect_format, iter_row_chunks
+from clinic_search import ClinicRanker, parse_weights
+from event_bus import (
+    APPOINTMENT_EVENTS, BLOCK, AppointmentCancelled, AppointmentCreated, AppointmentRescheduled,
+    ClinicAdded, ClinicDeleted, ClinicsImported, Event, EventBus
+)
+from health import LoopMonitor, ReadinessCheck, memory_rss
+from memory_usage import TraceSession
+from metrics import MetricsMiddleware, MetricsRegistry, RouteResolver
+from notifications import JobQueue, NotificationDispatcher, appointment_notifications, create_sinks
+from profiler import ProfilingMiddleware, RequestProfiler
+from realtime import CLOSE_NOT_FOUND, AdminStatsStream, ClinicFeedHub
+from reminder_scheduler import ReminderScheduler
+from slow_requests import SlowRequestMiddleware, SlowRequestWatchdog, parse_budgets
+from storage import StorageError, create_backend
+from user_directory import UserDirectory, InvalidCursor, public_user
+from virtual_numbers import PoolExhausted, VirtualNumberPool, number_range
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期 - 启动和停止后台任务"""
+    tasks = [
+        asyncio.create_task(compact_clinics_periodically()),
+        clinic_feed.start(),
+        admin_stream.start(),
+        *event_bus.start(),
+        *notification_dispatcher.start(),
+        asyncio.create_task(reminder_scheduler.run(send_reminders)),
+        asyncio.create_task(maintain_virtual_numbers()),
+        asyncio.create_task(request_metrics.run()),
+        asyncio.create_task(slow_request_watchdog.run()),
+        asyncio.create_task(loop_monitor.run())
+    ]
+    # 预热完成后 uvicorn 才开始监听端口
+    await run_in_threadpool(warm_up)
+    startup_timer.mark("warmed")
+    yield
+    event_bus.stop()
+    for task in tasks:
+        task.cancel()
+    virtual_numbers.save()
+    call_log.close()
+
 # 创建FastAPI应用
 app = FastAPI(
     title="DentalReserve",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS设置 - 允许所有来源
@@ -26,6 +80,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求指标（/metrics）- 多 worker 部署时设置 METRICS_MULTIPROC_DIR，各 worker 通过文件汇总
+request_metrics = MetricsRegistry(
+    os.environ.get("METRICS_MULTIPROC_DIR") or None,
+    flush_interval=float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+)
+# 各中间件共用的路由匹配（每个请求只匹配一次）
+route_resolver = RouteResolver(app.routes)
+app.add_middleware(MetricsMiddleware, registry=request_metrics, resolver=route_resolver)
+
+# 请求采样分析（/api/admin/profiles）- 按 PROFILE_SAMPLE_RATE 随机采样，或带 PROFILE_SECRET 签名的 X-Profile 请求头
+request_profiler = RequestProfiler(
+    sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),
+    secret=os.environ.get("PROFILE_SECRET"),
+    interval=float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+)
+app.add_middleware(ProfilingMiddleware, profiler=request_profiler, resolver=route_resolver)
+
 # 设置基础目录 - 只定义一次
 BASE_DIR = Path(__file__).parent
 
@@ -40,8 +111,17 @@ static_dir.mkdir(exist_ok=True)
 # 设置静态文件目录
 app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 
-# 诊所数据
-clinics_data = [
+# 页面缓存 - 启动预热时读入内存，模板文件修改后自动重新读取
+PAGES = ("index.html", "clinic_dashboard.html", "admin_dashboard.html")
+page_cache = PageCache(templates_dir)
+
+# 数据存储 - 默认内存存储，设置 STORAGE_BACKEND=sqlite 后持久化到 DATA_DIR
+DATA_DIR = Path(os.environ.get("DATA_DIR", BASE_DIR / "data"))
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "memory")
+storage_backend = create_backend(STORAGE_BACKEND, DATA_DIR)
+
+# 内置诊所数据
+DEFAULT_CLINICS = [
     {
         "id": "1",
         "name": "Toronto Downtown Dental",
@@ -51,7 +131,9 @@ clinics_data = [
         "rating": 4.5,
         "services": ["洗牙", "补牙", "根管治疗"],
         "hours": "周一至周五: 9:00 AM - 6:00 PM",
-        "city": "Toronto"
+        "city": "Toronto",
+        "latitude": 43.6465,
+        "longitude": -79.3791
     },
     {
         "id": "2",
@@ -62,7 +144,9 @@ clinics_data = [
         "rating": 4.8,
         "services": ["牙齿矫正", "种植牙", "牙齿美白"],
         "hours": "周一至周六: 8:30 AM - 7:00 PM",
-        "city": "Vancouver"
+        "city": "Vancouver",
+        "latitude": 49.2838,
+        "longitude": -123.1164
     },
     {
         "id": "3",
@@ -73,7 +157,9 @@ clinics_data = [
         "rating": 4.6,
         "services": ["洗牙", "牙齿美白", "牙周治疗"],
         "hours": "周一至周五: 8:00 AM - 5:00 PM",
-        "city": "Montreal"
+        "city": "Montreal",
+        "latitude": 45.5027,
+        "longitude": -73.5732
     },
     {
         "id": "4",
@@ -84,19 +170,133 @@ clinics_data = [
         "rating": 4.7,
         "services": ["儿童牙科", "补牙", "牙齿矫正"],
         "hours": "周一至周六: 9:00 AM - 8:00 PM",
-        "city": "Calgary"
+        "city": "Calgary",
+        "latitude": 51.0455,
+        "longitude": -114.0656
     }
 ]
 
-# 用户数据
-users_data = {
+# 诊所数据（按 ID、城市/服务和地理位置索引）
+clinics_data = ClinicCatalog(storage_backend).load(DEFAULT_CLINICS)
+
+# 已删除诊所的后台压缩间隔（秒）
+CLINIC_COMPACTION_INTERVAL = float(os.environ.get("CLINIC_COMPACTION_INTERVAL", "60"))
+
+# 用户数据（按邮箱存储，带角色和前缀索引；存储后端中的用户覆盖/补充内置用户）
+users_data = UserDirectory({
     "patient@example.com": {"password": "Patient123!", "name": "张三", "role": "patient"},
     "admin@dentalreserve.ca": {"password": "Admin123!", "name": "管理员", "role": "admin"},
     "dr.smith@torontodental.com": {"password": "Doctor123!", "name": "Dr. Smith", "role": "doctor"}
-}
+}).load(storage_backend)
+
+# 预约数据（按 ID 和时段索引，带增量同步的变更日志）
+appointments_data = AppointmentStore(
+    storage_backend,
+    change_log_size=int(os.environ.get("APPOINTMENT_CHANGE_LOG_SIZE", "100000"))
+).load()
+
+# 虚拟号码池（默认 +1 (416) 555-1000 ~ 9999），sqlite 存储时租约保存到 VIRTUAL_NUMBERS_FILE
+# 同时未到期的预约超过号码数时，新预约不带虚拟号码（见 virtual_numbers.py）
+VIRTUAL_NUMBERS_FILE = DATA_DIR / "virtual_numbers.json"
+VIRTUAL_NUMBERS_SAVE_INTERVAL = float(os.environ.get("VIRTUAL_NUMBERS_SAVE_INTERVAL", "10"))
+# 诊所自己的电话不参与分配
+_clinic_phones = {clinic.get("phone") for clinic in clinics_data}
+virtual_numbers = VirtualNumberPool(
+    [number for number in number_range(os.environ.get("VIRTUAL_NUMBER_PREFIX", "+1 (416) 555-"),
+                                       os.environ.get("VIRTUAL_NUMBER_RANGE", "1000-9999"))
+     if number not in _clinic_phones],
+    path=VIRTUAL_NUMBERS_FILE if STORAGE_BACKEND == "sqlite" else None,
+    grace_days=int(os.environ.get("VIRTUAL_NUMBER_GRACE_DAYS", "1"))
+).load(appointments_data)
+
+# 通话记录（每个诊所最近 CALL_RECENT_SIZE 条在内存中），sqlite 存储时追加写入 CALL_LOGS_FILE
+CALL_LOGS_FILE = DATA_DIR / "call_logs.json"
+call_log = CallLog(
+    CALL_LOGS_FILE if STORAGE_BACKEND == "sqlite" else None,
+    recent_size=int(os.environ.get("CALL_RECENT_SIZE", "200"))
+).load()
+
+# 诊所后台仪表盘（按诊所物化的统计视图，随预约事件增量更新）
+# 仪表盘只缓存接下来 DASHBOARD_NEXT_SIZE 个预约，?next= 不能超过这个数
+DASHBOARD_NEXT_SIZE = int(os.environ.get("DASHBOARD_NEXT_SIZE", "10"))
+clinic_dashboards = ClinicDashboards(next_size=DASHBOARD_NEXT_SIZE).load(appointments_data)
+
+# 搜索排序 - 相关度、评分、距离、未来 SEARCH_AVAILABILITY_DAYS 天可预约程度的加权得分（SEARCH_WEIGHTS）
+clinic_ranker = ClinicRanker(
+    clinics_data,
+    clinic_dashboards,
+    weights=parse_weights(os.environ.get("SEARCH_WEIGHTS", "")),
+    availability_days=int(os.environ.get("SEARCH_AVAILABILITY_DAYS", "7"))
+)
 
-# 预约数据
-appointments_data = []
+# 预约分析（列式事实表）
+appointment_facts = AppointmentFacts().load(appointments_data)
+
+# 诊所后台实时推送（WebSocket）
+clinic_feed = ClinicFeedHub(
+    queue_size=int(os.environ.get("WS_QUEUE_SIZE", "256")),
+    heartbeat_interval=float(os.environ.get("WS_HEARTBEAT_INTERVAL", "25")),
+    idle_timeout=float(os.environ.get("WS_IDLE_TIMEOUT", "75"))
+)
+
+# 管理员后台统计推送（SSE），推送间隔至少 SSE_MIN_INTERVAL 秒
+admin_stream = AdminStatsStream(
+    snapshot=lambda: compute_admin_stats(),
+    min_interval=float(os.environ.get("SSE_MIN_INTERVAL", "1"))
+)
+
+# 事件总线 - 路由只发布事件，推送等副作用由订阅者异步处理
+event_bus = EventBus(publish_timeout=float(os.environ.get("EVENT_PUBLISH_TIMEOUT", "5")))
+
+# 通知队列 - 预约短信/邮件通过后台队列发送；sqlite 存储时队列也持久化到 DATA_DIR
+notification_dispatcher = NotificationDispatcher(
+    JobQueue(
+        os.environ.get("NOTIFICATION_QUEUE_PATH",
+                       str(DATA_DIR / "notifications.db") if STORAGE_BACKEND == "sqlite" else ":memory:"),
+        max_attempts=int(os.environ.get("NOTIFICATION_MAX_ATTEMPTS", "5")),
+        retry_base=float(os.environ.get("NOTIFICATION_RETRY_BASE", "2"))
+    ),
+    create_sinks(os.environ, DATA_DIR / "outbox" if STORAGE_BACKEND == "sqlite" else None),
+    concurrency=int(os.environ.get("NOTIFICATION_CONCURRENCY", "2")),
+    batch_size=int(os.environ.get("NOTIFICATION_BATCH_SIZE", "50"))
+)
+
+# 预约提醒（预约前 24 小时和 2 小时，已过发送时间的不补发），启动时根据预约重建
+reminder_scheduler = ReminderScheduler(
+    appointments_data,
+    storage_backend,
+    batch_size=int(os.environ.get("REMINDER_BATCH_SIZE", "500"))
+).load()
+
+# 慢请求日志 - 超出路由延迟预算（秒）的请求记录调用栈；sqlite 存储时写入轮转日志 SLOW_REQUEST_LOG
+slow_request_watchdog = SlowRequestWatchdog(
+    parse_budgets(os.environ.get("SLOW_REQUEST_BUDGETS", "")),
+    default_budget=float(os.environ.get("SLOW_REQUEST_BUDGET", "1")),
+    path=os.environ.get("SLOW_REQUEST_LOG",
+                        str(DATA_DIR / "slow_requests.log") if STORAGE_BACKEND == "sqlite" else "") or None,
+    max_bytes=int(os.environ.get("SLOW_REQUEST_LOG_BYTES", str(5 * 1024 * 1024))),
+    loop_stall=float(os.environ.get("LOOP_STALL_THRESHOLD", "0.5"))
+)
+app.add_middleware(SlowRequestMiddleware, watchdog=slow_request_watchdog, resolver=route_resolver)
+
+# 就绪检查 - 超过阈值时 /health/ready 返回 503（阈值为 0 表示不检查）
+loop_monitor = LoopMonitor(interval=float(os.environ.get("LOOP_LAG_INTERVAL", "0.25")))
+readiness = ReadinessCheck(
+    loop_monitor,
+    storage_backend,
+    {"notification_backlog": notification_dispatcher.backlog, "event_bus_depth": event_bus.depth},
+    max_loop_lag=float(os.environ.get("READY_MAX_LOOP_LAG", "0.5")),
+    max_threadpool_queue=int(os.environ.get("READY_MAX_THREADPOOL_QUEUE", "50")),
+    max_storage_latency=float(os.environ.get("READY_MAX_STORAGE_LATENCY", "0.5")),
+    max_backlog=int(os.environ.get("READY_MAX_BACKLOG", "10000")),
+    max_rss_mb=float(os.environ.get("READY_MAX_RSS_MB", "0"))
+)
+
+# 批量预约单次请求的上限
+MAX_BATCH_APPOINTMENTS = 5000
+
+# 预约必填字段
+APPOINTMENT_FIELDS = ("clinic_id", "date", "time", "service", "patient_name", "patient_email", "patient_phone")
 
 # 会话管理
 def create_session_token(email: str):
@@ -115,9 +315,9 @@ def verify_session_token(token: str):
 async def home():
     """主页 - 使用提供的 index.html"""
     try:
-        index_path = templates_dir / "index.html"
-        if not index_path.exists():
-            print(f"⚠️ 警告: index.html 不存在于 {index_path}")
+        content = page_cache.get("index.html")
+        if content is None:
+            print(f"⚠️ 警告: index.html 不存在于 {templates_dir / 'index.html'}")
             # 返回一个简单的主页作为后备
             fallback_html = """
             <!DOCTYPE html>
@@ -162,8 +362,6 @@ async def home():
             """
             return HTMLResponse(content=fallback_html)
 
-        with open(index_path, "r", encoding="utf-8") as f:
-            content = f.read()
         return HTMLResponse(content=content)
     except Exception as e:
         print(f"❌ 读取主页错误: {e}")
@@ -184,12 +382,11 @@ async def home():
 async def clinic_dashboard():
     """诊所后台管理页面"""
     try:
-        clinic_path = templates_dir / "clinic_dashboard.html"
-        if not clinic_path.exists():
+        content = page_cache.get("clinic_dashboard.html")
+        if content is None:
             return HTMLResponse(content="<h1>诊所后台页面未找到</h1><p>请上传 clinic_dashboard.html 文件到 templates 目录</p>", status_code=404)
 
-        with open(clinic_path, "r", encoding="utf-8") as f:
-            return HTMLResponse(content=f.read())
+        return HTMLResponse(content=content)
     except Exception as e:
         return HTMLResponse(content=f"<h1>错误</h1><p>{str(e)}</p>", status_code=500)
 
@@ -197,12 +394,11 @@ async def clinic_dashboard():
 async def admin_dashboard():
     """管理员后台页面"""
     try:
-        admin_path = templates_dir / "admin_dashboard.html"
-        if not admin_path.exists():
+        content = page_cache.get("admin_dashboard.html")
+        if content is None:
             return HTMLResponse(content="<h1>管理员后台页面未找到</h1><p>请上传 admin_dashboard.html 文件到 templates 目录</p>", status_code=404)
 
-        with open(admin_path, "r", encoding="utf-8") as f:
-            return HTMLResponse(content=f.read())
+        return HTMLResponse(content=content)
     except Exception as e:
         return HTMLResponse(content=f"<h1>错误</h1><p>{str(e)}</p>", status_code=500)
 
@@ -227,26 +423,38 @@ def health():
         "port": os.environ.get("PORT", "8000")
     }
 
+@app.get("/health/live")
+async def health_live():
+    """存活检查 - 不访问任何数据，常数时间"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def health_ready():
+    """就绪检查 - 事件循环延迟、线程池排队、存储延迟、后台队列积压和内存，超过阈值返回 503"""
+    result = readiness.check()
+    result["loop"] = loop_monitor.stats()
+    return JSONResponse(result, status_code=200 if result["status"] == "ready" else 503)
+
 @app.get("/api/clinics")
 def get_clinics():
     """获取诊所列表"""
     return {
         "success": True,
         "count": len(clinics_data),
-        "clinics": clinics_data,
+        "clinics": clinics_data.list(),
         "timestamp": datetime.now().isoformat()
     }
 
 @app.get("/api/clinics/{clinic_id}")
 def get_clinic(clinic_id: str):
     """获取诊所详情"""
-    for clinic in clinics_data:
-        if clinic["id"] == clinic_id:
-            return {
-                "success": True,
-                "clinic": clinic,
-                "timestamp": datetime.now().isoformat()
-            }
+    clinic = clinics_data.get(clinic_id)
+    if clinic:
+        return {
+            "success": True,
+            "clinic": clinic,
+            "timestamp": datetime.now().isoformat()
+        }
 
     return {
         "success": False,
@@ -254,6 +462,26 @@ def get_clinic(clinic_id: str):
         "clinic_id": clinic_id
     }
 
+@app.get("/api/clinics/{clinic_id}/dashboard")
+def get_clinic_dashboard(clinic_id: str, next: int = Query(DASHBOARD_NEXT_SIZE, ge=0, le=DASHBOARD_NEXT_SIZE)):
+    """诊所后台仪表盘 - 今日预约数、即将到来的预约数、按服务统计和接下来的预约"""
+    if clinics_data.get(clinic_id) is None:
+        return {
+            "success": False,
+            "error": "诊所不存在"
+        }
+
+    dashboard = clinic_dashboards.get(clinic_id)
+    total_calls, total_call_duration = call_log.clinic_totals(clinic_id)
+    return {
+        "success": True,
+        "clinic_id": clinic_id,
+        **dashboard,
+        "next_appointments": dashboard["next_appointments"][:next],
+        "total_calls": total_calls,
+        "total_call_duration": total_call_duration
+    }
+
 @app.post("/api/login")
 def login(username: str = Form(...), password: str = Form(...)):
     """用户登录"""
@@ -277,21 +505,175 @@ def login(username: str = Form(...), password: str = Form(...)):
 
 @app.get("/api/appointments")
 def get_appointments(user_email: Optional[str] = None):
-    """获取预约列表"""
+    """获取预约列表；seq 是增量同步（/api/appointments/changes）的起点"""
+    seq, appointments = appointments_data.snapshot()
     if user_email:
-        user_appointments = [a for a in appointments_data if a.get("patient_email") == user_email]
+        user_appointments = [a.to_dict() for a in appointments if a.get("patient_email") == user_email]
         return {
             "success": True,
             "count": len(user_appointments),
+            "seq": seq,
             "appointments": user_appointments
         }
 
     return {
         "success": True,
-        "count": len(appointments_data),
-        "appointments": appointments_data
+        "count": len(appointments),
+        "seq": seq,
+        "appointments": [a.to_dict() for a in appointments]
     }
 
+@app.get("/api/appointments/changes")
+def get_appointment_changes(since: int, clinic_id: Optional[str] = None, limit: int = 1000):
+    """
+    增量同步 - 返回序号 since 之后新增、更新和删除的预约
+
+    resync 为 true 时变更日志已截断，客户端需要重新拉取 /api/appointments。
+    has_more 为 true 时用 next_since 继续拉取下一页。
+    """
+    return {
+        "success": True,
+        **appointments_data.changes_since(since, clinic_id, min(max(limit, 1), 10000))
+    }
+
+def build_appointment(clinic: dict, fields: Dict[str, Any]) -> dict:
+    """根据表单字段创建预约记录，并从号码池分配虚拟号码（号码用完时不带虚拟号码，照常预约）"""
+    appointment_id = appointments_data.new_id()
+    try:
+        virtual_phone = virtual_numbers.allocate(appointment_id, fields["date"])
+    except PoolExhausted:
+        virtual_phone = None
+    return {
+        "id": appointment_id,
+        "clinic_id": clinic["id"],
+        "clinic_name": clinic["name"],
+        "date": fields["date"],
+        "time": fields["time"],
+        "service": fields["service"],
+        "patient_name": fields["patient_name"],
+        "patient_email": fields["patient_email"],
+        "patient_phone": fields["patient_phone"],
+        "virtual_phone": virtual_phone,
+        "status": "confirmed",
+        "notes": fields.get("notes"),
+        "created_at": datetime.now().isoformat()
+    }
+
+def validate_booking(item: Any, clinics: ClinicCatalog) -> Optional[str]:
+    """校验一条批量预约，返回错误信息；没有错误返回 None"""
+    if not isinstance(item, dict):
+        return "预约数据格式错误"
+    missing = [f for f in APPOINTMENT_FIELDS if not isinstance(item.get(f), str) or not item[f].strip()]
+    if missing:
+        return f"缺少字段: {', '.join(missing)}"
+    if clinics.get(item["clinic_id"]) is None:
+        return "诊所不存在"
+    try:
+        datetime.strptime(item["date"], "%Y-%m-%d")
+        datetime.strptime(item["time"], "%H:%M")
+    except ValueError:
+        return "日期或时间格式错误（应为 YYYY-MM-DD 和 HH:MM）"
+    return None
+
+def push_clinic_feed(event: Event):
+    """事件订阅 - 向诊所后台推送预约变更"""
+    appointment = event.appointment
+    clinic_feed.publish(appointment["clinic_id"], {
+        "type": event.type,
+        "clinic_id": appointment["clinic_id"],
+        "appointment": appointment,
+        "timestamp": datetime.fromtimestamp(event.occurred_at).isoformat()
+    })
+
+def notify_admin_stream(event: Event):
+    """事件订阅 - 通知管理员后台统计已变化，并附带一条最近动态"""
+    activity = {
+        "type": event.type,
+        "timestamp": datetime.fromtimestamp(event.occurred_at).isoformat()
+    }
+    if isinstance(event, APPOINTMENT_EVENTS):
+        appointment = event.appointment
+        activity.update({
+            "appointment_id": appointment["id"],
+            "clinic_id": appointment["clinic_id"],
+            "clinic_name": appointment.get("clinic_name"),
+            "service": appointment.get("service"),
+            "date": appointment.get("date"),
+            "time": appointment.get("time")
+        })
+    elif isinstance(event, ClinicsImported):
+        activity.update({"clinic_id": event.aggregate_id, "count": len(event.clinic_ids)})
+    else:
+        activity["clinic_id"] = event.aggregate_id
+    admin_stream.notify(activity)
+
+async def enqueue_notifications(event: Event):
+    """事件订阅 - 把预约确认/取消/改期通知写入发送队列"""
+    await notification_dispatcher.enqueue(appointment_notifications(event.type, event.appointment))
+
+def schedule_reminders(event: Event):
+    """事件订阅 - 新预约和改约时调度提醒，取消时撤销"""
+    if isinstance(event, AppointmentCancelled):
+        reminder_scheduler.unschedule(event.aggregate_id)
+    else:
+        reminder_scheduler.schedule(event.appointment)
+
+def update_clinic_dashboard(event: Event):
+    """事件订阅 - 更新诊所仪表盘视图"""
+    if isinstance(event, ClinicDeleted):
+        clinic_dashboards.drop(event.clinic_id)
+    else:
+        clinic_dashboards.apply(event.appointment)
+
+async def update_appointment_facts(event: Event):
+    """
+    事件订阅 - 更新分析事实表（在线程中写入，避免和长查询争锁时阻塞事件循环）
+
+    用事件循环的默认线程池而不是 run_in_threadpool：同步路由在 run_in_threadpool 的
+    工作线程中发布事件，队列写满时这些线程会等待；如果消费者也要占用同一个线程池的
+    名额，名额被等待中的发布者占满后消费者就再也运行不了。
+    """
+    await asyncio.get_running_loop().run_in_executor(None, appointment_facts.apply, event.appointment)
+
+def update_virtual_numbers(event: Event):
+    """事件订阅 - 取消时释放虚拟号码，改约时按新日期续租"""
+    if isinstance(event, AppointmentCancelled):
+        virtual_numbers.release(event.aggregate_id)
+    else:
+        virtual_numbers.renew(event.aggregate_id, event.appointment["date"])
+
+async def maintain_virtual_numbers():
+    """后台任务 - 回收过期租约并保存号码池"""
+    while True:
+        await asyncio.sleep(VIRTUAL_NUMBERS_SAVE_INTERVAL)
+        try:
+            virtual_numbers.reclaim_expired()
+            await run_in_threadpool(virtual_numbers.save)
+        except Exception as e:
+            print(f"❌ 虚拟号码池保存失败: {e}")
+
+async def send_reminders(reminders: List[Any]):
+    """把一批到期的提醒写入通知队列"""
+    await notification_dispatcher.enqueue([
+        job
+        for _, appointment in reminders
+        for job in appointment_notifications("appointment.reminder", appointment)
+    ])
+
+event_bus.subscribe("clinic_feed", push_clinic_feed, APPOINTMENT_EVENTS, queue_size=10000, partitions=4)
+event_bus.subscribe("admin_stream", notify_admin_stream, queue_size=1000)
+event_bus.subscribe("notifications", enqueue_notifications, APPOINTMENT_EVENTS, queue_size=10000, policy=BLOCK)
+event_bus.subscribe("reminders", schedule_reminders, APPOINTMENT_EVENTS, queue_size=10000, policy=BLOCK)
+event_bus.subscribe(
+    "clinic_dashboard", update_clinic_dashboard, APPOINTMENT_EVENTS + (ClinicDeleted,),
+    queue_size=10000, policy=BLOCK
+)
+event_bus.subscribe("analytics", update_appointment_facts, APPOINTMENT_EVENTS, queue_size=10000, policy=BLOCK)
+event_bus.subscribe(
+    "virtual_numbers", update_virtual_numbers, (AppointmentCancelled, AppointmentRescheduled),
+    queue_size=10000, policy=BLOCK
+)
+
 @app.post("/api/appointments")
 def create_appointment(
     clinic_id: str = Form(...),
@@ -304,106 +686,365 @@ def create_appointment(
     notes: Optional[str] = Form(None)
 ):
     """创建预约"""
-    import random
-
-    clinic = None
-    for c in clinics_data:
-        if c["id"] == clinic_id:
-            clinic = c
-            break
-
+    clinic = clinics_data.get(clinic_id)
     if not clinic:
         return {
             "success": False,
             "error": "诊所不存在"
         }
 
-    virtual_phone = f"+1 (416) 555-{random.randint(1000, 9999)}"
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+        datetime.strptime(time, "%H:%M")
+    except ValueError:
+        return {
+            "success": False,
+            "error": "日期或时间格式错误（应为 YYYY-MM-DD 和 HH:MM）"
+        }
 
-    appointment = {
-        "id": f"appt_{datetime.now().timestamp()}",
-        "clinic_id": clinic_id,
-        "clinic_name": clinic["name"],
+    appointment = build_appointment(clinic, {
         "date": date,
         "time": time,
         "service": service,
         "patient_name": patient_name,
         "patient_email": patient_email,
         "patient_phone": patient_phone,
-        "virtual_phone": virtual_phone,
-        "status": "confirmed",
-        "notes": notes,
-        "created_at": datetime.now().isoformat()
-    }
+        "notes": notes
+    })
+
+    try:
+        appointments_data.add(appointment)
+    except SlotTaken:
+        virtual_numbers.release(appointment["id"])
+        return {
+            "success": False,
+            "error": "该时段已被预约"
+        }
 
-    appointments_data.append(appointment)
+    event_bus.publish(AppointmentCreated(dict(appointment)))
 
     return {
         "success": True,
         "message": "预约成功！",
         "appointment": appointment,
-        "virtual_phone": virtual_phone
+        "virtual_phone": appointment["virtual_phone"]
+    }
+
+class _BatchRejected(Exception):
+    """原子批量预约中有失败项，整体回滚"""
+
+def book_appointments_batch(items: List[Any], atomic: bool) -> dict:
+    """在一个存储事务中校验并预约一批时段"""
+    results = []
+    created_appointments = []
+    failed = 0
+
+    try:
+        with appointments_data.transaction() as tx:
+            for index, item in enumerate(items):
+                error = validate_booking(item, clinics_data)
+                if error is None:
+                    appointment = build_appointment(clinics_data.get(item["clinic_id"]), item)
+                    try:
+                        tx.insert(appointment)
+                    except SlotTaken as e:
+                        virtual_numbers.release(appointment["id"])
+                        error = f"该时段已被预约 ({e.appointment_id})"
+                if error is not None:
+                    failed += 1
+                    results.append({"index": index, "success": False, "error": error})
+                else:
+                    created_appointments.append(appointment)
+                    results.append({
+                        "index": index,
+                        "success": True,
+                        "appointment_id": appointment["id"],
+                        "virtual_phone": appointment["virtual_phone"]
+                    })
+            if atomic and failed:
+                # 全部回滚：退出事务时不提交
+                raise _BatchRejected()
+    except _BatchRejected:
+        for appointment in created_appointments:
+            virtual_numbers.release(appointment["id"])
+        for result in results:
+            if result["success"]:
+                result.update({"success": False, "error": "批量预约已回滚"})
+                result.pop("appointment_id")
+                result.pop("virtual_phone")
+    except StorageError as e:
+        for appointment in created_appointments:
+            virtual_numbers.release(appointment["id"])
+        return {
+            "success": False,
+            "error": f"保存预约失败: {e}"
+        }
+
+    created = 0 if atomic and failed else len(items) - failed
+    if created:
+        for appointment in created_appointments:
+            event_bus.publish(AppointmentCreated(dict(appointment)))
+    return {
+        "success": failed == 0,
+        "message": f"成功预约 {created} 个，失败 {failed} 个",
+        "atomic": atomic,
+        "created": created,
+        "failed": failed,
+        "results": results
+    }
+
+@app.post("/api/appointments/batch")
+async def create_appointments_batch(request: Request, atomic: bool = True):
+    """批量创建预约（JSON 数组；atomic=true 时全部成功或全部回滚，否则逐条返回结果）"""
+    try:
+        items = await request.json()
+    except ValueError:
+        return {
+            "success": False,
+            "error": "请求体必须是 JSON 数组"
+        }
+
+    if not isinstance(items, list) or not items:
+        return {
+            "success": False,
+            "error": "请求体必须是非空 JSON 数组"
+        }
+
+    if len(items) > MAX_BATCH_APPOINTMENTS:
+        return {
+            "success": False,
+            "error": f"单次最多预约 {MAX_BATCH_APPOINTMENTS} 个"
+        }
+
+    return await run_in_threadpool(book_appointments_batch, items, atomic)
+
+@app.post("/api/appointments/{appointment_id}/cancel")
+def cancel_appointment(appointment_id: str, reason: Optional[str] = Form(None)):
+    """取消预约并释放时段"""
+    try:
+        appointment = appointments_data.cancel(appointment_id, reason).to_dict()
+    except AppointmentNotFound:
+        return {
+            "success": False,
+            "error": "预约不存在"
+        }
+    except AppointmentNotActive:
+        return {
+            "success": False,
+            "error": "预约已取消"
+        }
+    except StorageError as e:
+        return {
+            "success": False,
+            "error": f"保存预约失败: {e}"
+        }
+
+    event_bus.publish(AppointmentCancelled(dict(appointment)))
+
+    return {
+        "success": True,
+        "message": "预约已取消",
+        "appointment": appointment
+    }
+
+@app.post("/api/appointments/{appointment_id}/reschedule")
+def reschedule_appointment(appointment_id: str, date: str = Form(...), time: str = Form(...)):
+    """改约到同一诊所的新时段"""
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+        datetime.strptime(time, "%H:%M")
+    except ValueError:
+        return {
+            "success": False,
+            "error": "日期或时间格式错误（应为 YYYY-MM-DD 和 HH:MM）"
+        }
+
+    previous = appointments_data.get(appointment_id) or {}
+    previous_date, previous_time = previous.get("date"), previous.get("time")
+    try:
+        appointment = appointments_data.reschedule(appointment_id, date, time).to_dict()
+    except AppointmentNotFound:
+        return {
+            "success": False,
+            "error": "预约不存在"
+        }
+    except AppointmentNotActive:
+        return {
+            "success": False,
+            "error": "预约已取消，无法改约"
+        }
+    except SlotTaken:
+        return {
+            "success": False,
+            "error": "该时段已被预约"
+        }
+    except StorageError as e:
+        return {
+            "success": False,
+            "error": f"保存预约失败: {e}"
+        }
+
+    event_bus.publish(AppointmentRescheduled(dict(appointment), previous_date, previous_time))
+
+    return {
+        "success": True,
+        "message": "改约成功！",
+        "appointment": appointment
     }
 
 @app.post("/api/calls/initiate")
 def initiate_call(appointment_id: str = Form(...), direction: str = Form("patient_to_clinic")):
-    """发起电话呼叫"""
-    appointment = None
-    for appt in appointments_data:
-        if appt["id"] == appointment_id:
-            appointment = appt
-            break
-
+    """发起电话呼叫，并写入通话记录"""
+    appointment = appointments_data.get(appointment_id)
     if not appointment:
         return {
             "success": False,
             "error": "预约不存在"
         }
 
+    if direction not in CALL_DIRECTIONS:
+        return {
+            "success": False,
+            "error": f"呼叫方向无效: {direction}"
+        }
+
+    clinic = clinics_data.get(appointment["clinic_id"]) or {}
+    call = call_log.record(appointment, direction, clinic.get("phone"))
+
     return {
         "success": True,
         "message": "呼叫已发起",
         "appointment_id": appointment_id,
         "direction": direction,
         "virtual_phone": appointment.get("virtual_phone"),
-        "call_id": f"call_{datetime.now().timestamp()}",
-        "status": "connecting"
+        "call_id": call["id"],
+        "status": call["status"]
+    }
+
+@app.post("/api/calls/{call_id}/status")
+def update_call_status(call_id: str, status: str = Form(...), duration: Optional[int] = Form(None)):
+    """更新通话状态（电话服务商回调）"""
+    changes = {"status": status}
+    if duration is not None:
+        changes["duration"] = duration
+    try:
+        call = call_log.update(call_id, **changes)
+    except CallNotFound:
+        return {
+            "success": False,
+            "error": "通话不存在"
+        }
+
+    return {
+        "success": True,
+        "call": call
+    }
+
+@app.get("/api/calls/recent")
+def get_recent_calls(clinic_id: str, limit: int = 20):
+    """诊所最近的通话（新的在前）"""
+    calls = call_log.recent(clinic_id, min(max(limit, 0), call_log.recent_size))
+    return {
+        "success": True,
+        "count": len(calls),
+        "calls": calls
+    }
+
+@app.get("/api/appointments/{appointment_id}/calls")
+def get_appointment_calls(appointment_id: str):
+    """某个预约的所有通话"""
+    if appointments_data.get(appointment_id) is None:
+        return {
+            "success": False,
+            "error": "预约不存在"
+        }
+
+    calls = call_log.for_appointment(appointment_id)
+    return {
+        "success": True,
+        "count": len(calls),
+        "calls": calls
+    }
+
+@app.get("/api/calls/route")
+def route_call(number: str):
+    """来电路由 - 根据被叫的虚拟号码找到对应的预约和诊所"""
+    appointment_id = virtual_numbers.owner(number)
+    appointment = appointments_data.get(appointment_id) if appointment_id else None
+    if not appointment:
+        return {
+            "success": False,
+            "error": "号码未分配给有效预约"
+        }
+
+    return {
+        "success": True,
+        "appointment_id": appointment_id,
+        "clinic_id": appointment["clinic_id"],
+        "clinic_phone": (clinics_data.get(appointment["clinic_id"]) or {}).get("phone"),
+        "patient_phone": appointment.get("patient_phone")
     }
 
 @app.get("/api/search")
 def search_clinics(
     city: Optional[str] = None,
-    service: Optional[str] = None
+    service: Optional[str] = None,
+    sort: Optional[str] = None,
+    limit: Optional[int] = None,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    name: Optional[str] = None,
+    radius_km: Optional[float] = None
 ):
-    """搜索诊所"""
-    results = []
-
-    for clinic in clinics_data:
-        match = True
+    """
+    搜索诊所
 
-        if city and city.lower() not in clinic.get("address", "").lower():
-            match = False
-
-        if service:
-            service_match = False
-            for s in clinic.get("services", []):
-                if service.lower() in s.lower():
-                    service_match = True
-                    break
-            if not service_match:
-                match = False
-
-        if match:
-            results.append(clinic)
+    城市和名称支持拼写容错（Torotno 也能找到 Toronto），服务名称认识不同版本的写法
+    （洗牙 / 牙齿清洁 / Cleaning）。sort=score 按相关度、评分、距离（带 latitude/longitude 时）和近期可预约程度的综合得分排序，
+    sort=rating / distance / availability 按单项排序，结果带 score 和 score_details；
+    不传 sort 时保持原来的顺序。limit 只返回前 limit 个（total 为匹配总数）。
+    radius_km 只返回 latitude/longitude 周围该半径内的诊所。
+    """
+    if sort is None and limit is None and radius_km is None:
+        results = clinics_data.search(city=city, service=service, name=name)
+        total = len(results)
+    else:
+        try:
+            results, total = clinic_ranker.rank(city, service, sort=sort, limit=limit,
+                                                latitude=latitude, longitude=longitude, name=name,
+                                                radius_km=radius_km)
+        except ValueError as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
 
     return {
         "success": True,
         "count": len(results),
+        "total": total,
         "results": results,
         "filters": {
             "city": city,
-            "service": service
-        }
+            "service": service,
+            "name": name,
+            "latitude": latitude,
+            "longitude": longitude,
+            "radius_km": radius_km
+        },
+        "sort": sort,
+        "limit": limit
+    }
+
+def compute_admin_stats() -> dict:
+    """管理员统计数据（全部来自增量计数，O(1)）"""
+    return {
+        "total_clinics": len(clinics_data),
+        "total_users": len(users_data),
+        "total_appointments": len(appointments_data),
+        "confirmed_appointments": appointments_data.count_status("confirmed"),
+        "cancelled_appointments": appointments_data.count_status("cancelled"),
+        "today_appointments": appointments_data.count_date(datetime.now().strftime("%Y-%m-%d"))
     }
 
 @app.get("/api/admin/stats")
@@ -411,16 +1052,131 @@ def get_admin_stats():
     """获取管理员统计数据"""
     return {
         "success": True,
-        "stats": {
-            "total_clinics": len(clinics_data),
-            "total_users": len(users_data),
-            "total_appointments": len(appointments_data),
-            "confirmed_appointments": len([a for a in appointments_data if a.get("status") == "confirmed"]),
-            "cancelled_appointments": len([a for a in appointments_data if a.get("status") == "cancelled"]),
-            "today_appointments": len([a for a in appointments_data if a.get("date") == datetime.now().strftime("%Y-%m-%d")])
-        }
+        "stats": compute_admin_stats()
+    }
+
+@app.get("/api/admin/notifications")
+def get_notification_stats(dead_letters: int = 20):
+    """通知队列状态 - 各服务商的队列深度、等待时间（lag）、提醒调度和最近的死信"""
+    return {
+        "success": True,
+        "stats": notification_dispatcher.stats(),
+        "reminders": reminder_scheduler.stats(),
+        "dead_letters": notification_dispatcher.queue.dead_letters(max(0, min(dead_letters, 200)))
     }
 
+@app.get("/api/admin/profiles")
+def get_profiles(route: Optional[str] = None, format: str = "json", top: int = 10):
+    """请求采样结果 - format=collapsed 返回折叠栈文本（火焰图输入），否则返回各路由的热点函数"""
+    if format == "collapsed":
+        return Response(request_profiler.collapsed(route), media_type="text/plain")
+    profiles = request_profiler.summary(max(1, min(top, 100)))
+    return {
+        "success": True,
+        "profiler": request_profiler.stats(),
+        "profiles": [p for p in profiles if route is None or p["route"] == route]
+    }
+
+@app.delete("/api/admin/profiles")
+def reset_profiles():
+    """清空采样结果"""
+    request_profiler.reset()
+    return {"success": True}
+
+@app.get("/api/admin/slow-requests")
+def get_slow_requests(limit: int = 50):
+    """最近的慢请求和事件循环阻塞记录（新的在前）"""
+    return {
+        "success": True,
+        "stats": slow_request_watchdog.stats(),
+        "records": slow_request_watchdog.recent(max(0, min(limit, 200)))
+    }
+
+@app.get("/api/admin/startup")
+def get_startup_timings(top: int = 20):
+    """冷启动耗时 - 各阶段距进程创建的秒数、预热步骤、第一个请求和导入最慢的模块"""
+    return {
+        "success": True,
+        **startup_timer.stats(max(0, min(top, 200)))
+    }
+
+# 内存统计的数据结构（名称 -> 返回各部分字节数的函数）
+MEMORY_ACCOUNTS = {
+    "appointments": appointments_data.memory_usage,
+    "clinics": clinics_data.memory_usage,
+    "users": users_data.memory_usage,
+    "call_log": call_log.memory_usage,
+    "clinic_dashboards": clinic_dashboards.memory_usage,
+    "appointment_facts": appointment_facts.memory_usage,
+    "reminders": reminder_scheduler.memory_usage,
+    "virtual_numbers": virtual_numbers.memory_usage,
+    "pages": page_cache.memory_usage
+}
+trace_session = TraceSession()
+
+@app.get("/api/admin/memory")
+def get_memory_usage():
+    """各数据结构的大致内存占用（抽样估算）、进程 RSS 和 tracemalloc 状态"""
+    structures = []
+    for name, usage in MEMORY_ACCOUNTS.items():
+        parts = usage()
+        structures.append({"name": name, "bytes": sum(parts.values()), "parts": parts})
+    structures.sort(key=lambda s: s["bytes"], reverse=True)
+    return {
+        "success": True,
+        "rss_bytes": memory_rss(),
+        "accounted_bytes": sum(s["bytes"] for s in structures),
+        "structures": structures,
+        "tracemalloc": trace_session.stats()
+    }
+
+@app.post("/api/admin/memory/tracemalloc")
+def control_tracemalloc(
+    action: str = Form(...),
+    frames: int = Form(1),
+    limit: int = Form(20),
+    group_by: str = Form("lineno")
+):
+    """tracemalloc：start 开启，snapshot 拍快照并与上一次对比，stop 关闭"""
+    if action == "start":
+        trace_session.start(max(1, min(frames, 50)))
+        return {"success": True, "tracemalloc": trace_session.stats()}
+    if action == "stop":
+        trace_session.stop()
+        return {"success": True, "tracemalloc": trace_session.stats()}
+    if action != "snapshot":
+        return {"success": False, "error": "action 必须是 start、snapshot 或 stop"}
+    if group_by not in ("lineno", "filename", "traceback"):
+        return {"success": False, "error": "group_by 必须是 lineno、filename 或 traceback"}
+    try:
+        result = trace_session.snapshot(max(1, min(limit, 200)), group_by)
+    except RuntimeError as e:
+        return {"success": False, "error": str(e)}
+    return {"success": True, **result}
+
+@app.get("/api/admin/stream")
+async def admin_stats_stream():
+    """管理员后台 SSE 推送 - 统计快照（stats）和最近动态（activity）"""
+    return StreamingResponse(
+        admin_stream.subscribe(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus 指标 - 按路由的请求数、进行中请求数、延迟直方图，以及队列深度和连接数"""
+    return Response(request_metrics.render(), media_type="text/plain; version=0.0.4")
+
+request_metrics.add_gauge("event_bus_depth", "事件总线中尚未处理的事件数", event_bus.depth)
+request_metrics.add_gauge("notification_backlog", "通知队列中等待发送的任务数", notification_dispatcher.backlog)
+request_metrics.add_gauge("websocket_connections", "诊所后台 WebSocket 连接数",
+                          lambda: clinic_feed.stats()["connections"])
+request_metrics.add_gauge("sse_subscribers", "管理员后台 SSE 订阅数", lambda: admin_stream.stats()["subscribers"])
+
 @app.post("/api/admin/clinics")
 def add_clinic(
     name: str = Form(...),
@@ -430,11 +1186,13 @@ def add_clinic(
     city: str = Form(...),
     services: str = Form(...),  # 逗号分隔的服务列表
     hours: str = Form("周一至周五: 9:00 AM - 6:00 PM"),
-    rating: float = Form(4.5)
+    rating: float = Form(4.5),
+    latitude: Optional[float] = Form(None),
+    longitude: Optional[float] = Form(None)
 ):
     """管理员添加新诊所"""
     new_clinic = {
-        "id": str(len(clinics_data) + 1),
+        "id": clinics_data.next_id(),
         "name": name,
         "address": address,
         "phone": phone,
@@ -444,8 +1202,12 @@ def add_clinic(
         "hours": hours,
         "city": city
     }
+    if latitude is not None and longitude is not None:
+        new_clinic["latitude"] = latitude
+        new_clinic["longitude"] = longitude
 
-    clinics_data.append(new_clinic)
+    clinics_data.add(new_clinic)
+    event_bus.publish(ClinicAdded(new_clinic))
 
     return {
         "success": True,
@@ -453,15 +1215,36 @@ def add_clinic(
         "clinic": new_clinic
     }
 
-@app.delete("/api/admin/clinics/{clinic_id}")
-def delete_clinic(clinic_id: str):
-    """管理员删除诊所"""
-    global clinics_data
+@app.post("/api/admin/clinics/bulk")
+async def bulk_import_clinics(request: Request, format: Optional[str] = None):
+    """管理员批量导入诊所（流式上传 CSV 或 NDJSON，逐行返回错误并统计导入速度）"""
+    fmt = detect_format(request.headers.get("content-type"), format)
+    importer = ClinicImporter(clinics_data)
 
-    original_count = len(clinics_data)
-    clinics_data = [c for c in clinics_data if c["id"] != clinic_id]
+    try:
+        async for rows in iter_row_chunks(request.stream(), fmt):
+            await run_in_threadpool(importer.import_chunk, rows)
+    except StorageError as e:
+        await run_in_threadpool(importer.finish)
+        return {
+            **importer.report(),
+            "success": False,
+            "error": f"保存诊所失败: {e}"
+        }
 
-    if len(clinics_data) < original_count:
+    await run_in_threadpool(importer.finish)
+    if importer.imported:
+        event_bus.publish(ClinicsImported(tuple(importer.clinic_ids)))
+    return {
+        **importer.report(),
+        "format": fmt
+    }
+
+@app.delete("/api/admin/clinics/{clinic_id}")
+def delete_clinic(clinic_id: str):
+    """管理员删除诊所（软删除，未来预约由后台压缩统一取消）"""
+    if clinics_data.delete(clinic_id):
+        event_bus.publish(ClinicDeleted(clinic_id))
         return {
             "success": True,
             "message": "诊所删除成功",
@@ -473,15 +1256,123 @@ def delete_clinic(clinic_id: str):
             "error": "诊所不存在"
         }
 
+@app.get("/api/admin/analytics")
+def get_admin_analytics(
+    group_by: str = "clinic,service",
+    bucket: str = "day",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    status: Optional[str] = None,
+    clinic_id: Optional[str] = None
+):
+    """预约分析 - 按 天/周/月（bucket）× 诊所/服务（group_by）分组计数"""
+    try:
+        result = appointment_facts.query(
+            [d.strip() for d in group_by.split(",") if d.strip()],
+            bucket=bucket,
+            start=start,
+            end=end,
+            status=status,
+            clinic_id=clinic_id
+        )
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": f"查询参数错误: {e}"
+        }
+
+    return {
+        "success": True,
+        **result
+    }
+
+@app.get("/api/admin/users")
+def get_admin_users(
+    role: Optional[str] = None,
+    q: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50
+):
+    """管理员获取用户列表（按角色筛选、按名称/邮箱前缀搜索、游标分页）"""
+    limit = max(1, min(limit, 200))
+    try:
+        page, next_cursor = users_data.page(role=role, prefix=q, cursor=cursor, limit=limit)
+    except InvalidCursor:
+        return {
+            "success": False,
+            "error": "无效的分页游标"
+        }
+
+    return {
+        "success": True,
+        "count": len(page),
+        "total": users_data.count(role),
+        "users": [public_user(email, user) for email, user in page],
+        "next_cursor": next_cursor,
+        "filters": {
+            "role": role,
+            "q": q
+        }
+    }
+
+def compact_clinics() -> dict:
+    """压缩已删除诊所：先取消其未来预约，再从列表和索引中清除墓碑"""
+    tombstones = clinics_data.tombstones()
+    if not tombstones:
+        return {"purged": 0, "cancelled_appointments": 0}
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    cancelled = 0
+    for clinic_id in tombstones:
+        future_ids = [a["id"] for a in appointments_data.for_clinic(clinic_id) if a.get("date", "") >= today]
+        for appointment in appointments_data.cancel_many(future_ids, reason="clinic_deleted"):
+            event_bus.publish(AppointmentCancelled(appointment.to_dict()))
+            cancelled += 1
+
+    purged = clinics_data.purge(tombstones)
+    return {"purged": len(purged), "cancelled_appointments": cancelled}
+
+async def compact_clinics_periodically():
+    """后台任务 - 定期压缩已删除诊所"""
+    while True:
+        await asyncio.sleep(CLINIC_COMPACTION_INTERVAL)
+        try:
+            result = await run_in_threadpool(compact_clinics)
+            if result["purged"]:
+                print(f"🧹 已清理 {result['purged']} 个已删除诊所，取消 {result['cancelled_appointments']} 个未来预约")
+        except Exception as e:
+            print(f"❌ 诊所压缩失败: {e}")
+
+def warm_up():
+    """启动预热 - 开始监听端口之前读入页面、走一遍常用的查询路径（在线程池中执行，顺带启动工作线程）"""
+    try:
+        startup_timer.run_step("pages", page_cache.load, PAGES)
+        clinic = next(iter(clinics_data), None)
+        if clinic is not None:
+            startup_timer.run_step("search", clinics_data.search, clinic.get("city"), None)
+            startup_timer.run_step("dashboard", clinic_dashboards.get, clinic["id"])
+        startup_timer.run_step("admin_stats", compute_admin_stats)
+    except Exception as e:
+        print(f"⚠️ 启动预热失败: {e}")
+
 @app.get("/api/admin/appointments")
 def get_all_appointments():
     """管理员获取所有预约"""
+    appointments = appointments_data.list()
     return {
         "success": True,
-        "count": len(appointments_data),
-        "appointments": appointments_data
+        "count": len(appointments),
+        "appointments": [a.to_dict() for a in appointments]
     }
 
+@app.websocket("/ws/clinics/{clinic_id}")
+async def clinic_feed_socket(websocket: WebSocket, clinic_id: str):
+    """诊所后台实时推送 - 预约创建/取消/改约"""
+    if clinics_data.get(clinic_id) is None:
+        await websocket.close(code=CLOSE_NOT_FOUND)
+        return
+    await clinic_feed.serve(websocket, clinic_id)
+
 # 添加一个简单的根路由测试
 @app.get("/test")
 def test_route():
@@ -494,6 +1385,10 @@ def test_route():
         "directory": str(BASE_DIR)
     }
 
+# 第一个请求的耗时（最外层中间件，包括其他中间件的耗时）
+app.add_middleware(StartupMiddleware, timer=startup_timer)
+startup_timer.mark("imported")
+
 def main():
     """主函数 - 仅用于本地运行"""
     print("="*70)
@@ -518,6 +1413,7 @@ def main():
         port = int(os.environ.get("PORT", 8000))
         print(f"🚀 启动服务器在端口 {port}")
         if os.environ.get("RENDER") is None:
+            import uvicorn  # 只有本地直接运行时需要，不拖慢 uvicorn/gunicorn 加载应用
             uvicorn.run(
                 app,
                 host="0.0.0.0",
@@ -0,0 +1,357 @@
+"""
+进程内事件总线 - 把副作用（推送、统计、通知等）从请求路径上解耦
+
+路由只负责写入数据并 publish 事件；每个订阅者有自己的有界队列和工作任务，
+在事件循环中异步处理。同一个聚合（预约 ID / 诊所 ID）的事件总是进入同一个分区，
+分区内顺序处理，因此同一聚合的事件按发布顺序送达。
+
+队列写满时按订阅者的背压策略处理：
+  - drop_oldest: 丢弃最旧的事件（适合只关心最新状态的推送）
+  - drop_newest: 丢弃新事件
+  - block: 发布者等待队列有空位，从不丢弃。队列满时事件进入该分区的等待队列（FIFO），
+    由一个任务按顺序放入分区队列；从线程池线程发布时该线程等待（最多 publish_timeout 秒，
+    超时后不再等待，事件仍按顺序送达），在事件循环中同步发布时不等待
+
+stop() 之后不再接受新事件，等待中的事件被取消，等待的发布线程随之返回。
+"""
+
+import asyncio
+import concurrent.futures
+import time
+import zlib
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, ClassVar, Deque, Dict, Iterable, List, Optional, Tuple, Type, Union
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+
+
+class Event:
+    """事件基类"""
+
+    type: ClassVar[str] = "event"
+
+    @property
+    def aggregate_id(self) -> str:
+        raise NotImplementedError
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, **asdict(self)}
+
+
+@dataclass(frozen=True)
+class AppointmentCreated(Event):
+    type: ClassVar[str] = "appointment.created"
+    appointment: dict
+    occurred_at: float = field(default_factory=time.time)
+
+    @property
+    def aggregate_id(self) -> str:
+        return self.appointment["id"]
+
+
+@dataclass(frozen=True)
+class AppointmentCancelled(Event):
+    type: ClassVar[str] = "appointment.cancelled"
+    appointment: dict
+    occurred_at: float = field(default_factory=time.time)
+
+    @property
+    def aggregate_id(self) -> str:
+        return self.appointment["id"]
+
+
+@dataclass(frozen=True)
+class AppointmentRescheduled(Event):
+    type: ClassVar[str] = "appointment.rescheduled"
+    appointment: dict
+    previous_date: str
+    previous_time: str
+    occurred_at: float = field(default_factory=time.time)
+
+    @property
+    def aggregate_id(self) -> str:
+        return self.appointment["id"]
+
+
+@dataclass(frozen=True)
+class ClinicAdded(Event):
+    type: ClassVar[str] = "clinic.added"
+    clinic: dict
+    occurred_at: float = field(default_factory=time.time)
+
+    @property
+    def aggregate_id(self) -> str:
+        return self.clinic["id"]
+
+
+@dataclass(frozen=True)
+class ClinicsImported(Event):
+    type: ClassVar[str] = "clinic.imported"
+    clinic_ids: Tuple[str, ...]
+    occurred_at: float = field(default_factory=time.time)
+
+    @property
+    def aggregate_id(self) -> str:
+        return self.clinic_ids[0] if self.clinic_ids else ""
+
+
+@dataclass(frozen=True)
+class ClinicDeleted(Event):
+    type: ClassVar[str] = "clinic.deleted"
+    clinic_id: str
+    occurred_at: float = field(default_factory=time.time)
+
+    @property
+    def aggregate_id(self) -> str:
+        return self.clinic_id
+
+
+APPOINTMENT_EVENTS = (AppointmentCreated, AppointmentCancelled, AppointmentRescheduled)
+CLINIC_EVENTS = (ClinicAdded, ClinicsImported, ClinicDeleted)
+
+Handler = Callable[[Event], Union[None, Awaitable[None]]]
+
+
+class Subscription:
+    """一个订阅者：若干分区，每个分区一个有界队列和一个工作任务"""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Handler,
+        event_types: Tuple[Type[Event], ...],
+        queue_size: int,
+        policy: str,
+        partitions: int
+    ):
+        self.name = name
+        self.handler = handler
+        self.event_types = event_types
+        self.queue_size = queue_size
+        self.policy = policy
+        self.partitions = partitions
+        self.queues: List[asyncio.Queue] = []
+        self.tasks: List[asyncio.Task] = []
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.lag = 0.0
+        # block 策略: 各分区队列等空位的事件（FIFO，事件和入队后完成的 future），
+        # 以及把它们按顺序放入分区队列的任务（每个分区最多一个）
+        self._waiting: Dict[asyncio.Queue, Deque[Tuple[Event, asyncio.Future]]] = {}
+        self._drainers: Dict[asyncio.Queue, asyncio.Task] = {}
+
+    def accepts(self, event: Event) -> bool:
+        return isinstance(event, self.event_types)
+
+    def queue_for(self, event: Event) -> asyncio.Queue:
+        if self.partitions == 1:
+            return self.queues[0]
+        key = event.aggregate_id.encode("utf-8")
+        return self.queues[zlib.crc32(key) % self.partitions]
+
+    def offer(self, event: Event):
+        """非阻塞入队，按背压策略处理队列已满的情况（block 策略不丢弃，见 offer_blocking）"""
+        if self.policy == BLOCK:
+            self.offer_blocking(event)
+            return
+        queue = self.queue_for(event)
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.policy == DROP_OLDEST:
+                queue.get_nowait()
+                queue.put_nowait(event)
+
+    def offer_blocking(self, event: Event) -> Optional[asyncio.Future]:
+        """
+        block 策略入队: 有空位且没有事件在等时直接入队，返回 None；否则排到该分区的
+        等待队列末尾，返回事件进入分区队列时完成的 future。
+        """
+        queue = self.queue_for(event)
+        waiting = self._waiting.setdefault(queue, deque())
+        if not waiting and not queue.full():
+            queue.put_nowait(event)
+            return None
+        future = asyncio.get_running_loop().create_future()
+        waiting.append((event, future))
+        if queue not in self._drainers:
+            self._drainers[queue] = asyncio.ensure_future(self._drain(queue, waiting))
+        return future
+
+    async def _drain(self, queue: asyncio.Queue, waiting: Deque[Tuple[Event, asyncio.Future]]):
+        """按顺序把等待的事件放入分区队列；只有这一个任务写入，顺序不会被打乱"""
+        try:
+            while waiting:
+                event, future = waiting[0]
+                await queue.put(event)
+                waiting.popleft()
+                if not future.done():
+                    future.set_result(None)
+        finally:
+            if self._drainers.get(queue) is asyncio.current_task():
+                del self._drainers[queue]
+
+    def cancel_waiting(self):
+        """停止时取消等空位的事件，唤醒等待的发布者"""
+        for task in self._drainers.values():
+            task.cancel()
+        self._drainers.clear()
+        for waiting in self._waiting.values():
+            for _, future in waiting:
+                future.cancel()
+            waiting.clear()
+
+    async def run(self, queue: asyncio.Queue):
+        while True:
+            event = await queue.get()
+            try:
+                result = self.handler(event)
+                if asyncio.iscoroutine(result):
+                    await result
+                self.delivered += 1
+                self.lag = time.time() - event.occurred_at
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{type(event).__name__}: {e}"
+                print(f"❌ 事件处理失败 [{self.name}] {self.last_error}")
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self.queues) + self.waiting()
+
+    def waiting(self) -> int:
+        """block 策略下正在等空位的事件数"""
+        return sum(len(waiting) for waiting in self._waiting.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "policy": self.policy,
+            "partitions": self.partitions,
+            "depth": self.depth(),
+            "capacity": self.queue_size * self.partitions,
+            "waiting": self.waiting(),
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "lag_seconds": round(self.lag, 4)
+        }
+
+
+class EventBus:
+    """
+    事件总线
+
+    订阅在启动前注册；start() 绑定事件循环并为每个分区启动工作任务，stop() 停止接受事件。
+    publish 可在任意线程调用；启动前和停止后发布的事件没有消费者，直接丢弃。
+    """
+
+    def __init__(self, publish_timeout: float = 5.0):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscriptions: List[Subscription] = []
+        self._stopped = False
+        self.publish_timeout = publish_timeout
+        self.published = 0
+        self.publish_timeouts = 0
+
+    def subscribe(
+        self,
+        name: str,
+        handler: Handler,
+        event_types: Iterable[Type[Event]] = (Event,),
+        queue_size: int = 1000,
+        policy: str = DROP_OLDEST,
+        partitions: int = 1
+    ) -> Subscription:
+        subscription = Subscription(name, handler, tuple(event_types), queue_size, policy, partitions)
+        self._subscriptions.append(subscription)
+        if self._loop is not None:
+            self._start_subscription(subscription)
+        return subscription
+
+    def start(self) -> List[asyncio.Task]:
+        """绑定当前事件循环并启动所有订阅者的工作任务"""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = False
+        tasks = []
+        for subscription in self._subscriptions:
+            tasks.extend(self._start_subscription(subscription))
+        return tasks
+
+    def stop(self):
+        """停止接受事件并取消等空位的事件（在事件循环中调用，工作任务由调用方取消）"""
+        self._stopped = True
+        for subscription in self._subscriptions:
+            subscription.cancel_waiting()
+
+    def _start_subscription(self, subscription: Subscription) -> List[asyncio.Task]:
+        subscription.queues = [asyncio.Queue(maxsize=subscription.queue_size) for _ in range(subscription.partitions)]
+        subscription.tasks = [asyncio.create_task(subscription.run(q)) for q in subscription.queues]
+        return subscription.tasks
+
+    def publish(self, event: Event):
+        """发布事件（线程安全）；block 策略的订阅者队列已满时，发布线程最多等待 publish_timeout 秒"""
+        loop = self._loop
+        if loop is None or self._stopped:
+            return
+        self.published += 1
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dispatch(event)
+        elif any(s.policy == BLOCK and s.accepts(event) for s in self._subscriptions):
+            future = asyncio.run_coroutine_threadsafe(self._dispatch_blocking(event), loop)
+            try:
+                future.result(self.publish_timeout)
+            except concurrent.futures.TimeoutError:
+                # 不取消: 事件仍按顺序送达，只是发布线程不再等待
+                self.publish_timeouts += 1
+            except concurrent.futures.CancelledError:
+                pass  # 停止时等待的事件被取消
+        else:
+            loop.call_soon_threadsafe(self._dispatch, event)
+
+    async def publish_async(self, event: Event):
+        """在事件循环中发布，block 策略的订阅者队列已满时等待"""
+        if self._loop is None or self._stopped:
+            return
+        self.published += 1
+        await self._dispatch_blocking(event)
+
+    def _dispatch(self, event: Event):
+        if self._stopped:
+            return
+        for subscription in self._subscriptions:
+            if subscription.accepts(event):
+                subscription.offer(event)
+
+    async def _dispatch_blocking(self, event: Event):
+        for subscription in self._subscriptions:
+            if not subscription.accepts(event):
+                continue
+            if subscription.policy == BLOCK:
+                waiting = subscription.offer_blocking(event)
+                if waiting is not None:
+                    await waiting
+            else:
+                subscription.offer(event)
+
+    def depth(self) -> int:
+        """所有订阅者队列中尚未处理的事件数"""
+        return sum(s.depth() for s in self._subscriptions)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "published": self.published,
+            "publish_timeouts": self.publish_timeouts,
+            "depth": self.depth(),
+            "subscribers": [s.stats() for s in self._subscriptions]
+        }
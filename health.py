@@ -0,0 +1,125 @@
+"""
+健康检查 - 存活（live）和就绪（ready）检查
+
+存活检查只说明进程还能响应，常数时间。就绪检查汇总运行时的饱和信号：
+事件循环延迟（后台协程持续测量 sleep 的超时量）、线程池排队数、存储后端延迟、
+后台队列积压和内存 RSS；任何一项超过阈值就返回未就绪，负载均衡器据此停止
+向这个实例转发请求。阈值为 0 或 None 表示不检查该项。
+
+平台的重启检查（Render 的 healthCheckPath）必须用存活检查：就绪检查会因为
+短暂的饱和而失败，重启实例会丢掉内存中的状态。
+"""
+
+import asyncio
+import os
+import sys
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from anyio.to_thread import current_default_thread_limiter
+
+
+def memory_rss() -> Optional[int]:
+    """当前进程的常驻内存（字节）；拿不到时返回 None"""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # 拿不到当前值时用峰值代替（macOS 单位是字节，Linux 是 KB）
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class LoopMonitor:
+    """持续测量事件循环延迟，并在循环中读取线程池状态"""
+
+    def __init__(self, interval: float = 0.25, window: int = 40):
+        self.interval = interval
+        self.lag = 0.0
+        self._recent: Deque[float] = deque(maxlen=window)
+        self._expected: Optional[float] = None
+        self.threadpool: Dict[str, int] = {"busy": 0, "size": 0, "waiting": 0}
+
+    async def run(self):
+        while True:
+            self._expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, time.monotonic() - self._expected)
+            self._recent.append(self.lag)
+            limiter = current_default_thread_limiter()
+            self.threadpool = {
+                "busy": int(limiter.borrowed_tokens),
+                "size": int(limiter.total_tokens),
+                "waiting": limiter.statistics().tasks_waiting
+            }
+
+    def current_lag(self) -> float:
+        """最近一次测量值；循环此刻被阻塞时，按已超时的时长计算"""
+        if self._expected is None:
+            return 0.0
+        return max(self.lag, time.monotonic() - self._expected)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lag_ms": round(self.current_lag() * 1000, 2),
+            "max_lag_ms": round(max(self._recent, default=0.0) * 1000, 2),
+            "threadpool": dict(self.threadpool)
+        }
+
+
+class ReadinessCheck:
+    """就绪检查：各项指标与阈值比较"""
+
+    def __init__(
+        self,
+        monitor: LoopMonitor,
+        storage,
+        backlogs: Dict[str, Callable[[], int]],
+        max_loop_lag: Optional[float] = 0.5,
+        max_threadpool_queue: Optional[int] = 50,
+        max_storage_latency: Optional[float] = 0.5,
+        max_backlog: Optional[int] = 10000,
+        max_rss_mb: Optional[float] = None
+    ):
+        self.monitor = monitor
+        self.storage = storage
+        self.backlogs = backlogs
+        self.max_loop_lag = max_loop_lag
+        self.max_threadpool_queue = max_threadpool_queue
+        self.max_storage_latency = max_storage_latency
+        self.max_backlog = max_backlog
+        self.max_rss_mb = max_rss_mb
+
+    def check(self) -> Dict[str, Any]:
+        checks: List[Tuple[str, Any, Any]] = [
+            ("loop_lag_seconds", round(self.monitor.current_lag(), 4), self.max_loop_lag),
+            ("threadpool_queue", self.monitor.threadpool["waiting"], self.max_threadpool_queue)
+        ]
+        try:
+            checks.append(("storage_latency_seconds", round(self.storage.ping(), 4), self.max_storage_latency))
+        except Exception as e:
+            checks.append(("storage_latency_seconds", f"error: {e}", self.max_storage_latency))
+        for name, read in self.backlogs.items():
+            try:
+                checks.append((name, read(), self.max_backlog))
+            except Exception as e:
+                checks.append((name, f"error: {e}", self.max_backlog))
+        rss = memory_rss()
+        checks.append(("rss_mb", round(rss / 1024 / 1024, 1) if rss is not None else None, self.max_rss_mb))
+
+        results = {}
+        ready = True
+        for name, value, threshold in checks:
+            if isinstance(value, str):
+                ok = False  # 检查本身出错
+            else:
+                ok = not threshold or value is None or value <= threshold
+            ready = ready and ok
+            results[name] = {"value": value, "threshold": threshold or None, "ok": ok}
+        return {"status": "ready" if ready else "unready", "checks": results}
@@ -0,0 +1,155 @@
+"""
+内存统计 - 按数据结构估算内存占用，以及 tracemalloc 快照对比
+
+deep_sizeof 递归累加对象及其引用的对象（同一个对象只算一次）。大容器逐个统计太慢，
+sampled_sizeof 等距抽取一部分元素，按平均大小外推到整个容器。索引里的值通常是对
+主数据记录的引用，只统计容器本身（shell_sizeof），避免重复计算同一批记录。
+各个存储类的 memory_usage() 用这些函数报告自己各部分的大小。
+
+TraceSession 在运行中的进程里开启 tracemalloc，拍快照并与上一次快照比较，返回
+增长最多的分配位置，排查长时间运行的 worker 的内存泄漏时不用重启进程。
+"""
+
+import itertools
+import sys
+import threading
+import tracemalloc
+from array import array
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+_CONTAINERS = (list, tuple, set, frozenset, deque)
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """对象及其引用的对象的总大小（字节），seen 中已有的对象不再计算"""
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, _CONTAINERS):
+            stack.extend(current)
+        elif isinstance(current, (str, bytes, int, float, bool, array)) or current is None:
+            continue
+        else:
+            slots = getattr(type(current), "__slots__", ())
+            stack.extend(getattr(current, name) for name in slots if hasattr(current, name))
+            if hasattr(current, "__dict__"):
+                stack.append(current.__dict__)
+    return total
+
+
+def _sample(items, count: int, sample: int) -> list:
+    step = max(1, count // sample)
+    return list(itertools.islice(items, 0, None, step))
+
+
+def sampled_sizeof(container: Any, sample: int = 256) -> int:
+    """容器本身的大小 + 抽样元素的平均大小 × 元素数"""
+    shell = sys.getsizeof(container)
+    count = len(container)
+    if count == 0:
+        return shell
+    # 抽样元素共用一个 seen：记录之间共享的对象（字段名、同一个诊所名称）只算一次
+    seen: set = set()
+    if isinstance(container, dict):
+        picked = _sample(iter(container.items()), count, sample)
+        measured = sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in picked)
+    else:
+        picked = _sample(iter(container), count, sample)
+        measured = sum(deep_sizeof(item, seen) for item in picked)
+    return shell + int(measured * count / len(picked))
+
+
+def shell_sizeof(container: Any, sample: int = 256) -> int:
+    """只统计容器和嵌套容器本身（值是对其他结构中记录的引用时使用）"""
+    shell = sys.getsizeof(container)
+    count = len(container)
+    if count == 0:
+        return shell
+    # 字典的键也可能是容器（如时段元组）
+    items = itertools.chain.from_iterable(container.items()) if isinstance(container, dict) else container
+    picked = _sample(items, count * (2 if isinstance(container, dict) else 1), sample)
+    nested = sum(sys.getsizeof(v) for v in picked if isinstance(v, (dict,) + _CONTAINERS))
+    return shell + int(nested * count / max(1, len(picked) // (2 if isinstance(container, dict) else 1)))
+
+
+def cache_sizeof(cached: Callable, entry_bytes: int = 200) -> int:
+    """lru_cache 的大致大小（每条缓存按 entry_bytes 估算）"""
+    info = getattr(cached, "cache_info", None)
+    return info().currsize * entry_bytes if info else 0
+
+
+class TraceSession:
+    """tracemalloc 会话：开启、拍快照、与上一次快照对比"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self.snapshots = 0
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, frames))
+                self._previous = None
+
+    def stop(self):
+        with self._lock:
+            tracemalloc.stop()
+            self._previous = None
+
+    def snapshot(self, limit: int = 20, group_by: str = "lineno") -> Dict[str, Any]:
+        """拍一次快照，返回占用最多的分配位置，以及与上一次快照相比增长最多的位置"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc 未开启")
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>")
+            ))
+            previous, self._previous = self._previous, snapshot
+            self.snapshots += 1
+        current, peak = tracemalloc.get_traced_memory()
+        result: Dict[str, Any] = {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [self._stat(s) for s in snapshot.statistics(group_by)[:limit]],
+            "diff": None
+        }
+        if previous is not None:
+            result["diff"] = [self._stat(s) for s in snapshot.compare_to(previous, group_by)[:limit]]
+        return result
+
+    @staticmethod
+    def _stat(stat) -> Dict[str, Any]:
+        frames: List[str] = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+        data = {"site": frames[0] if frames else None, "size": stat.size, "count": stat.count}
+        if len(frames) > 1:
+            data["traceback"] = frames
+        if hasattr(stat, "size_diff"):
+            data["size_diff"] = stat.size_diff
+            data["count_diff"] = stat.count_diff
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else None,
+            "traced_bytes": tracemalloc.get_traced_memory()[0] if tracing else None,
+            "snapshots": self.snapshots
+        }
@@ -0,0 +1,273 @@
+"""
+请求指标 - ASGI 中间件按路由模板统计请求数、状态码类别、进行中请求数和延迟直方图
+
+路由按模板（如 /api/clinics/{clinic_id}）归类，不随路径参数膨胀；不匹配任何路由的
+请求统一记为 "unmatched"。延迟直方图按 2 的幂分桶（0.5ms ~ 32s），记录时只做一次
+frexp 和一次列表自增。计数都在事件循环线程中更新，不加锁。
+
+多 worker 部署时设置 METRICS_MULTIPROC_DIR：每个 worker 定期把自己的计数写入
+该目录下的 metrics_<pid>.json（原子替换），/metrics 合并所有文件。已停止写入的
+worker 的计数器仍然累加，进行中请求数只取仍在更新的文件。
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+
+# 延迟直方图上界（秒）：0.5ms * 2^i
+LATENCY_BASE = 0.0005
+LATENCY_BUCKETS = tuple(LATENCY_BASE * 2 ** i for i in range(17))
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+UNMATCHED = "unmatched"
+
+SeriesKey = Tuple[str, str]  # (方法, 路由模板)
+
+
+def latency_bucket(seconds: float) -> int:
+    """延迟所在的桶序号（最后一个序号表示 +Inf）"""
+    if seconds <= LATENCY_BASE:
+        return 0
+    mantissa, exponent = math.frexp(seconds / LATENCY_BASE)
+    index = exponent - 1 if mantissa == 0.5 else exponent
+    return min(index, len(LATENCY_BUCKETS))
+
+
+class RouteSeries:
+    """一个 (方法, 路由) 的计数"""
+
+    __slots__ = ("statuses", "in_flight", "buckets", "total_seconds")
+
+    def __init__(self):
+        self.statuses = [0] * len(STATUS_CLASSES)
+        self.in_flight = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total_seconds = 0.0
+
+    def observe(self, status: int, seconds: float):
+        self.statuses[min(max(status // 100, 1), 5) - 1] += 1
+        self.buckets[latency_bucket(seconds)] += 1
+        self.total_seconds += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "statuses": list(self.statuses),
+            "in_flight": self.in_flight,
+            "buckets": list(self.buckets),
+            "sum": self.total_seconds
+        }
+
+    def merge(self, data: Dict[str, Any], in_flight: bool = True):
+        for i, count in enumerate(data.get("statuses", ())[:len(self.statuses)]):
+            self.statuses[i] += count
+        for i, count in enumerate(data.get("buckets", ())[:len(self.buckets)]):
+            self.buckets[i] += count
+        self.total_seconds += data.get("sum", 0.0)
+        if in_flight:
+            self.in_flight += data.get("in_flight", 0)
+
+
+class MetricsRegistry:
+    """本进程的指标；设置 directory 后与其他 worker 通过文件汇总"""
+
+    def __init__(self, directory: Optional[Path] = None, flush_interval: float = 5.0):
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self.started_at = time.time()
+        self._series: Dict[SeriesKey, RouteSeries] = {}
+        self._gauges: List[Tuple[str, str, Callable[[], float]]] = []
+
+    def series(self, method: str, route: str) -> RouteSeries:
+        key = (method, route)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = RouteSeries()
+        return series
+
+    def add_gauge(self, name: str, help_text: str, read: Callable[[], float]):
+        """进程级指标（抓取时读取），如队列深度、连接数"""
+        self._gauges.append((name, help_text, read))
+
+    # ---------- 多 worker 文件汇总 ----------
+
+    @property
+    def path(self) -> Optional[Path]:
+        return self.directory / f"metrics_{self.pid}.json" if self.directory else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pid": self.pid,
+            "written_at": time.time(),
+            "series": [[method, route, s.to_dict()] for (method, route), s in list(self._series.items())]
+        }
+
+    def flush(self, snapshot: Optional[Dict[str, Any]] = None) -> bool:
+        """写入本 worker 的指标文件（先写临时文件再原子替换）"""
+        if self.directory is None:
+            return False
+        snapshot = snapshot or self.snapshot()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(snapshot), encoding="utf-8")
+        os.replace(tmp, self.path)
+        return True
+
+    async def run(self):
+        """后台任务 - 定期写入指标文件（快照在事件循环中生成，写文件放到线程池）"""
+        if self.directory is None:
+            return
+        try:
+            while True:
+                await run_in_threadpool(self.flush, self.snapshot())
+                await asyncio.sleep(self.flush_interval)
+        finally:
+            self.flush()
+
+    def collect(self) -> Dict[SeriesKey, RouteSeries]:
+        """本进程的实时计数，加上其他 worker 文件中的计数"""
+        merged: Dict[SeriesKey, RouteSeries] = {}
+        for key, series in list(self._series.items()):
+            merged[key] = RouteSeries()
+            merged[key].merge(series.to_dict())
+        if self.directory is None or not self.directory.is_dir():
+            return merged
+        stale_before = time.time() - 3 * self.flush_interval
+        for path in self.directory.glob("metrics_*.json"):
+            if path == self.path:
+                continue
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            live = data.get("written_at", 0) >= stale_before
+            for method, route, values in data.get("series", ()):
+                key = (method, route)
+                if key not in merged:
+                    merged[key] = RouteSeries()
+                merged[key].merge(values, in_flight=live)
+        return merged
+
+    # ---------- Prometheus 文本格式 ----------
+
+    def render(self) -> str:
+        series = sorted(self.collect().items())
+        lines = [
+            "# HELP http_requests_total 按路由和状态码类别统计的请求数",
+            "# TYPE http_requests_total counter"
+        ]
+        for (method, route), s in series:
+            labels = f'method="{method}",route="{escape(route)}"'
+            for status, count in zip(STATUS_CLASSES, s.statuses):
+                if count:
+                    lines.append(f'http_requests_total{{{labels},status="{status}"}} {count}')
+        lines += [
+            "# HELP http_requests_in_flight 正在处理的请求数",
+            "# TYPE http_requests_in_flight gauge"
+        ]
+        for (method, route), s in series:
+            lines.append(f'http_requests_in_flight{{method="{method}",route="{escape(route)}"}} {s.in_flight}')
+        lines += [
+            "# HELP http_request_duration_seconds 请求延迟（秒）",
+            "# TYPE http_request_duration_seconds histogram"
+        ]
+        for (method, route), s in series:
+            labels = f'method="{method}",route="{escape(route)}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, s.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            cumulative += s.buckets[-1]
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {s.total_seconds:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {cumulative}")
+        for name, help_text, read in self._gauges:
+            try:
+                value = read()
+            except Exception:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f'{name}{{pid="{self.pid}"}} {value}']
+        return "\n".join(lines) + "\n"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def match_route(routes: List[Any], scope) -> Optional[Any]:
+    """按路由表匹配请求；只有方法不匹配（405）时返回第一个路径匹配的路由"""
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+        if match == Match.PARTIAL and partial is None:
+            partial = route
+    return partial
+
+
+class RouteResolver:
+    """
+    请求对应的路由，供指标、采样分析、慢请求各中间件共用
+
+    每个请求只匹配一次，结果存入 scope，内层中间件直接读取；无参数路由按
+    (方法, 路径) 缓存，不用逐个路由匹配。
+    """
+
+    SCOPE_KEY = "dentalreserve.route"
+
+    def __init__(self, routes: List[Any]):
+        self.routes = routes  # 应用的路由列表（引用，之后注册的路由也能匹配到）
+        self._static: Dict[Tuple[str, str], Any] = {}
+
+    def route(self, scope) -> Optional[Any]:
+        if self.SCOPE_KEY in scope:
+            return scope[self.SCOPE_KEY]
+        key = (scope["method"], scope["path"])
+        route = self._static.get(key)
+        if route is None:
+            route = match_route(self.routes, scope)
+            if getattr(route, "path_format", None) == scope["path"] and len(self._static) < 4096:
+                self._static[key] = route
+        scope[self.SCOPE_KEY] = route
+        return route
+
+    def template(self, scope) -> str:
+        """请求对应的路由模板"""
+        return getattr(self.route(scope), "path_format", None) or UNMATCHED
+
+
+class MetricsMiddleware:
+    """纯 ASGI 中间件（不经过 BaseHTTPMiddleware，流式响应不受影响）"""
+
+    def __init__(self, app, registry: MetricsRegistry, resolver: RouteResolver):
+        self.app = app
+        self.registry = registry
+        self.resolver = resolver
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        series = self.registry.series(scope["method"], self.resolver.template(scope))
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        series.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            series.in_flight -= 1
+            series.observe(status, time.perf_counter() - started)
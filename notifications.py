@@ -0,0 +1,469 @@
+"""
+后台通知队列 - 预约确认/取消/改约的短信和邮件
+
+通知先写入持久化的任务队列（SQLite），由后台工作任务按服务商分批发送，
+不占用请求时间。发送失败按指数退避重试，超过最大次数后进入死信。
+
+发送渠道（sink）：
+  - LocalSmsSink / LocalEmailSink: 本地替身，只记录到内存（和可选的文件），用于开发和测试
+  - TwilioSmsSink / SmtpEmailSink: 真实发送，配置了 Twilio / SMTP 环境变量时启用
+"""
+
+import asyncio
+import base64
+import json
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import deque
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+
+class Job:
+    """队列中的一个通知任务"""
+
+    __slots__ = ("id", "provider", "payload", "attempts", "created_at")
+
+    def __init__(self, id: int, provider: str, payload: dict, attempts: int, created_at: float):
+        self.id = id
+        self.provider = provider
+        self.payload = payload
+        self.attempts = attempts
+        self.created_at = created_at
+
+
+class JobQueue:
+    """
+    持久化任务队列（SQLite）
+
+    claim 在一个事务中把到期的任务标记为 running 并设置租约；
+    进程崩溃后，租约过期的 running 任务会被重新领取。发送时间较长时用 renew 续租。
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        max_attempts: int = 5,
+        retry_base: float = 2.0,
+        retry_max: float = 300.0,
+        lease_seconds: float = 60.0
+    ):
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " provider TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_error TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (provider, status, next_attempt_at)")
+
+    def enqueue_many(self, jobs: Iterable[Tuple[str, dict]]) -> int:
+        """批量入队 [(服务商, 内容)]，一次事务"""
+        now = time.time()
+        rows = [(provider, json.dumps(payload, ensure_ascii=False), PENDING, now, now) for provider, payload in jobs]
+        if not rows:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO jobs (provider, payload, status, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.execute("COMMIT")
+        return len(rows)
+
+    def claim(self, provider: str, limit: int, lease_seconds: Optional[float] = None) -> List[Job]:
+        """领取最多 limit 个到期任务（含租约过期的 running 任务），租约默认 lease_seconds"""
+        now = time.time()
+        lease = self.lease_seconds if lease_seconds is None else lease_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT id, payload, attempts, created_at FROM jobs"
+                " WHERE provider = ? AND status IN (?, ?) AND next_attempt_at <= ?"
+                " ORDER BY next_attempt_at LIMIT ?",
+                (provider, PENDING, RUNNING, now, limit)
+            ).fetchall()
+            if rows:
+                self._conn.executemany(
+                    "UPDATE jobs SET status = ?, next_attempt_at = ? WHERE id = ?",
+                    [(RUNNING, now + lease, row[0]) for row in rows]
+                )
+            self._conn.execute("COMMIT")
+        return [Job(row[0], provider, json.loads(row[1]), row[2], row[3]) for row in rows]
+
+    def renew(self, job_ids: List[int], lease_seconds: float):
+        """延长仍在发送中的任务的租约"""
+        if not job_ids:
+            return
+        expires = time.time() + lease_seconds
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET next_attempt_at = ? WHERE id = ? AND status = ?",
+                [(expires, i, RUNNING) for i in job_ids]
+            )
+
+    def complete(self, job_ids: List[int]):
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.executemany("UPDATE jobs SET status = ? WHERE id = ?", [(DONE, i) for i in job_ids])
+
+    def fail(self, job: Job, error: str) -> bool:
+        """记录一次失败；返回 True 表示已进入死信"""
+        import random  # 只在发送失败时需要，不拖慢启动
+
+        attempts = job.attempts + 1
+        dead = attempts >= self.max_attempts
+        delay = min(self.retry_max, self.retry_base * (2 ** (attempts - 1))) * random.uniform(0.8, 1.2)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (DEAD if dead else PENDING, attempts, time.time() + delay, error[:500], job.id)
+            )
+        return dead
+
+    def purge_done(self, older_than: float) -> int:
+        """删除已完成的旧任务"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status = ? AND created_at < ?", (DONE, time.time() - older_than)
+            )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """按服务商统计队列深度，以及最早一个待发送任务的等待时间（lag）"""
+        now = time.time()
+        with self._lock:
+            counts = self._conn.execute(
+                "SELECT provider, status, COUNT(*), MIN(created_at) FROM jobs GROUP BY provider, status"
+            ).fetchall()
+        providers: Dict[str, Dict[str, Any]] = {}
+        for provider, status, count, oldest in counts:
+            entry = providers.setdefault(provider, {PENDING: 0, RUNNING: 0, DONE: 0, DEAD: 0, "lag_seconds": 0.0})
+            entry[status] = count
+            if status in (PENDING, RUNNING) and oldest is not None:
+                entry["lag_seconds"] = max(entry["lag_seconds"], round(now - oldest, 3))
+        return providers
+
+    def backlog(self) -> int:
+        """待发送（含发送中）的任务数"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (PENDING, RUNNING)
+            ).fetchone()[0]
+
+    def dead_letters(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, provider, payload, attempts, last_error, created_at FROM jobs"
+                " WHERE status = ? ORDER BY id DESC LIMIT ?", (DEAD, limit)
+            ).fetchall()
+        return [
+            {"id": r[0], "provider": r[1], "payload": json.loads(r[2]), "attempts": r[3],
+             "last_error": r[4], "created_at": r[5]}
+            for r in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# 发送渠道：send_batch 返回每个任务的错误信息（None 表示成功）
+
+class LocalSmsSink:
+    """本地短信替身 - 记录到内存，可选追加到 JSONL 文件"""
+
+    provider = "sms"
+
+    def __init__(self, path: Optional[Path] = None, keep: int = 1000):
+        self.path = Path(path) if path else None
+        self.outbox: Deque[dict] = deque(maxlen=keep)
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def send_batch(self, jobs: List[Job]) -> List[Optional[str]]:
+        messages = [{"to": j.payload["to"], "body": j.payload["body"], "sent_at": time.time()} for j in jobs]
+        self.outbox.extend(messages)
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(m, ensure_ascii=False) + "\n" for m in messages)
+        return [None] * len(jobs)
+
+
+class LocalEmailSink:
+    """本地邮件替身 - 生成完整的邮件（RFC 5322）并记录到内存，可选保存为 .eml 文件"""
+
+    provider = "email"
+
+    def __init__(self, sender: str, directory: Optional[Path] = None, keep: int = 1000):
+        self.sender = sender
+        self.directory = Path(directory) if directory else None
+        self.outbox: Deque[EmailMessage] = deque(maxlen=keep)
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def send_batch(self, jobs: List[Job]) -> List[Optional[str]]:
+        for job in jobs:
+            message = build_email(self.sender, job.payload)
+            self.outbox.append(message)
+            if self.directory:
+                (self.directory / f"{job.id}.eml").write_bytes(message.as_bytes())
+        return [None] * len(jobs)
+
+
+class TwilioSmsSink:
+    """Twilio 短信 - 使用 REST API（不依赖 twilio SDK）"""
+
+    provider = "sms"
+
+    def __init__(self, account_sid: str, auth_token: str, from_number: str, timeout: float = 10.0):
+        self.url = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Messages.json"
+        credentials = base64.b64encode(f"{account_sid}:{auth_token}".encode()).decode()
+        self.headers = {"Authorization": f"Basic {credentials}"}
+        self.from_number = from_number
+        self.timeout = timeout
+
+    def send_batch(self, jobs: List[Job]) -> List[Optional[str]]:
+        import urllib.request  # 只在配置了 Twilio 时需要，不拖慢启动
+
+        results: List[Optional[str]] = []
+        for job in jobs:
+            data = urllib.parse.urlencode({
+                "To": job.payload["to"], "From": self.from_number, "Body": job.payload["body"]
+            }).encode()
+            request = urllib.request.Request(self.url, data=data, headers=self.headers, method="POST")
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout):
+                    results.append(None)
+            except Exception as e:
+                results.append(str(e))
+        return results
+
+
+class SmtpEmailSink:
+    """SMTP 邮件 - 每批复用一个 SMTP 连接"""
+
+    provider = "email"
+
+    def __init__(self, host: str, port: int, user: str, password: str, timeout: float = 15.0):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+
+    def send_batch(self, jobs: List[Job]) -> List[Optional[str]]:
+        import smtplib  # 只在配置了 SMTP 时需要，不拖慢启动
+
+        try:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            smtp.starttls()
+            smtp.login(self.user, self.password)
+        except Exception as e:
+            return [f"SMTP 连接失败: {e}"] * len(jobs)
+        results: List[Optional[str]] = []
+        try:
+            for job in jobs:
+                try:
+                    smtp.send_message(build_email(self.user, job.payload))
+                    results.append(None)
+                except Exception as e:
+                    results.append(str(e))
+        finally:
+            try:
+                smtp.quit()
+            except Exception:
+                pass
+        return results
+
+
+def build_email(sender: str, payload: dict) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = payload["to"]
+    message["Subject"] = payload["subject"]
+    message.set_content(payload["body"])
+    return message
+
+
+class NotificationDispatcher:
+    """
+    通知发送调度
+
+    每个服务商启动 concurrency 个工作任务；每个任务一次领取最多 batch_size 个任务，
+    在线程池中整批发送，然后统一确认或按失败重试。
+
+    真实的发送渠道逐条发送，每条最多等待 sink.timeout 秒，所以租约至少是
+    batch_size × timeout；发送超过半个租约时续租，其他工作任务不会重复领取仍在发送的任务。
+    """
+
+    def __init__(self, queue: JobQueue, sinks: List[Any], concurrency: int = 2,
+                 batch_size: int = 50, poll_interval: float = 1.0, retention: float = 7 * 86400):
+        self.queue = queue
+        self.sinks = {sink.provider: sink for sink in sinks}
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._last_purge = time.monotonic()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.sent = 0
+        self.failed = 0
+        self.dead_lettered = 0
+
+    def start(self) -> List[asyncio.Task]:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        return [
+            asyncio.create_task(self._worker(provider))
+            for provider in self.sinks
+            for _ in range(self.concurrency)
+        ]
+
+    async def enqueue(self, jobs: List[Tuple[str, dict]]):
+        """入队（在线程池中写入 SQLite）并唤醒工作任务"""
+        if not jobs:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self.queue.enqueue_many, jobs)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def lease_for(self, sink) -> float:
+        """一批任务的租约（秒）"""
+        return max(self.queue.lease_seconds, self.batch_size * getattr(sink, "timeout", 0.0))
+
+    async def _worker(self, provider: str):
+        loop = asyncio.get_running_loop()
+        sink = self.sinks[provider]
+        lease = self.lease_for(sink)
+        while True:
+            try:
+                jobs = await loop.run_in_executor(None, self.queue.claim, provider, self.batch_size, lease)
+                if not jobs:
+                    if time.monotonic() - self._last_purge > 3600:
+                        # 空闲时清理超过保留期的已完成任务
+                        self._last_purge = time.monotonic()
+                        await loop.run_in_executor(None, self.queue.purge_done, self.retention)
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                sending = loop.run_in_executor(None, self._send, sink, jobs)
+                while True:
+                    try:
+                        await asyncio.wait_for(asyncio.shield(sending), lease / 2)
+                        break
+                    except asyncio.TimeoutError:
+                        await loop.run_in_executor(None, self.queue.renew, [job.id for job in jobs], lease)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ 通知发送任务出错 [{provider}]: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    def _send(self, sink, jobs: List[Job]):
+        try:
+            errors = sink.send_batch(jobs)
+        except Exception as e:
+            errors = [str(e)] * len(jobs)
+        done = [job.id for job, error in zip(jobs, errors) if error is None]
+        self.queue.complete(done)
+        self.sent += len(done)
+        for job, error in zip(jobs, errors):
+            if error is not None:
+                self.failed += 1
+                if self.queue.fail(job, error):
+                    self.dead_lettered += 1
+
+    def backlog(self) -> int:
+        return self.queue.backlog()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "providers": self.queue.stats(),
+            "sinks": {provider: type(sink).__name__ for provider, sink in self.sinks.items()},
+            "sent": self.sent,
+            "failed_attempts": self.failed,
+            "dead_lettered": self.dead_lettered
+        }
+
+
+# 通知内容
+
+_MESSAGES = {
+    "appointment.created": ("预约确认", "您已成功预约 {clinic_name} 的{service}，时间 {date} {time}。"),
+    "appointment.cancelled": ("预约已取消", "您在 {clinic_name} {date} {time} 的{service}预约已取消。"),
+    "appointment.rescheduled": ("预约已改期", "您在 {clinic_name} 的{service}预约已改到 {date} {time}。"),
+    "appointment.reminder": ("预约提醒", "提醒：您在 {clinic_name} 的{service}预约将于 {date} {time} 开始。"),
+}
+# 带联系电话的通知（号码池用完时预约没有虚拟号码，不附这一句）
+_WITH_CONTACT = ("appointment.created", "appointment.reminder")
+
+
+def appointment_notifications(event_type: str, appointment: dict) -> List[Tuple[str, dict]]:
+    """根据预约事件生成短信和邮件任务"""
+    if event_type not in _MESSAGES:
+        return []
+    subject, template = _MESSAGES[event_type]
+    body = template.format(**{k: appointment.get(k) or "" for k in ("clinic_name", "service", "date", "time")})
+    if event_type in _WITH_CONTACT and appointment.get("virtual_phone"):
+        body += f"诊所联系电话: {appointment['virtual_phone']}"
+    meta = {"appointment_id": appointment["id"], "event": event_type}
+    jobs = []
+    if appointment.get("patient_phone"):
+        jobs.append(("sms", {"to": appointment["patient_phone"], "body": body, **meta}))
+    if appointment.get("patient_email"):
+        jobs.append(("email", {
+            "to": appointment["patient_email"],
+            "subject": f"DentalReserve {subject}",
+            "body": f"{appointment.get('patient_name') or ''} 您好，\n\n{body}\n\nDentalReserve",
+            **meta
+        }))
+    return jobs
+
+
+def _configured(value: Optional[str]) -> bool:
+    """环境变量已配置（排除 .env.example 中的占位值）"""
+    return bool(value) and not value.startswith("your_")
+
+
+def create_sinks(env: Dict[str, str], outbox_dir: Optional[Path] = None) -> List[Any]:
+    """根据环境变量选择发送渠道；未配置 Twilio / SMTP 时使用本地替身"""
+    if _configured(env.get("TWILIO_ACCOUNT_SID")) and _configured(env.get("TWILIO_AUTH_TOKEN")):
+        sms = TwilioSmsSink(env["TWILIO_ACCOUNT_SID"], env["TWILIO_AUTH_TOKEN"], env.get("TWILIO_PHONE_NUMBER", ""))
+    else:
+        sms = LocalSmsSink(outbox_dir / "sms.jsonl" if outbox_dir else None)
+    if _configured(env.get("SMTP_USER")) and _configured(env.get("SMTP_PASSWORD")):
+        email = SmtpEmailSink(env.get("SMTP_HOST", "smtp.gmail.com"), int(env.get("SMTP_PORT", "587")),
+                              env["SMTP_USER"], env["SMTP_PASSWORD"])
+    else:
+        email = LocalEmailSink(env.get("SMTP_USER") or "noreply@dentalreserve.ca",
+                               outbox_dir / "mail" if outbox_dir else None)
+    return [sms, email]
@@ -0,0 +1,226 @@
+"""
+请求采样分析 - 按比例或按签名请求头挑选请求，采样其调用栈，按路由汇总成火焰图数据
+
+同步路由在线程池中执行，cProfile 只能分析启用它的线程，所以这里用栈采样：
+有被分析的请求时，后台线程每隔 interval 秒读取所有线程的当前栈
+（sys._current_frames），栈中包含某个被分析路由的处理函数时，从处理函数到
+栈顶的部分记一次样本。采样的是墙钟时间，阻塞 I/O 和锁等待也会出现在结果中。
+
+挑选请求：PROFILE_SAMPLE_RATE 比例的请求随机采样；另外带 X-Profile 请求头且
+签名有效的请求一定采样。签名为 "<过期时间戳>.<HMAC-SHA256 十六进制>"，
+签名内容 "<过期时间戳>:<方法>:<路径>"，密钥为 PROFILE_SECRET（见 sign_request）。
+密钥为空或是 .env.example 中的占位值（your_ 开头）时不接受签名请求头。
+
+每个路由最多保留 max_stacks 种不同的栈，最多保留 max_routes 个路由（淘汰最久未更新的）。
+"""
+
+import hashlib
+import hmac
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import RouteResolver
+
+PROFILE_HEADER = b"x-profile"
+TRUNCATED = "[其他栈]"
+
+
+def sign_request(secret: str, method: str, path: str, ttl: float = 300) -> str:
+    """生成 X-Profile 请求头的值"""
+    expires = int(time.time() + ttl)
+    message = f"{expires}:{method.upper()}:{path}".encode()
+    return f"{expires}.{hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()}"
+
+
+def verify_signature(secret: str, value: str, method: str, path: str) -> bool:
+    expires, _, signature = value.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    message = f"{expires}:{method.upper()}:{path}".encode()
+    return hmac.compare_digest(signature, hmac.new(secret.encode(), message, hashlib.sha256).hexdigest())
+
+
+class RouteProfile:
+    """一个路由的采样结果"""
+
+    __slots__ = ("requests", "samples", "stacks")
+
+    def __init__(self):
+        self.requests = 0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+
+class RequestProfiler:
+    """栈采样分析器"""
+
+    def __init__(self, sample_rate: float = 0.0, secret: Optional[str] = None, interval: float = 0.005,
+                 max_routes: int = 64, max_stacks: int = 2000, max_depth: int = 64):
+        self.sample_rate = sample_rate
+        # 占位密钥是公开的，当作未配置（与通知渠道的凭据判断相同）
+        self.secret = secret if secret and not secret.startswith("your_") else None
+        self.interval = interval
+        self.max_routes = max_routes
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._profiles: "OrderedDict[str, RouteProfile]" = OrderedDict()
+        self._active: Dict[Any, List[Any]] = {}  # 处理函数的代码对象 -> [路由, 进行中的请求数]
+        self._labels: Dict[Any, str] = {}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def selected(self, scope) -> bool:
+        """这个请求是否需要采样"""
+        if self.secret is not None:
+            for name, value in scope.get("headers", ()):
+                if name == PROFILE_HEADER:
+                    return verify_signature(self.secret, value.decode("latin-1"), scope["method"], scope["path"])
+        if self.sample_rate <= 0:
+            return False
+        import random  # 只在开启采样时需要，不拖慢启动
+
+        return random.random() < self.sample_rate
+
+    def begin(self, route: str, code) -> None:
+        with self._lock:
+            active = self._active.get(code)
+            if active is None:
+                self._active[code] = [route, 1]
+            else:
+                active[1] += 1
+            self._profile(route).requests += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def end(self, code) -> None:
+        with self._lock:
+            active = self._active.get(code)
+            if active is not None:
+                active[1] -= 1
+                if active[1] <= 0:
+                    del self._active[code]
+            if not self._active:
+                self._wake.clear()
+
+    def _profile(self, route: str) -> RouteProfile:
+        profile = self._profiles.get(route)
+        if profile is None:
+            profile = self._profiles[route] = RouteProfile()
+            while len(self._profiles) > self.max_routes:
+                self._profiles.popitem(last=False)
+        else:
+            self._profiles.move_to_end(route)
+        return profile
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            self._wake.wait()
+            with self._lock:
+                targets = {code: active[0] for code, active in self._active.items()}
+            if targets:
+                self._sample(targets, me)
+            time.sleep(self.interval)
+
+    def _sample(self, targets: Dict[Any, str], me: int):
+        found: List[Tuple[str, List[Any]]] = []
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                route = targets.get(frame.f_code)
+                if route is not None:
+                    found.append((route, codes))
+                    break
+                frame = frame.f_back
+        if not found:
+            return
+        with self._lock:
+            for route, codes in found:
+                # 从处理函数到栈顶（根在前），过深的栈只保留靠近处理函数的部分
+                stack = ";".join(self._label(code) for code in reversed(codes[-self.max_depth:]))
+                profile = self._profile(route)
+                profile.samples += 1
+                if stack not in profile.stacks and len(profile.stacks) >= self.max_stacks:
+                    stack = TRUNCATED
+                profile.stacks[stack] += 1
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename.replace("\\", "/").rsplit("/", 1)[-1]
+            label = self._labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+        return label
+
+    def collapsed(self, route: Optional[str] = None) -> str:
+        """折叠栈格式（每行 "路由;帧;帧 次数"），可直接交给 flamegraph.pl / speedscope"""
+        with self._lock:
+            lines = [
+                f"{name};{stack} {count}"
+                for name, profile in self._profiles.items() if route is None or name == route
+                for stack, count in profile.stacks.items()
+            ]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def summary(self, top: int = 10) -> List[Dict[str, Any]]:
+        """每个路由的采样数和自身样本最多的函数"""
+        with self._lock:
+            result = []
+            for name, profile in self._profiles.items():
+                leaves: Counter = Counter()
+                for stack, count in profile.stacks.items():
+                    leaves[stack.rsplit(";", 1)[-1]] += count
+                result.append({
+                    "route": name,
+                    "requests": profile.requests,
+                    "samples": profile.samples,
+                    "sampled_seconds": round(profile.samples * self.interval, 3),
+                    "distinct_stacks": len(profile.stacks),
+                    "top_frames": [{"frame": f, "samples": c} for f, c in leaves.most_common(top)]
+                })
+        return sorted(result, key=lambda r: r["samples"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._profiles.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sample_rate": self.sample_rate,
+            "signed_header": self.secret is not None,
+            "interval": self.interval,
+            "routes": len(self._profiles),
+            "active": sum(active[1] for active in self._active.values())
+        }
+
+
+class ProfilingMiddleware:
+    """挑选请求并在处理期间开启采样（未被挑中的请求只多一次判断）"""
+
+    def __init__(self, app, profiler: RequestProfiler, resolver: RouteResolver):
+        self.app = app
+        self.profiler = profiler
+        self.resolver = resolver
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.selected(scope):
+            await self.app(scope, receive, send)
+            return
+        route = self.resolver.route(scope)
+        code = getattr(getattr(route, "endpoint", None), "__code__", None)
+        if code is None:
+            await self.app(scope, receive, send)
+            return
+        self.profiler.begin(route.path_format, code)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.end(code)
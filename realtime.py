@@ -0,0 +1,288 @@
+"""
+实时推送 - 诊所后台的 WebSocket 预约变更推送，管理员后台的 SSE 统计推送
+
+每个连接有一个有界发送队列；消息只序列化一次，所有订阅者共享同一个文本。
+队列写满的慢消费者会被断开（客户端重连后重新拉取即可），卡在发送上的连接
+也会因为心跳消息填满队列而被断开。心跳由整个 hub 的一个定时任务统一发送，
+并断开长时间没有任何回应的连接。
+
+路由处理函数运行在线程池中，publish / notify 是线程安全的：消息通过
+call_soon_threadsafe 交给事件循环分发。
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Set
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+# 关闭码
+CLOSE_SLOW_CONSUMER = 1013
+CLOSE_IDLE_TIMEOUT = 1001
+CLOSE_NOT_FOUND = 4404
+
+
+class FeedConnection:
+    """一个 WebSocket 订阅连接"""
+
+    __slots__ = ("websocket", "clinic_id", "queue", "last_seen", "close_code", "closing", "task")
+
+    def __init__(self, websocket: WebSocket, clinic_id: str, queue_size: int):
+        self.websocket = websocket
+        self.clinic_id = clinic_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.last_seen = time.monotonic()
+        self.close_code = 1000
+        self.closing = False
+        self.task: Optional[asyncio.Task] = None
+
+    def offer(self, message: str) -> bool:
+        """非阻塞入队；队列已满时返回 False"""
+        if self.closing:
+            return True
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self, code: int):
+        """丢弃未发送的消息并结束发送循环（包括卡在发送上的情况）"""
+        if self.closing:
+            return
+        self.closing = True
+        self.close_code = code
+        if self.task is not None:
+            self.task.cancel()
+
+
+class ClinicFeedHub:
+    """按诊所分组的 WebSocket 推送中心"""
+
+    def __init__(
+        self,
+        queue_size: int = 256,
+        heartbeat_interval: float = 25.0,
+        idle_timeout: float = 75.0
+    ):
+        self.queue_size = queue_size
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Dict[str, Set[FeedConnection]] = {}
+        self._connections = 0
+        self.messages_published = 0
+        self.slow_consumers_dropped = 0
+        self.idle_dropped = 0
+
+    def start(self) -> asyncio.Task:
+        """绑定当前事件循环并启动心跳任务"""
+        self._loop = asyncio.get_running_loop()
+        return asyncio.create_task(self._heartbeat())
+
+    # 发布
+    def publish(self, clinic_id: str, event: Dict[str, Any]):
+        """发布一条消息给某个诊所的所有订阅者（可在任意线程调用）"""
+        loop = self._loop
+        if loop is None or not self._subscribers.get(clinic_id):
+            return
+        message = json.dumps(event, ensure_ascii=False, default=str)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fanout(clinic_id, message)
+        else:
+            loop.call_soon_threadsafe(self._fanout, clinic_id, message)
+
+    def _fanout(self, clinic_id: str, message: str):
+        self.messages_published += 1
+        for conn in tuple(self._subscribers.get(clinic_id, ())):
+            if not conn.offer(message):
+                self.slow_consumers_dropped += 1
+                conn.close(CLOSE_SLOW_CONSUMER)
+
+    # 连接
+    async def serve(self, websocket: WebSocket, clinic_id: str):
+        """处理一个订阅连接，直到客户端断开或被服务端断开"""
+        await websocket.accept()
+        conn = FeedConnection(websocket, clinic_id, self.queue_size)
+        conn.task = asyncio.current_task()
+        self._subscribers.setdefault(clinic_id, set()).add(conn)
+        self._connections += 1
+        receiver = asyncio.create_task(self._receive(conn))
+        conn.offer(json.dumps({
+            "type": "hello",
+            "clinic_id": clinic_id,
+            "heartbeat_interval": self.heartbeat_interval
+        }))
+        try:
+            while True:
+                await websocket.send_text(await conn.queue.get())
+        except asyncio.CancelledError:
+            if not conn.closing:
+                raise
+        except (WebSocketDisconnect, RuntimeError, ConnectionError):
+            conn.closing = True
+        finally:
+            receiver.cancel()
+            subscribers = self._subscribers.get(clinic_id)
+            if subscribers is not None:
+                subscribers.discard(conn)
+                if not subscribers:
+                    del self._subscribers[clinic_id]
+            self._connections -= 1
+            try:
+                await websocket.close(code=conn.close_code)
+            except Exception:
+                pass
+
+    async def _receive(self, conn: FeedConnection):
+        """读取客户端消息（pong 或其他），只用于判断连接是否存活"""
+        try:
+            while True:
+                await conn.websocket.receive_text()
+                conn.last_seen = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            conn.close(1000)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            ping = json.dumps({"type": "ping", "ts": time.time()})
+            for subscribers in tuple(self._subscribers.values()):
+                for conn in tuple(subscribers):
+                    if now - conn.last_seen > self.idle_timeout:
+                        self.idle_dropped += 1
+                        conn.close(CLOSE_IDLE_TIMEOUT)
+                    elif not conn.offer(ping):
+                        self.slow_consumers_dropped += 1
+                        conn.close(CLOSE_SLOW_CONSUMER)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": self._connections,
+            "clinics": len(self._subscribers),
+            "messages_published": self.messages_published,
+            "slow_consumers_dropped": self.slow_consumers_dropped,
+            "idle_dropped": self.idle_dropped
+        }
+
+
+def sse_frame(event: str, data: Any) -> str:
+    """格式化一条 SSE 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class AdminStatsStream:
+    """
+    管理员统计 SSE 推送
+
+    计数变化时调用 notify；广播任务按 min_interval 去抖，每次只计算一份统计快照，
+    序列化后的同一段文本发给所有订阅者。订阅者队列写满时断开该订阅者。
+    """
+
+    def __init__(
+        self,
+        snapshot: Callable[[], Dict[str, Any]],
+        min_interval: float = 1.0,
+        keepalive_interval: float = 15.0,
+        queue_size: int = 64,
+        recent_size: int = 20
+    ):
+        self.snapshot = snapshot
+        self.min_interval = min_interval
+        self.keepalive_interval = keepalive_interval
+        self.queue_size = queue_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._dirty: Optional[asyncio.Event] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._pending_activity: Deque[dict] = deque(maxlen=recent_size)
+        self._recent: Deque[str] = deque(maxlen=recent_size)
+        self._last_frame: Optional[str] = None
+        self.snapshots_computed = 0
+
+    def start(self) -> asyncio.Task:
+        """绑定当前事件循环并启动广播任务"""
+        self._loop = asyncio.get_running_loop()
+        self._dirty = asyncio.Event()
+        return asyncio.create_task(self._broadcast())
+
+    def notify(self, activity: Optional[dict] = None):
+        """计数已变化（可附带一条最近动态）；可在任意线程调用"""
+        loop = self._loop
+        if loop is None:
+            return
+        if activity is not None:
+            self._pending_activity.append(activity)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dirty.set()
+        else:
+            loop.call_soon_threadsafe(self._dirty.set)
+
+    async def _broadcast(self):
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            frames = []
+            while self._pending_activity:
+                frame = sse_frame("activity", self._pending_activity.popleft())
+                self._recent.append(frame)
+                frames.append(frame)
+            if self._subscribers:
+                self._last_frame = sse_frame("stats", self.snapshot())
+                self.snapshots_computed += 1
+                frames.append(self._last_frame)
+            else:
+                # 没有订阅者时不计算快照，下一个订阅者连接时再计算
+                self._last_frame = None
+            text = "".join(frames)
+            if text:
+                for queue in tuple(self._subscribers):
+                    try:
+                        queue.put_nowait(text)
+                    except asyncio.QueueFull:
+                        # 慢订阅者：清空积压并通知其断开（浏览器会按 retry 自动重连）
+                        self._subscribers.discard(queue)
+                        while not queue.empty():
+                            queue.get_nowait()
+                        queue.put_nowait(None)
+            # 去抖：两次推送之间至少间隔 min_interval
+            await asyncio.sleep(self.min_interval)
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """一个 SSE 订阅：先发送当前快照和最近动态，之后推送变化和保活注释"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        if self._last_frame is None:
+            self._last_frame = sse_frame("stats", self.snapshot())
+            self.snapshots_computed += 1
+        yield f"retry: {int(self.min_interval * 1000) * 3}\n" + "".join(self._recent) + self._last_frame
+        self._subscribers.add(queue)
+        try:
+            while True:
+                try:
+                    text = await asyncio.wait_for(queue.get(), self.keepalive_interval)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if text is None:
+                    break
+                yield text
+        finally:
+            self._subscribers.discard(queue)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subscribers),
+            "snapshots_computed": self.snapshots_computed
+        }
@@ -0,0 +1,209 @@
+"""
+预约提醒调度 - 预约前 24 小时和 2 小时发送提醒
+
+待发送的提醒保存在按发送时间排序的最小堆中；取消或改约时把旧条目标记为失效
+（惰性删除）并压入新条目，O(log n)。失效条目过多时整体重建堆。
+堆条目是只含字符串和数字的元组（不被垃圾回收跟踪），条目是否有效由
+``_entries`` 中记录的序号判断。
+
+只安排发送时间还没到的提醒：预约前 2 至 24 小时内预约的只发 2 小时提醒，不到 2 小时
+的不发提醒（确认通知已经包含预约信息）。启动时同样只重建未到期的条目，一次性
+heapify，O(n)，不需要逐条插入；已发送的提醒都已到期，所以不需要记录已发送标记。
+改约后按新时间重新安排。
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from appointment_store import ACTIVE_STATUSES
+from memory_usage import cache_sizeof, sampled_sizeof
+
+# 旧版本记录的已发送标记，启动时删除
+REMINDERS_KIND = "reminders"
+
+# (提醒类型, 提前秒数)
+REMINDER_OFFSETS = (("24h", 24 * 3600), ("2h", 2 * 3600))
+
+Entry = Tuple[float, int, str, str]  # (发送时间, 序号, 预约 ID, 提醒类型)
+
+_DUE, _SEQ, _APPOINTMENT, _KIND = range(4)
+
+
+def reminder_key(appointment_id: str, kind: str) -> str:
+    return f"{appointment_id}:{kind}"
+
+
+@lru_cache(maxsize=65536)
+def _slot_timestamp(date: str, time_: str) -> float:
+    hour, minute = time_.split(":")
+    parsed = datetime.strptime(date, "%Y-%m-%d")
+    return datetime(parsed.year, parsed.month, parsed.day, int(hour), int(minute)).timestamp()
+
+
+def appointment_timestamp(appointment: dict) -> Optional[float]:
+    """预约开始时间（本地时间的时间戳）；按 (日期, 时间) 缓存，同一时段的预约只解析一次"""
+    try:
+        return _slot_timestamp(appointment["date"], appointment["time"])
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+
+
+class ReminderScheduler:
+    """基于最小堆的提醒调度器"""
+
+    def __init__(self, appointments, backend, batch_size: int = 500, max_sleep: float = 60.0):
+        self.appointments = appointments
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self._heap: List[Entry] = []
+        self._entries: Dict[str, int] = {}  # 提醒键 -> 当前有效条目的序号
+        self._seq = itertools.count()
+        self._invalid = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self.dispatched = 0
+        self.skipped = 0
+
+    def load(self, now: Optional[float] = None):
+        """根据预约重建堆（heapify，O(n)）"""
+        now = time.time() if now is None else now
+        heap: List[Entry] = []
+        entries: Dict[str, int] = {}
+        for appointment in self.appointments.list():
+            for entry in self._entries_for(appointment, now):
+                heap.append(entry)
+                entries[reminder_key(entry[_APPOINTMENT], entry[_KIND])] = entry[_SEQ]
+        heapq.heapify(heap)
+        self._heap, self._entries, self._invalid = heap, entries, 0
+        markers = [r["id"] for r in self.backend.load(REMINDERS_KIND)]
+        if markers:
+            self.backend.write_batch([(REMINDERS_KIND, "delete", key, None) for key in markers])
+        return self
+
+    def _entries_for(self, appointment: dict, now: float) -> List[Entry]:
+        """一个预约发送时间还没到的提醒条目（已过的提醒不再补发）"""
+        if appointment.get("status") not in ACTIVE_STATUSES:
+            return []
+        starts_at = appointment_timestamp(appointment)
+        if starts_at is None:
+            return []
+        return [(starts_at - offset, next(self._seq), appointment["id"], kind)
+                for kind, offset in REMINDER_OFFSETS if starts_at - offset > now]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # 调整（在事件循环中调用）
+    def schedule(self, appointment: dict):
+        """新预约或改约：替换该预约的提醒条目"""
+        self.unschedule(appointment["id"])
+        earliest = None
+        for entry in self._entries_for(appointment, time.time()):
+            heapq.heappush(self._heap, entry)
+            self._entries[reminder_key(entry[_APPOINTMENT], entry[_KIND])] = entry[_SEQ]
+            earliest = entry[_DUE] if earliest is None else min(earliest, entry[_DUE])
+        # 新条目比当前等待的更早时唤醒调度循环
+        if earliest is not None and self._wakeup is not None and self._heap[0][_DUE] == earliest:
+            self._wakeup.set()
+
+    def unschedule(self, appointment_id: str):
+        """取消预约：标记其提醒条目失效"""
+        for kind, _ in REMINDER_OFFSETS:
+            key = reminder_key(appointment_id, kind)
+            if self._entries.pop(key, None) is not None:
+                self._invalid += 1
+        if self._invalid > 1024 and self._invalid > len(self._heap) // 2:
+            self._compact()
+
+    def _valid(self, entry: Entry) -> bool:
+        return self._entries.get(reminder_key(entry[_APPOINTMENT], entry[_KIND])) == entry[_SEQ]
+
+    def _compact(self):
+        self._heap = [e for e in self._heap if self._valid(e)]
+        heapq.heapify(self._heap)
+        self._invalid = 0
+
+    # 调度
+    def pop_due(self, now: float, limit: int) -> List[Entry]:
+        """弹出最多 limit 个到期的有效条目"""
+        due: List[Entry] = []
+        heap = self._heap
+        while heap and len(due) < limit and heap[0][_DUE] <= now:
+            entry = heapq.heappop(heap)
+            if not self._valid(entry):
+                self._invalid -= 1
+                continue
+            del self._entries[reminder_key(entry[_APPOINTMENT], entry[_KIND])]
+            due.append(entry)
+        return due
+
+    def next_due(self) -> Optional[float]:
+        heap = self._heap
+        while heap and not self._valid(heap[0]):
+            heapq.heappop(heap)
+            self._invalid -= 1
+        return heap[0][_DUE] if heap else None
+
+    async def run(self, dispatch: Callable[[List[Tuple[str, dict]]], Awaitable[None]]):
+        """调度循环：睡到下一个提醒的时间，然后分批发送到期的提醒"""
+        self._wakeup = asyncio.Event()
+        while True:
+            due_at = self.next_due()
+            delay = self.max_sleep if due_at is None else min(self.max_sleep, due_at - time.time())
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            now = time.time()
+            batch = self.pop_due(now, self.batch_size)
+            reminders = []
+            for entry in batch:
+                appointment = self.appointments.get(entry[_APPOINTMENT])
+                starts_at = appointment_timestamp(appointment) if appointment else None
+                if starts_at is None or starts_at <= now or appointment.get("status") not in ACTIVE_STATUSES:
+                    self.skipped += 1
+                    continue
+                reminders.append((entry[_KIND], dict(appointment)))
+            try:
+                if reminders:
+                    await dispatch(reminders)
+                    self.dispatched += len(reminders)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 放回堆中稍后重试（期间改约的条目已有新条目；取消的会在下次发送前被跳过）
+                print(f"❌ 提醒发送失败: {e}")
+                for entry in batch:
+                    key = reminder_key(entry[_APPOINTMENT], entry[_KIND])
+                    if key not in self._entries:
+                        heapq.heappush(self._heap, entry)
+                        self._entries[key] = entry[_SEQ]
+                await asyncio.sleep(1)
+
+    def memory_usage(self) -> Dict[str, int]:
+        """堆、有效条目表和时段时间戳缓存的大致内存占用（字节）"""
+        return {
+            "heap": sampled_sizeof(self._heap),
+            "entries": sampled_sizeof(self._entries),
+            "timestamp_cache": cache_sizeof(_slot_timestamp)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        # 只读查看堆顶（可能是尚未清理的失效条目），可在线程池中调用
+        heap = self._heap
+        due_at = heap[0][_DUE] if heap else None
+        return {
+            "scheduled": len(self._entries),
+            "heap_size": len(self._heap),
+            "next_due": datetime.fromtimestamp(due_at).isoformat() if due_at else None,
+            "dispatched": self.dispatched,
+            "skipped": self.skipped
+        }
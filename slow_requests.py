@@ -0,0 +1,254 @@
+"""
+慢请求日志 - 超出路由延迟预算的请求记录当时的调用栈
+
+中间件登记进行中的请求；后台看门狗线程每隔 check_interval 秒检查一次，请求耗时
+超过所在路由的预算时记录一条慢请求：处理函数所在线程的当前栈（同步路由在线程池中）
+以及请求任务的协程栈（异步路由在 await 处挂起时）。
+
+事件循环本身被阻塞时（例如异步路由里直接读文件），循环里的心跳协程不再更新，
+看门狗发现心跳超过 loop_stall 秒没有更新就记录事件循环线程的当前栈。
+
+记录为 JSON 行，写入按大小轮转的日志文件（RotatingFileHandler），最近的记录
+同时保留在内存中。
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import logging.handlers
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+from metrics import UNMATCHED, RouteResolver
+
+
+def parse_budgets(spec: str) -> Dict[str, float]:
+    """"/api/search=0.2,/=0.5" -> {路由模板: 秒}"""
+    budgets = {}
+    for item in spec.split(","):
+        route, _, seconds = item.strip().rpartition("=")
+        if route and seconds:
+            budgets[route] = float(seconds)
+    return budgets
+
+
+def format_stack(frame, limit: int = 40) -> List[str]:
+    return [
+        f"{fs.filename}:{fs.lineno} {fs.name}" + (f": {fs.line}" if fs.line else "")
+        for fs in traceback.extract_stack(frame, limit=limit)
+    ]
+
+
+def await_chain(task, limit: int = 40) -> List[str]:
+    """挂起的任务沿 await 链展开，直到正在等待的最内层协程"""
+    lines = []
+    coro = task.get_coro()
+    while coro is not None and len(lines) < limit:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is not None:
+            lines += format_stack(frame, 1)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return lines
+
+
+class InFlight:
+    """一个进行中的请求"""
+
+    __slots__ = ("id", "method", "path", "route", "code", "task", "started", "budget", "reported")
+
+    def __init__(self, id: int, method: str, path: str, route: str, code, task, budget: float):
+        self.id = id
+        self.method = method
+        self.path = path
+        self.route = route
+        self.code = code
+        self.task = task
+        self.started = time.monotonic()
+        self.budget = budget
+        self.reported = False
+
+
+class SlowRequestWatchdog:
+    """慢请求看门狗"""
+
+    def __init__(self, budgets: Optional[Dict[str, float]] = None, default_budget: float = 1.0,
+                 path: Optional[Path] = None, max_bytes: int = 5 * 1024 * 1024, backups: int = 3,
+                 check_interval: float = 0.1, loop_stall: float = 0.5, recent_size: int = 200):
+        self.budgets = budgets or {}
+        self.default_budget = default_budget
+        self.check_interval = check_interval
+        self.loop_stall = loop_stall
+        self._ids = itertools.count(1)
+        self._inflight: Dict[int, InFlight] = {}
+        self._recent: Deque[dict] = deque(maxlen=recent_size)
+        self._heartbeat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._stalled = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.slow_requests = 0
+        self.loop_stalls = 0
+        self._logger = None
+        if path is not None:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                           encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger = logging.getLogger(f"dentalreserve.slow_requests.{id(self)}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(handler)
+
+    def budget_for(self, route: str) -> float:
+        return self.budgets.get(route, self.default_budget)
+
+    # ---------- 请求登记（事件循环线程） ----------
+
+    def begin(self, method: str, path: str, route: str, code) -> InFlight:
+        request = InFlight(next(self._ids), method, path, route, code, asyncio.current_task(),
+                           self.budget_for(route))
+        self._inflight[request.id] = request
+        return request
+
+    def end(self, request: InFlight, status: int):
+        del self._inflight[request.id]
+        elapsed = time.monotonic() - request.started
+        if request.reported:
+            self._write({"type": "slow_request_finished", "request_id": request.id, "route": request.route,
+                         "status": status, "elapsed_ms": round(elapsed * 1000, 1)})
+        elif elapsed > request.budget:
+            # 在两次检查之间结束的慢请求：没有栈，只记录耗时
+            self.slow_requests += 1
+            self._write(self._record(request, elapsed, stacks=None, status=status))
+
+    # ---------- 看门狗 ----------
+
+    async def run(self):
+        """事件循环里的心跳；首次运行时启动看门狗线程"""
+        self._loop_thread = threading.get_ident()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="slow-request-watchdog", daemon=True)
+            self._thread.start()
+        try:
+            while True:
+                self._heartbeat = time.monotonic()
+                await asyncio.sleep(self.check_interval)
+        finally:
+            self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval):
+            now = time.monotonic()
+            frames = None
+            lag = now - self._heartbeat
+            if lag > self.loop_stall and not self._stalled:
+                self._stalled = True
+                self.loop_stalls += 1
+                frames = sys._current_frames()
+                loop_frame = frames.get(self._loop_thread)
+                self._write({
+                    "type": "loop_stall",
+                    "at": datetime.now().isoformat(),
+                    "stalled_ms": round(lag * 1000, 1),
+                    "loop_stack": format_stack(loop_frame) if loop_frame is not None else None,
+                    "in_flight": [f"{r.method} {r.route}" for r in list(self._inflight.values())]
+                })
+            elif lag <= self.loop_stall:
+                self._stalled = False
+            for request in list(self._inflight.values()):
+                elapsed = now - request.started
+                if request.reported or elapsed <= request.budget:
+                    continue
+                request.reported = True
+                self.slow_requests += 1
+                if frames is None:
+                    frames = sys._current_frames()
+                self._write(self._record(request, elapsed, self._stacks(request, frames)))
+
+    def _stacks(self, request: InFlight, frames: Dict[int, Any]) -> Dict[str, Any]:
+        """处理函数所在线程的栈；没有线程在执行它时取请求任务的协程栈"""
+        threads = []
+        for ident, frame in frames.items():
+            f = frame
+            while f is not None and f.f_code is not request.code:
+                f = f.f_back
+            if f is not None:
+                threads.append({"thread": ident, "loop": ident == self._loop_thread, "stack": format_stack(frame)})
+        stacks: Dict[str, Any] = {"threads": threads}
+        if not threads and request.task is not None:
+            stacks["task"] = await_chain(request.task)
+        return stacks
+
+    def _record(self, request: InFlight, elapsed: float, stacks: Optional[dict], status: Optional[int] = None) -> dict:
+        record = {
+            "type": "slow_request",
+            "request_id": request.id,
+            "at": datetime.now().isoformat(),
+            "method": request.method,
+            "path": request.path,
+            "route": request.route,
+            "budget_ms": round(request.budget * 1000, 1),
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "loop_stalled": self._stalled,
+            "stacks": stacks
+        }
+        if status is not None:
+            record["status"] = status
+        return record
+
+    def _write(self, record: dict):
+        self._recent.append(record)
+        if self._logger is not None:
+            self._logger.info(json.dumps(record, ensure_ascii=False))
+
+    def recent(self, limit: int = 50) -> List[dict]:
+        return list(itertools.islice(reversed(self._recent), max(0, limit)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "slow_requests": self.slow_requests,
+            "loop_stalls": self.loop_stalls,
+            "default_budget": self.default_budget,
+            "budgets": self.budgets
+        }
+
+
+class SlowRequestMiddleware:
+    """登记每个 HTTP 请求，结束时检查耗时"""
+
+    def __init__(self, app, watchdog: SlowRequestWatchdog, resolver: RouteResolver):
+        self.app = app
+        self.watchdog = watchdog
+        self.resolver = resolver
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = self.resolver.route(scope)
+        request = self.watchdog.begin(
+            scope["method"], scope["path"],
+            getattr(route, "path_format", None) or UNMATCHED,
+            getattr(getattr(route, "endpoint", None), "__code__", None)
+        )
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.watchdog.end(request, status)
@@ -0,0 +1,208 @@
+"""
+启动耗时 - 冷启动各阶段的时刻、每个模块的导入耗时和第一个请求的耗时
+
+Render 免费实例空闲后会休眠，下一个请求要等进程重新启动：解释器启动、导入模块、
+加载数据、预热，然后才开始监听端口处理请求。StartupTimer 以进程创建的时刻为起点
+（Linux 上读 /proc/self/stat，拿不到时用本模块被导入的时刻）记录各阶段完成的时间。
+
+本模块应当最先导入：导入时开始用 ImportTimer 包装 builtins.__import__，记录之后
+每个首次加载的模块的累计耗时和自身耗时（不含它导入的其他模块），口径与
+python -X importtime 相同；相对导入和 from 包 import 子模块 计入发起导入的模块。
+mark("imported") 时停止记录。
+"""
+
+import builtins
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def process_age() -> Optional[float]:
+    """进程已运行的秒数（从 fork/exec 算起）；拿不到时返回 None"""
+    try:
+        with open("/proc/self/stat", encoding="ascii") as f:
+            # 第 2 个字段（进程名）可能含空格，从右括号之后开始数
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", encoding="ascii") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def importing_module() -> Optional[str]:
+    """正在执行模块代码、导入了本模块的模块名（即应用模块）"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        name = frame.f_globals.get("__name__")
+        if frame.f_code.co_name == "<module>" and name not in (__name__, "__main__"):
+            return name
+        frame = frame.f_back
+    return None
+
+
+class ImportTimer:
+    """包装 builtins.__import__，记录首次加载的模块的导入耗时（只统计安装它的线程）"""
+
+    def __init__(self):
+        self.modules: Dict[str, Tuple[float, float]] = {}  # 模块 -> (累计秒数, 自身秒数)
+        self._nested: List[float] = []  # 每层正在导入的模块中，子模块导入的累计耗时
+        self._original = None
+        self._thread: Optional[int] = None
+        self._owner: Optional[str] = None
+
+    def install(self, owner: Optional[str] = None):
+        """开始记录；owner 是正在导入的应用模块，它导入失败（不在 sys.modules 中）时自动恢复"""
+        if self._original is None:
+            self._original = builtins.__import__
+            self._thread = threading.get_ident()
+            self._owner = owner
+            builtins.__import__ = self._import
+        return self
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original or builtins.__import__
+        if self._owner is not None and self._owner not in sys.modules:
+            # 应用模块导入失败，不会再调用 mark("imported")
+            self.uninstall()
+        if level or name in sys.modules or threading.get_ident() != self._thread:
+            return original(name, globals, locals, fromlist, level)
+        self._nested.append(0.0)
+        started = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            if name in sys.modules:
+                self.modules[name] = (elapsed, elapsed - nested)
+
+    def top(self, limit: int = 20, by: str = "self") -> List[Dict[str, Any]]:
+        """耗时最多的模块（by = self 或 cumulative）"""
+        index = 1 if by == "self" else 0
+        ranked = sorted(self.modules.items(), key=lambda item: item[1][index], reverse=True)[:limit]
+        return [{"module": name, "cumulative_ms": round(total * 1000, 2), "self_ms": round(own * 1000, 2)}
+                for name, (total, own) in ranked]
+
+
+class StartupTimer:
+    """冷启动各阶段的时刻（距进程创建的秒数）"""
+
+    def __init__(self):
+        now = time.monotonic()
+        age = process_age()
+        self.origin = now - (age or 0.0)
+        self.phases: Dict[str, float] = {"interpreter": round(now - self.origin, 4)}
+        self.warmup: Dict[str, float] = {}
+        self.first_request: Optional[Dict[str, Any]] = None
+        self.imports = ImportTimer().install(importing_module())
+
+    def mark(self, phase: str):
+        self.phases[phase] = round(time.monotonic() - self.origin, 4)
+        if phase == "imported":
+            self.imports.uninstall()
+
+    def run_step(self, name: str, step, *args):
+        """执行一个预热步骤并记录耗时"""
+        started = time.perf_counter()
+        try:
+            return step(*args)
+        finally:
+            self.warmup[name] = round(time.perf_counter() - started, 4)
+
+    @property
+    def served(self) -> bool:
+        return self.first_request is not None
+
+    def request_started(self, path: str):
+        self.first_request = {"path": path, "received_at": round(time.monotonic() - self.origin, 4)}
+
+    def request_finished(self, status: Optional[int]):
+        request = self.first_request
+        if request is not None and "completed_at" not in request:
+            request["completed_at"] = round(time.monotonic() - self.origin, 4)
+            request["duration_ms"] = round((request["completed_at"] - request["received_at"]) * 1000, 2)
+            request["status"] = status
+
+    def stats(self, top: int = 20) -> Dict[str, Any]:
+        return {
+            "phases": dict(self.phases),
+            "warmup": dict(self.warmup),
+            "first_request": dict(self.first_request) if self.first_request else None,
+            "modules_imported": len(self.imports.modules),
+            "imports": self.imports.top(top)
+        }
+
+
+class StartupMiddleware:
+    """记录进程处理的第一个 HTTP 请求；之后直接放行"""
+
+    def __init__(self, app, timer: StartupTimer):
+        self.app = app
+        self.timer = timer
+
+    async def __call__(self, scope, receive, send):
+        if self.timer.served or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timer = self.timer
+        timer.request_started(scope["path"])
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            timer.request_finished(status)
+
+
+class PageCache:
+    """HTML 页面缓存：预热时读入内存，之后文件修改（mtime 变化）时重新读取"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._pages: Dict[str, Tuple[int, str]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, names: Iterable[str]) -> int:
+        """预读页面，返回读到的页面数"""
+        return sum(1 for name in names if self.get(name) is not None)
+
+    def get(self, name: str) -> Optional[str]:
+        """页面内容；文件不存在时返回 None"""
+        path = self.directory / name
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            with self._lock:
+                self._pages.pop(name, None)
+            return None
+        cached = self._pages.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        content = path.read_text(encoding="utf-8")
+        with self._lock:
+            self._pages[name] = (mtime, content)
+        return content
+
+    def memory_usage(self) -> Dict[str, int]:
+        return {"pages": sum(sys.getsizeof(content) for _, content in self._pages.values())}
+
+
+# 模块级计时器：导入本模块时开始计时
+startup_timer = StartupTimer()
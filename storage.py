@@ -0,0 +1,114 @@
+"""
+存储后端
+
+内存中的数据结构是运行时的权威数据，后端只负责持久化（写穿）和启动时加载。
+每次 write_batch 对应一个存储事务：要么全部写入，要么全部不写入。
+
+  - memory: 不持久化（与原来的内存版行为一致）
+  - sqlite: 保存到 DATA_DIR/dentalreserve.db
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# (数据类型, 操作, 主键, 记录)；操作为 "put" 或 "delete"
+Operation = Tuple[str, str, str, Optional[dict]]
+
+
+class StorageError(Exception):
+    """存储后端写入失败"""
+
+
+class MemoryBackend:
+    """内存后端 - 不做持久化"""
+
+    name = "memory"
+
+    def load(self, kind: str) -> Iterator[dict]:
+        return iter(())
+
+    def write_batch(self, ops: List[Operation]):
+        pass
+
+    def ping(self) -> float:
+        """返回一次空操作的耗时（秒）"""
+        return 0.0
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """SQLite 后端 - 所有数据类型存放在同一张键值表中"""
+
+    name = "sqlite"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " kind TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " PRIMARY KEY (kind, key))"
+        )
+
+    def load(self, kind: str) -> Iterator[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM records WHERE kind = ? ORDER BY rowid", (kind,)
+            ).fetchall()
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def write_batch(self, ops: List[Operation]):
+        if not ops:
+            return
+        puts = [(kind, key, json.dumps(record, ensure_ascii=False)) for kind, op, key, record in ops if op == "put"]
+        deletes = [(kind, key) for kind, op, key, _ in ops if op == "delete"]
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN")
+                if puts:
+                    self._conn.executemany(
+                        "INSERT INTO records (kind, key, data) VALUES (?, ?, ?)"
+                        " ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data",
+                        puts
+                    )
+                if deletes:
+                    self._conn.executemany("DELETE FROM records WHERE kind = ? AND key = ?", deletes)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._conn.execute("ROLLBACK")
+                raise StorageError(str(e))
+
+    def ping(self) -> float:
+        start = time.perf_counter()
+        with self._lock:
+            self._conn.execute("SELECT 1").fetchone()
+        return time.perf_counter() - start
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_backend(name: str, data_dir: Path):
+    """根据名称创建存储后端"""
+    if name == "sqlite":
+        return SQLiteBackend(Path(data_dir) / "dentalreserve.db")
+    return MemoryBackend()
+
+
+def put_ops(kind: str, records: Iterable[dict], key: str = "id") -> List[Operation]:
+    """把一组记录转换为写入操作"""
+    return [(kind, "put", str(record[key]), record) for record in records]
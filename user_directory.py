@@ -0,0 +1,225 @@
+"""
+用户目录 - 按邮箱存储用户，并维护角色索引和名称/邮箱前缀索引
+
+按角色筛选和按名称/邮箱前缀搜索都只访问有序索引中的一个连续区间，
+不会遍历全部用户；分页使用不透明游标（上一页最后一条的排序键）。
+"""
+
+import base64
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from memory_usage import sampled_sizeof
+
+USERS_KIND = "users"
+
+# 所有角色共用的索引键
+ALL_ROLES = "*"
+
+# 前缀区间的上界哨兵
+_PREFIX_END = "\U0010ffff"
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析"""
+
+
+def _fold(value: str) -> str:
+    """大小写折叠，折叠结果与原字符串相同时复用原对象以节省内存"""
+    folded = value.casefold()
+    return value if folded == value else folded
+
+
+def encode_cursor(stream: str, key: Tuple[str, str]) -> str:
+    """编码分页游标"""
+    raw = json.dumps([stream, key[0], key[1]], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, Tuple[str, str]]:
+    """解码分页游标"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        stream, first, second = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception as e:
+        raise InvalidCursor(str(e))
+    if stream not in ("email", "name") or not isinstance(first, str) or not isinstance(second, str):
+        raise InvalidCursor(cursor)
+    return stream, (first, second)
+
+
+class UserDirectory:
+    """
+    用户目录
+
+    对外保持与原来 ``users_data`` 字典相同的读取方式（``in``、``[]``、``len``），
+    另外为每个角色（以及全部用户）维护两个有序索引：
+      - 邮箱索引: [(邮箱折叠值, 邮箱)]
+      - 名称索引: [(名称折叠值, 邮箱)]
+    """
+
+    def __init__(self, users: Optional[Dict[str, dict]] = None):
+        self._lock = threading.RLock()
+        self._users: Dict[str, dict] = {}
+        self._email_index: Dict[str, List[Tuple[str, str]]] = {ALL_ROLES: []}
+        self._name_index: Dict[str, List[Tuple[str, str]]] = {ALL_ROLES: []}
+        if users:
+            self.bulk_load(users.items())
+
+    # 兼容字典的读取接口
+    def __contains__(self, email: object) -> bool:
+        return email in self._users
+
+    def __getitem__(self, email: str) -> dict:
+        return self._users[email]
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._users)
+
+    def get(self, email: str, default=None):
+        return self._users.get(email, default)
+
+    def items(self):
+        return self._users.items()
+
+    def values(self):
+        return self._users.values()
+
+    def load(self, backend):
+        """用存储后端中的用户（按邮箱保存）覆盖/补充内置用户"""
+        self.bulk_load((record["email"], {k: v for k, v in record.items() if k != "email"})
+                       for record in backend.load(USERS_KIND))
+        return self
+
+    # 写入
+    def bulk_load(self, users: Iterable[Tuple[str, dict]]):
+        """批量加载用户，最后统一排序一次索引"""
+        with self._lock:
+            for email, user in users:
+                if email in self._users:
+                    self._unindex(email, self._users[email])
+                self._users[email] = user
+                email_key = (_fold(email), email)
+                name_key = (_fold(user.get("name") or ""), email)
+                for role in (ALL_ROLES, user.get("role") or ""):
+                    self._email_index.setdefault(role, []).append(email_key)
+                    self._name_index.setdefault(role, []).append(name_key)
+            for index in (self._email_index, self._name_index):
+                for keys in index.values():
+                    keys.sort()
+
+    def add(self, email: str, user: dict):
+        """添加或替换单个用户"""
+        with self._lock:
+            if email in self._users:
+                self._unindex(email, self._users[email])
+            self._users[email] = user
+            self._index(email, user)
+
+    def __setitem__(self, email: str, user: dict):
+        self.add(email, user)
+
+    def remove(self, email: str) -> Optional[dict]:
+        """删除用户"""
+        with self._lock:
+            user = self._users.pop(email, None)
+            if user is not None:
+                self._unindex(email, user)
+            return user
+
+    def _index(self, email: str, user: dict):
+        email_key = (_fold(email), email)
+        name_key = (_fold(user.get("name") or ""), email)
+        for role in (ALL_ROLES, user.get("role") or ""):
+            insort(self._email_index.setdefault(role, []), email_key)
+            insort(self._name_index.setdefault(role, []), name_key)
+
+    def _unindex(self, email: str, user: dict):
+        email_key = (_fold(email), email)
+        name_key = (_fold(user.get("name") or ""), email)
+        for role in (ALL_ROLES, user.get("role") or ""):
+            for keys, key in ((self._email_index.get(role), email_key), (self._name_index.get(role), name_key)):
+                if not keys:
+                    continue
+                pos = bisect_left(keys, key)
+                if pos < len(keys) and keys[pos] == key:
+                    del keys[pos]
+
+    # 查询
+    def count(self, role: Optional[str] = None) -> int:
+        """用户数量（可按角色）"""
+        return len(self._email_index.get(role or ALL_ROLES, ()))
+
+    def roles(self) -> Dict[str, int]:
+        """各角色的用户数量"""
+        with self._lock:
+            return {role: len(keys) for role, keys in self._email_index.items() if role != ALL_ROLES and keys}
+
+    def memory_usage(self) -> Dict[str, int]:
+        """各部分的大致内存占用（字节）"""
+        with self._lock:
+            return {
+                "records": sampled_sizeof(self._users),
+                "indexes": sum(sampled_sizeof(keys) for index in (self._email_index, self._name_index)
+                               for keys in index.values())
+            }
+
+    def page(
+        self,
+        role: Optional[str] = None,
+        prefix: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50
+    ) -> Tuple[List[Tuple[str, dict]], Optional[str]]:
+        """
+        获取一页用户
+
+        有前缀时先返回邮箱前缀匹配（按邮箱排序），再返回名称前缀匹配
+        （按名称排序，跳过邮箱已经匹配过的用户）。返回 (用户列表, 下一页游标)。
+        """
+        role_key = role or ALL_ROLES
+        folded = _fold(prefix) if prefix else ""
+        stream, after = decode_cursor(cursor) if cursor else ("email", None)
+
+        results: List[Tuple[str, dict]] = []
+        last: Optional[Tuple[str, str]] = None
+        with self._lock:
+            streams = ["email", "name"] if folded else ["email"]
+            for current in streams[streams.index(stream):] if stream in streams else []:
+                keys = (self._email_index if current == "email" else self._name_index).get(role_key, [])
+                start = bisect_left(keys, (folded, ""))
+                if current == stream and after is not None:
+                    start = max(start, bisect_right(keys, after))
+                end = bisect_left(keys, (folded + _PREFIX_END, "")) if folded else len(keys)
+
+                pos = start
+                while pos < end and len(results) < limit:
+                    key = keys[pos]
+                    pos += 1
+                    email = key[1]
+                    if current == "name" and _fold(email).startswith(folded):
+                        # 已在邮箱前缀区间中返回过
+                        continue
+                    results.append((email, self._users[email]))
+                    last = key
+                if len(results) >= limit:
+                    has_more = pos < end or current != streams[-1]
+                    next_cursor = encode_cursor(current, last) if has_more and last else None
+                    return results, next_cursor
+                stream, after = current, None
+        return results, None
+
+
+def public_user(email: str, user: dict) -> dict:
+    """返回给前端的用户信息（不含密码）"""
+    return {
+        "email": email,
+        "name": user.get("name"),
+        "role": user.get("role"),
+        "created_at": user.get("created_at")
+    }
@@ -0,0 +1,193 @@
+"""
+虚拟号码池 - 为每个预约分配一个不重复的虚拟电话号码
+
+空闲号码保存在先进先出的空闲列表中，分配和释放都是 O(1)；刚释放的号码排到
+队尾，尽量晚一些再分配给别人，减少打错电话的情况。每个租约在预约日期之后
+（加上宽限天数）过期，过期的租约按到期时间的最小堆回收。
+号码 -> 预约的反向索引用于把来电路由到预约。
+
+号码池是全局的，同时有效的租约数不能超过号码数（默认 +1 (416) 555-1000 ~ 9999，
+约 9000 个，即约 9000 个未到期的预约）。号码用完时 allocate 抛出 PoolExhausted，
+调用方照常创建预约、只是不带虚拟号码（virtual_phone 为 None），stats 中的
+exhausted 记录发生的次数；预约量大时用 VIRTUAL_NUMBER_RANGE 扩大号码段。
+
+租约和空闲列表顺序保存到 VIRTUAL_NUMBERS_FILE（原子替换写入，在后台定期保存）；
+启动时以预约数据为准校正租约。
+"""
+
+import heapq
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from appointment_store import ACTIVE_STATUSES
+from memory_usage import sampled_sizeof, shell_sizeof
+
+
+class PoolExhausted(Exception):
+    """没有可用的虚拟号码"""
+
+
+def number_range(prefix: str, spec: str) -> List[str]:
+    """按 "1000-9999" 这样的范围生成号码"""
+    start, _, end = spec.partition("-")
+    width = len(start)
+    return [f"{prefix}{i:0{width}d}" for i in range(int(start), int(end or start) + 1)]
+
+
+def lease_expiry(date: str, grace_days: int) -> float:
+    """预约日期当天结束后再加宽限天数"""
+    day = datetime.strptime(date, "%Y-%m-%d")
+    return (day + timedelta(days=1 + grace_days)).timestamp()
+
+
+class VirtualNumberPool:
+    """虚拟号码池"""
+
+    def __init__(self, numbers: Iterable[str], path: Optional[Path] = None, grace_days: int = 1):
+        self.numbers = list(dict.fromkeys(numbers))
+        self.path = Path(path) if path else None
+        self.grace_days = grace_days
+        self._lock = threading.RLock()
+        self._free: Deque[str] = deque(self.numbers)
+        self._leases: Dict[str, Tuple[str, float]] = {}  # 号码 -> (预约 ID, 过期时间)
+        self._by_appointment: Dict[str, str] = {}
+        self._expiry: List[Tuple[float, str, str]] = []
+        self._dirty = False
+        self.expired = 0
+        self.exhausted = 0  # 号码用完、没能分配的次数
+
+    def load(self, appointments: Iterable[dict]):
+        """读取保存的空闲列表顺序，再根据有效预约重建租约"""
+        with self._lock:
+            order = self.numbers
+            if self.path and self.path.exists():
+                try:
+                    saved = json.loads(self.path.read_text(encoding="utf-8"))
+                    known = set(self.numbers)
+                    free = [n for n in saved.get("free", []) if n in known]
+                    seen = set(free)
+                    order = free + [n for n in self.numbers if n not in seen]
+                except (OSError, ValueError) as e:
+                    print(f"⚠️ 虚拟号码文件读取失败，按预约数据重建: {e}")
+            leased = {}
+            now = time.time()
+            for appointment in appointments:
+                number = appointment.get("virtual_phone")
+                if appointment.get("status") not in ACTIVE_STATUSES or number in leased:
+                    continue
+                expires_at = lease_expiry(appointment["date"], self.grace_days)
+                if expires_at > now:
+                    leased[number] = (appointment["id"], expires_at)
+            pool = set(self.numbers)
+            self._leases = {n: lease for n, lease in leased.items() if n in pool}
+            self._by_appointment = {lease[0]: n for n, lease in self._leases.items()}
+            self._free = deque(n for n in order if n not in self._leases)
+            self._expiry = [(expires_at, n, appointment_id) for n, (appointment_id, expires_at) in self._leases.items()]
+            heapq.heapify(self._expiry)
+            self._dirty = True
+        return self
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def allocate(self, appointment_id: str, date: str) -> str:
+        """为预约分配号码（同一预约重复分配返回原号码）；号码用完时抛出 PoolExhausted"""
+        with self._lock:
+            number = self._by_appointment.get(appointment_id)
+            if number is not None:
+                return number
+            if not self._free:
+                self.reclaim_expired()
+            if not self._free:
+                self.exhausted += 1
+                raise PoolExhausted()
+            number = self._free.popleft()
+            self._lease(number, appointment_id, lease_expiry(date, self.grace_days))
+            return number
+
+    def renew(self, appointment_id: str, date: str):
+        """改约后按新日期延长或缩短租约"""
+        with self._lock:
+            number = self._by_appointment.get(appointment_id)
+            if number is not None:
+                self._lease(number, appointment_id, lease_expiry(date, self.grace_days))
+
+    def _lease(self, number: str, appointment_id: str, expires_at: float):
+        self._leases[number] = (appointment_id, expires_at)
+        self._by_appointment[appointment_id] = number
+        heapq.heappush(self._expiry, (expires_at, number, appointment_id))
+        self._dirty = True
+
+    def release(self, appointment_id: str) -> Optional[str]:
+        """释放预约的号码，放回空闲列表队尾"""
+        with self._lock:
+            number = self._by_appointment.pop(appointment_id, None)
+            if number is not None:
+                del self._leases[number]
+                self._free.append(number)
+                self._dirty = True
+            return number
+
+    def reclaim_expired(self, now: Optional[float] = None) -> int:
+        """回收已过期的租约（堆中过时的条目直接丢弃）"""
+        now = time.time() if now is None else now
+        reclaimed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, number, appointment_id = heapq.heappop(self._expiry)
+                if self._leases.get(number) == (appointment_id, expires_at):
+                    self.release(appointment_id)
+                    reclaimed += 1
+            self.expired += reclaimed
+        return reclaimed
+
+    def owner(self, number: str) -> Optional[str]:
+        """来电路由：号码当前对应的预约 ID"""
+        lease = self._leases.get(number)
+        if lease is None or lease[1] <= time.time():
+            return None
+        return lease[0]
+
+    def number_for(self, appointment_id: str) -> Optional[str]:
+        return self._by_appointment.get(appointment_id)
+
+    def save(self) -> bool:
+        """有变化时保存到文件（先写临时文件再原子替换）"""
+        if self.path is None or not self._dirty:
+            return False
+        with self._lock:
+            data = {
+                "free": list(self._free),
+                "leases": {n: {"appointment_id": a, "expires_at": e} for n, (a, e) in self._leases.items()},
+                "saved_at": datetime.now().isoformat()
+            }
+            self._dirty = False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+        return True
+
+    def memory_usage(self) -> Dict[str, int]:
+        """各部分的大致内存占用（字节）"""
+        with self._lock:
+            return {
+                "numbers": sampled_sizeof(self.numbers),
+                "leases": shell_sizeof(self._free) + shell_sizeof(self._leases) + shell_sizeof(self._by_appointment)
+                + shell_sizeof(self._expiry)
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "total": len(self.numbers),
+            "free": len(self._free),
+            "leased": len(self._leases),
+            "expired_reclaimed": self.expired,
+            "exhausted": self.exhausted
+        }